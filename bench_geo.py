@@ -0,0 +1,84 @@
+"""
+bench_geo.py
+
+Микробенчмарк выборки "рядом со мной" на синтетическом каталоге из нескольких
+городов: полный перебор точек против GeoIndex (все точки в радиусе и 10 ближайших).
+
+Запуск: python bench_geo.py [число_точек] [радиус_км]
+"""
+
+import random
+import sys
+import time
+
+from geo_index import GeoIndex, local_distance_km
+
+# Центры городов, вокруг которых разбрасываются точки
+CITY_CENTERS = [
+    (55.7558, 37.6173),   # Москва
+    (59.9343, 30.3351),   # Санкт-Петербург
+    (56.8389, 60.6057),   # Екатеринбург
+    (55.7963, 49.1088),   # Казань
+    (39.9042, 116.4074),  # Пекин
+    (31.2304, 121.4737),  # Шанхай
+]
+
+
+def random_points(count: int, rng: random.Random) -> list:
+    points = []
+    for i in range(count):
+        lat, lng = rng.choice(CITY_CENTERS)
+        points.append((i, lat + rng.gauss(0, 0.08), lng + rng.gauss(0, 0.12)))
+    return points
+
+
+def brute_force(points: list, lat: float, lng: float, radius_km: float) -> list:
+    found = [(local_distance_km(lat, lng, p_lat, p_lng), item) for item, p_lat, p_lng in points]
+    return sorted(f for f in found if f[0] <= radius_km)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    radius = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    rng = random.Random(1)
+    points = random_points(count, rng)
+    queries = [(lat + rng.gauss(0, 0.05), lng + rng.gauss(0, 0.05)) for lat, lng in
+               (rng.choice(CITY_CENTERS) for _ in range(200))]
+
+    start = time.perf_counter()
+    geo = GeoIndex(points)
+    build = time.perf_counter() - start
+
+    def ids(found):
+        return [item for _, item in found]
+
+    for lat, lng in queries[:20]:
+        expected = brute_force(points, lat, lng, radius)
+        assert ids(geo.within(lat, lng, radius)) == ids(expected)
+        assert ids(geo.nearest(lat, lng, 10, radius)) == ids(expected[:10])
+
+    start = time.perf_counter()
+    for lat, lng in queries[:20]:
+        brute_force(points, lat, lng, radius)
+    brute = (time.perf_counter() - start) / 20
+
+    start = time.perf_counter()
+    hits = 0
+    for lat, lng in queries:
+        hits += len(geo.within(lat, lng, radius))
+    grid = (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    for lat, lng in queries:
+        geo.nearest(lat, lng, 10, radius)
+    nearest = (time.perf_counter() - start) / len(queries)
+
+    print(f"points:      {count} (cells: {len(geo.cells)}, build {build * 1000:.1f} ms)")
+    print(f"radius:      {radius} km, avg hits {hits / len(queries):.1f}")
+    print(f"full scan:   {brute * 1e6:10.1f} us/query")
+    print(f"within:      {grid * 1e6:10.1f} us/query")
+    print(f"nearest(10): {nearest * 1e6:10.1f} us/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+bench_router.py
+
+Микробенчмарк маршрутизации текстовых кнопок: стоимость выбора обработчика
+на один апдейт для прежней цепочки lambda-фильтров и для таблицы TextRouter.
+
+Запуск: python bench_router.py [число_повторов]
+"""
+
+import sys
+import timeit
+
+from localization import translations, LANG_OPTIONS, CITY_MAP
+from keyboards import START_BUTTON, GO_BUTTON, RETURN_BUTTON
+from router import build_text_router
+
+
+def _handler(name):
+    return name
+
+
+# Фильтры в том виде и порядке, в каком они были зарегистрированы в main.py
+LEGACY_FILTERS = [
+    (lambda text: text == "Start / Старт", "choose_language"),
+    (lambda text: text and text.lower() in LANG_OPTIONS, "language_selection"),
+    (lambda text: text and text.lower() in CITY_MAP.keys(), "city_selection"),
+    (lambda text: text == "Go!", "spin_wheel"),
+    (lambda text: text == "Return / Вернуться", "return_handler"),
+    (lambda text: text in [translations["ru"]["change_language"], translations["en"]["change_language"],
+                           translations["cn"]["change_language"]], "change_language"),
+    (lambda text: text in [translations["ru"]["change_city"], translations["en"]["change_city"],
+                           translations["cn"]["change_city"]], "change_city"),
+]
+
+
+def legacy_route(text):
+    for check, name in LEGACY_FILTERS:
+        if check(text):
+            return name
+    return None
+
+
+ROUTER = build_text_router(
+    on_start=_handler("choose_language"),
+    on_language=_handler("language_selection"),
+    on_city=_handler("city_selection"),
+    on_go=_handler("spin_wheel"),
+    on_return=_handler("return_handler"),
+    on_change_language=_handler("change_language"),
+    on_change_city=_handler("change_city"),
+)
+
+# Типичная смесь апдейтов: в основном "Go!", плюс навигация и посторонний текст
+SAMPLE_TEXTS = (
+    [GO_BUTTON] * 12
+    + [START_BUTTON, "EN", "Moscow", "Санкт-Петербург", RETURN_BUTTON,
+       translations["cn"]["change_city"], translations["en"]["change_language"], "привет"]
+)
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for text in SAMPLE_TEXTS:
+        route = ROUTER.resolve(text)
+        assert (route[0] if route else None) == legacy_route(text), text
+
+    total = repeat * len(SAMPLE_TEXTS)
+    legacy = min(timeit.repeat(lambda: [legacy_route(t) for t in SAMPLE_TEXTS], number=repeat, repeat=3))
+    table = min(timeit.repeat(lambda: [ROUTER.resolve(t) for t in SAMPLE_TEXTS], number=repeat, repeat=3))
+    print(f"updates: {total}")
+    print(f"lambda filters: {legacy / total * 1e9:8.1f} ns/update")
+    print(f"TextRouter:     {table / total * 1e9:8.1f} ns/update")
+    print(f"speedup:        {legacy / table:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+bench_user_state.py
+
+Сравнение памяти на состояние пользователей: прежние словари
+USER_LANGS {user_id: {"language", "city"}} + MESSAGE_COUNTERS {user_id: {msg_key: n}}
+против {user_id: UserState}.
+
+Запуск: python bench_user_state.py [число_пользователей]
+"""
+
+import random
+import sys
+import tracemalloc
+
+from localization import LANG_OPTIONS
+from user_state import UserState, CITY_CODES, MESSAGE_KEYS
+
+
+def random_profile(rng: random.Random):
+    return rng.choice(LANG_OPTIONS), rng.choice(CITY_CODES), [rng.randint(0, 50) for _ in MESSAGE_KEYS]
+
+
+def build_legacy(profiles: list):
+    user_langs, message_counters = {}, {}
+    for user_id, (lang, city, counts) in enumerate(profiles, start=100_000_000):
+        user_langs[user_id] = {"language": lang, "city": city}
+        message_counters[user_id] = {key: n for key, n in zip(MESSAGE_KEYS, counts) if n}
+    return user_langs, message_counters
+
+
+def build_compact(profiles: list):
+    users = {}
+    for user_id, (lang, city, counts) in enumerate(profiles, start=100_000_000):
+        state = UserState()
+        state.language = lang
+        state.city = city
+        for key, n in zip(MESSAGE_KEYS, counts):
+            for _ in range(n % 5):
+                state.bump(key)
+        state.last_seen = float(user_id)
+        users[user_id] = state
+    return users
+
+
+def measure(build, profiles: list) -> int:
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    result = build(profiles)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = random.Random(1)
+    profiles = [random_profile(rng) for _ in range(users)]
+    legacy = measure(build_legacy, profiles)
+    compact = measure(build_compact, profiles)
+    print(f"users:      {users}")
+    print(f"dicts:      {legacy / 2**20:8.1f} MiB ({legacy / users:6.1f} B/user)")
+    print(f"UserState:  {compact / 2**20:8.1f} MiB ({compact / users:6.1f} B/user)")
+    print(f"ratio:      {legacy / compact:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+card_deck.py
+
+Колода без повторов для пользователя и корзины (язык, город, факт/квиз).
+
+- Карточки корзины пронумерованы стабильно (реестр data/card_handles.json,
+  см. card_store.assign_handles): номер не меняется при перезагрузке каталога.
+- Колода — перестановка номеров по случайному ключу круга: сеть Фейстеля
+  на ближайшей сверху степени двойки, номера за пределами корзины
+  пропускаются повторным шифрованием (cycle-walking). Состояние — четыре целых
+  на корзину в UserState, вытягивание — O(1) в среднем, повторов нет, пока
+  круг не пройден, а по вытянутым карточкам не угадать следующие. Порядки
+  круга равновероятны лишь приближённо (у корзины из 5 карточек — в пределах
+  ~20%). Колода сохраняется вместе с настройками.
+- После перезагрузки каталога колода продолжает тот же круг: номера те же,
+  удалённые карточки (дыры в номерах) пропускаются, новые попадают в следующий круг.
+- pick_kind и choose_card — выбор карточки при вращении колеса (main.spin_wheel,
+  check_selection.py): факт или квиз, затем таблица весов или колода.
+  choose_near — то же для "рядом со мной" (main.spin_near) по весам карточек.
+- Колода прежнего формата (аффинная перестановка (a * i + b) mod size)
+  дотягивается до конца своего круга, следующий круг — уже по ключу.
+"""
+
+import random
+
+from card_store import bucket_name
+from selection import build_alias
+
+# Поля колоды в списке [ключ, формат, шаг, размер]
+_KEY, _FORMAT, _STEP, _SIZE = range(4)
+# Формат колоды по ключу; у колод прежнего формата здесь b >= 0
+_KEYED = -1
+
+# Раундов сети: на маленьких корзинах (домен из 4–16 номеров) меньшее число
+# раундов заметно неравномерно распределяет порядки
+_FEISTEL_ROUNDS = 8
+_M64 = (1 << 64) - 1
+
+
+def _mix(x: int) -> int:
+    # splitmix64: каждый бит входа влияет на все биты выхода
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _M64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _M64
+    return x ^ (x >> 31)
+
+
+def _feistel(key: int, half_bits: int, x: int) -> int:
+    """
+    Перестановка range(4 ** half_bits), заданная ключом.
+    """
+    mask = (1 << half_bits) - 1
+    left, right = x >> half_bits, x & mask
+    for r in range(_FEISTEL_ROUNDS):
+        left, right = right, left ^ (_mix(key ^ (r << 58) ^ right) & mask)
+    return (left << half_bits) | right
+
+
+def permute(key: int, size: int, i: int) -> int:
+    """
+    i-й номер круга: перестановка range(size) по ключу. Значения за пределами
+    size шифруются повторно, пока не попадут в range(size): домен меньше 4 * size,
+    так что в среднем это меньше четырёх шагов.
+    """
+    if size <= 1:
+        return 0
+    half_bits = ((size - 1).bit_length() + 1) // 2
+    x = _feistel(key, half_bits, i)
+    while x >= size:
+        x = _feistel(key, half_bits, x)
+    return x
+
+
+def new_deck(size: int, rng=random) -> list:
+    """
+    Новый круг по size номерам со случайным ключом.
+    """
+    return [rng.getrandbits(62), _KEYED, 0, size]
+
+
+def draw(deck, space, rng=random):
+    """
+    (карточка, колода): следующая карточка колоды deck из space (space[номер] —
+    карточка или None). deck меняется на месте; новая колода — если deck is None
+    или круг пройден. (None, deck), если в space нет ни одной карточки.
+    """
+    fresh = False
+    while True:
+        if deck is None or deck[_STEP] >= deck[_SIZE]:
+            if fresh or not len(space):
+                return (None, deck)
+            deck = new_deck(len(space), rng)
+            fresh = True
+        if deck[_FORMAT] == _KEYED:
+            i = permute(deck[_KEY], deck[_SIZE], deck[_STEP])
+        else:
+            i = (deck[_KEY] * deck[_STEP] + deck[_FORMAT]) % deck[_SIZE]
+        deck[_STEP] += 1
+        card = space[i] if i < len(space) else None
+        if card is not None:
+            return (card, deck)
+
+
+def draw_card(state, index, lang: str, city: str, interactive: bool, cards=(), rng=random):
+    """
+    Карточка корзины по колоде пользователя state (UserState). Если у карточек
+    корзины нет номеров (нет id), — случайная из cards.
+    """
+    name = bucket_name((lang, city, interactive))
+    card, deck = draw(state.deck(name), index.handle_space(lang, city, interactive), rng)
+    if card is None:
+        return rng.choice(cards) if cards else None
+    state.set_deck(name, deck)
+    return card
+
+
+def pick_kind(roll: float, facts, quizzes, quiz_share: float) -> bool:
+    """
+    Квиз (True) или факт: квиз при roll < quiz_share, если квизы есть; без фактов — квиз.
+    """
+    if roll < quiz_share and quizzes:
+        return True
+    return not facts
+
+
+def choose_card(state, index, lang: str, city: str, interactive: bool, cards, rng=random):
+    """
+    Карточка корзины при вращении колеса: по таблице весов selection_config.json,
+    если веса различают карточки корзины, иначе по колоде без повторов.
+    """
+    selector = index.selector(lang, city, interactive)
+    if selector is not None:
+        return cards[selector.sample(rng)]
+    return draw_card(state, index, lang, city, interactive, cards, rng)
+
+
+def choose_near(index, cards, rng=random):
+    """
+    Карточка из ближайших к геопозиции: по весам selection_config.json (reality,
+    tags, boost), при равных весах — равновероятно. Свежесть — порядок корзины,
+    у списка ближайших его нет; колода не ведётся: список свой у каждой точки.
+    """
+    table = build_alias([index.selection.weight(card) for card in cards])
+    if table is not None:
+        return cards[table.sample(rng)]
+    return cards[rng.randrange(len(cards))]
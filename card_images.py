@@ -0,0 +1,463 @@
+"""
+card_images.py
+
+Картинки фактов: карточка, нарисованная на фоне шрифтами Montserrat (assets/).
+
+- Рисуются заранее (render_cards.py) в пуле процессов и складываются в кеш
+  по содержимому: data/card_images/<ab>/<sha256>.jpg, где sha256 — от версии
+  рисования, файлов фона и шрифтов и нарисованных полей карточки. Неизменившаяся
+  карточка не перерисовывается, изменившаяся получает новый файл.
+- Бот загружает картинку в Telegram один раз и запоминает file_id в SQLite (WAL)
+  по тому же хешу; дальше карточка отправляется по file_id. Несколько воркеров
+  пишут в один файл и подхватывают чужие file_id в refresh_loop.
+- Pillow нужен только для рисования: боту достаточно готовых файлов.
+- Montserrat не содержит иероглифов: китайские карточки рисуются, только если
+  задан шрифт CARD_IMAGE_CJK_FONT. Эмодзи (icon) на картинке не рисуются.
+"""
+
+import logging
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+ASSETS_DIR = Path(__file__).parent / "assets"
+CARD_IMAGES_DIR = Path(__file__).parent / "data" / "card_images"
+CARD_FILE_IDS_DB_PATH = Path(__file__).parent / "data" / "card_file_ids.db"
+
+# Меняется при любом изменении рисования: все картинки получают новые хеши
+RENDER_VERSION = 1
+
+IMAGE_SIZE = (1080, 1350)
+IMAGE_QUALITY = 88
+PADDING = 90
+# Фон по reality карточки (остальные — DEFAULT_BACKGROUND)
+BACKGROUNDS = {"legend": "hero-bg-test.jpg"}
+DEFAULT_BACKGROUND = "background.jpg"
+# Затемнение фона под белым текстом (0..255)
+SHADE = 120
+FONT_TITLE = "static/Montserrat-Bold.ttf"
+FONT_TEXT = "static/Montserrat-Regular.ttf"
+FONT_ADDRESS = "static/Montserrat-Medium.ttf"
+# Размеры шрифтов: начальный и наименьший (текст уменьшается, пока не поместится)
+TITLE_SIZES = (76, 48)
+TEXT_SIZES = (44, 26)
+ADDRESS_SIZE = 34
+LINE_SPACING = 1.3
+
+# Шрифт с иероглифами для китайских карточек (путь к .ttf/.otf/.ttc)
+CJK_FONT = os.getenv("CARD_IMAGE_CJK_FONT", "")
+
+# Иероглифы и знаки CJK (в том числе полноширинные)
+_CJK_RE = re.compile("[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def _drawable(text) -> str:
+    # Без эмодзи и прочих символов-картинок: в Montserrat их нет
+    if not isinstance(text, str):
+        return ""
+    text = "".join(ch for ch in text if ord(ch) <= 0xFFFF and unicodedata.category(ch) not in ("So", "Cf")
+                   and not "\ufe00" <= ch <= "\ufe0f")
+    return " ".join(text.split())
+
+
+def _address(card: dict) -> str:
+    loc = card.get("location", {})
+    if isinstance(loc, dict):
+        return _drawable(loc.get("address", ""))
+    return _drawable(loc)
+
+
+def image_fields(card: dict) -> dict:
+    """
+    То, что рисуется на картинке карточки, или None, если картинки у неё нет
+    (квиз, пустой факт, иероглифы без CARD_IMAGE_CJK_FONT).
+    """
+    if card.get("interactive") or not isinstance(card.get("id"), str):
+        return None
+    fields = {
+        "title": _drawable(card.get("title", "")),
+        "text": _drawable(card.get("text", "")),
+        "address": _address(card),
+        "background": BACKGROUNDS.get(str(card.get("reality", "")).lower(), DEFAULT_BACKGROUND),
+        "cjk": False,
+    }
+    if not fields["title"] and not fields["text"]:
+        return None
+    if _CJK_RE.search(fields["title"] + fields["text"] + fields["address"]):
+        if not CJK_FONT:
+            return None
+        fields["cjk"] = True
+    return fields
+
+
+@lru_cache(maxsize=1)
+def assets_digest() -> str:
+    """
+    Хеш файлов фонов и шрифтов: замена любого из них меняет хеши всех картинок.
+    """
+    h = hashlib.sha256()
+    names = sorted({FONT_TITLE, FONT_TEXT, FONT_ADDRESS, DEFAULT_BACKGROUND, *BACKGROUNDS.values()})
+    paths = [ASSETS_DIR / name for name in names] + ([Path(CJK_FONT)] if CJK_FONT else [])
+    for path in paths:
+        try:
+            h.update(path.read_bytes())
+        except OSError:
+            h.update(b"-")
+    return h.hexdigest()
+
+
+def image_digest(fields: dict) -> str:
+    payload = json.dumps([RENDER_VERSION, assets_digest(), IMAGE_SIZE, fields], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def card_digest(index, card: dict) -> str:
+    """
+    Хеш картинки карточки (None — картинки нет) из render_cache индекса.
+    """
+    card_id = card.get("id")
+    if not isinstance(card_id, str) or not card_id:
+        # Без id картинки нет (image_fields), а id() временного словаря снимка
+        # мог бы достаться другой карточке — в кеш такие не попадают
+        return None
+    key = ("image", card_id)
+    digest = index.render_cache.get(key)
+    if digest is None:
+        fields = image_fields(card)
+        digest = index.render_cache[key] = image_digest(fields) if fields else ""
+    return digest or None
+
+
+def image_path(images_dir: Path, digest: str) -> Path:
+    return Path(images_dir) / digest[:2] / f"{digest}.jpg"
+
+
+# ---------------------------
+# Рисование (Pillow)
+# ---------------------------
+
+def _import_pillow():
+    try:
+        from PIL import Image, ImageDraw, ImageFont
+    except ImportError:
+        raise RuntimeError("Для картинок карточек установите пакет Pillow (pip install Pillow)")
+    return (Image, ImageDraw, ImageFont)
+
+
+def _wrap(draw, text: str, font, width: int) -> list:
+    """
+    Строки text не шире width пикселей. Иероглифы переносятся по знакам,
+    слишком длинное слово — по буквам.
+    """
+    words = list(text) if _CJK_RE.search(text) else text.split()
+    sep = "" if _CJK_RE.search(text) else " "
+    lines = []
+    line = ""
+    for word in words:
+        candidate = f"{line}{sep}{word}" if line else word
+        if draw.textlength(candidate, font=font) <= width:
+            line = candidate
+            continue
+        if line:
+            lines.append(line)
+        line = ""
+        for ch in word:
+            if line and draw.textlength(line + ch, font=font) > width:
+                lines.append(line)
+                line = ""
+            line += ch
+    if line:
+        lines.append(line)
+    return lines
+
+
+class CardRenderer:
+    """
+    Рисует картинки карточек. Шрифты и фоны загружаются один раз (в каждом процессе пула).
+    """
+
+    def __init__(self):
+        self.Image, self.ImageDraw, self.ImageFont = _import_pillow()
+        self.backgrounds = {}
+        self.fonts = {}
+
+    def _font(self, name: str, size: int, cjk: bool):
+        key = (name, size, cjk)
+        font = self.fonts.get(key)
+        if font is None:
+            path = CJK_FONT if cjk else str(ASSETS_DIR / name)
+            font = self.fonts[key] = self.ImageFont.truetype(path, size)
+        return font
+
+    def _background(self, name: str):
+        image = self.backgrounds.get(name)
+        if image is None:
+            with self.Image.open(ASSETS_DIR / name) as source:
+                source = source.convert("RGB")
+                # Заполнить кадр целиком и обрезать лишнее по центру
+                scale = max(IMAGE_SIZE[0] / source.width, IMAGE_SIZE[1] / source.height)
+                size = (round(source.width * scale), round(source.height * scale))
+                source = source.resize(size, self.Image.LANCZOS)
+                left, top = (size[0] - IMAGE_SIZE[0]) // 2, (size[1] - IMAGE_SIZE[1]) // 2
+                image = source.crop((left, top, left + IMAGE_SIZE[0], top + IMAGE_SIZE[1]))
+            shade = self.Image.new("RGB", IMAGE_SIZE, (0, 0, 0))
+            image = self.backgrounds[name] = self.Image.blend(image, shade, SHADE / 255)
+        return image
+
+    def _layout(self, draw, fields: dict, width: int, height: int):
+        """
+        (шрифт и строки заголовка, шрифт и строки текста): наибольшие размеры,
+        при которых всё помещается в height; иначе текст обрезается.
+        """
+        cjk = fields["cjk"]
+        title_size, text_size = TITLE_SIZES[0], TEXT_SIZES[0]
+        while True:
+            title_font = self._font(FONT_TITLE, title_size, cjk)
+            text_font = self._font(FONT_TEXT, text_size, cjk)
+            title = _wrap(draw, fields["title"], title_font, width)
+            text = _wrap(draw, fields["text"], text_font, width)
+            used = (len(title) * title_size + len(text) * text_size) * LINE_SPACING + text_size
+            if used <= height:
+                return (title_font, title, text_font, text)
+            if text_size > TEXT_SIZES[1]:
+                text_size -= 2
+            elif title_size > TITLE_SIZES[1]:
+                title_size -= 4
+            else:
+                keep = max(0, int((height - text_size - len(title) * title_size * LINE_SPACING)
+                                  // (text_size * LINE_SPACING)))
+                text = text[:keep]
+                if text:
+                    text[-1] = text[-1].rstrip(" .,;:") + "…"
+                return (title_font, title, text_font, text)
+
+    def render(self, fields: dict):
+        """
+        Картинка (PIL.Image) по image_fields карточки.
+        """
+        image = self._background(fields["background"]).copy()
+        draw = self.ImageDraw.Draw(image)
+        width = IMAGE_SIZE[0] - 2 * PADDING
+        bottom = IMAGE_SIZE[1] - PADDING
+        if fields["address"]:
+            address_font = self._font(FONT_ADDRESS, ADDRESS_SIZE, fields["cjk"])
+            address = _wrap(draw, fields["address"], address_font, width)[:2]
+            bottom -= round(len(address) * ADDRESS_SIZE * LINE_SPACING)
+            y = bottom + ADDRESS_SIZE
+            for line in address:
+                draw.text((PADDING, y), line, font=address_font, fill=(235, 235, 235))
+                y += round(ADDRESS_SIZE * LINE_SPACING)
+
+        title_font, title, text_font, text = self._layout(draw, fields, width, bottom - PADDING)
+        y = PADDING
+        for line in title:
+            draw.text((PADDING, y), line, font=title_font, fill=(255, 255, 255))
+            y += round(title_font.size * LINE_SPACING)
+        if title and text:
+            # Черта между заголовком и текстом
+            y += text_font.size // 4
+            draw.rectangle((PADDING, y, PADDING + 120, y + 6), fill=(255, 255, 255))
+            y += text_font.size
+        for line in text:
+            draw.text((PADDING, y), line, font=text_font, fill=(245, 245, 245))
+            y += round(text_font.size * LINE_SPACING)
+        return image
+
+    def save(self, fields: dict, path: Path):
+        """
+        Рисует и атомарно записывает картинку в path.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        self.render(fields).save(tmp, "JPEG", quality=IMAGE_QUALITY, optimize=True, progressive=True)
+        os.replace(tmp, path)
+
+
+# ---------------------------
+# Сборка в пуле процессов
+# ---------------------------
+
+# Картинок в одной пачке для процесса пула
+BATCH_SIZE = 50
+
+_RENDERER = None
+
+
+def _init_worker():
+    global _RENDERER
+    _RENDERER = CardRenderer()
+
+
+def _render_batch(images_dir: str, batch: list) -> int:
+    for digest, fields in batch:
+        _RENDERER.save(fields, image_path(images_dir, digest))
+    return len(batch)
+
+
+class BuildStats:
+    def __init__(self):
+        self.cards = 0      # фактов в каталоге
+        self.skipped = 0    # без картинки (см. image_fields)
+        self.cached = 0     # картинка уже есть в кеше
+        self.rendered = 0
+        self.pruned = 0
+        self.seconds = 0.0
+
+    def summary(self) -> str:
+        return (f"Фактов: {self.cards}, нарисовано: {self.rendered}, уже в кеше: {self.cached}, "
+                f"без картинки: {self.skipped}, удалено устаревших: {self.pruned} ({self.seconds:.1f} с)")
+
+
+def build_images(cards: list, images_dir: Path = CARD_IMAGES_DIR, workers: int = None, force: bool = False,
+                 prune: bool = False) -> BuildStats:
+    """
+    Рисует недостающие картинки фактов cards в images_dir. Одинаковые картинки
+    (переводы с одним текстом, дубликаты) рисуются один раз.
+    prune — удалить картинки, которых нет в каталоге.
+    """
+    start = time.perf_counter()
+    images_dir = Path(images_dir)
+    stats = BuildStats()
+    wanted = {}  # хеш -> поля
+    for card in cards:
+        if not isinstance(card, dict) or card.get("interactive"):
+            continue
+        stats.cards += 1
+        fields = image_fields(card)
+        if fields is None:
+            stats.skipped += 1
+            continue
+        wanted.setdefault(image_digest(fields), fields)
+    todo = [(digest, fields) for digest, fields in wanted.items()
+            if force or not image_path(images_dir, digest).exists()]
+    stats.cached = len(wanted) - len(todo)
+
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        batches = [todo[i:i + BATCH_SIZE] for i in range(0, len(todo), BATCH_SIZE)]
+        if workers == 1 or len(batches) <= 1:
+            _init_worker()
+            stats.rendered = sum(_render_batch(str(images_dir), batch) for batch in batches)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                stats.rendered = sum(pool.map(_render_batch, [str(images_dir)] * len(batches), batches))
+
+    if prune and images_dir.exists():
+        for path in images_dir.glob("*/*.jpg"):
+            if path.stem not in wanted:
+                path.unlink()
+                stats.pruned += 1
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+# ---------------------------
+# file_id загруженных картинок
+# ---------------------------
+
+class CardImages:
+    """
+    Картинки фактов для отправки: file_id уже загруженных (в памяти и в таблице
+    card_file_ids(digest, card_id, file_id)) или путь к файлу для первой загрузки.
+    """
+
+    def __init__(self, images_dir: Path = CARD_IMAGES_DIR, db_path: Path = CARD_FILE_IDS_DB_PATH):
+        self.images_dir = Path(images_dir)
+        self.path = Path(db_path)
+        self.conn = None
+        self.file_ids = {}  # хеш картинки -> file_id
+        self.last_rowid = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="card-images")
+
+    def photo(self, index, card: dict):
+        """
+        (хеш, file_id или Path файла) для отправки карточки картинкой или None,
+        если картинки нет (не нарисована или не положена).
+        """
+        digest = card_digest(index, card)
+        if digest is None:
+            return None
+        file_id = self.file_ids.get(digest)
+        if file_id is not None:
+            return (digest, file_id)
+        path = image_path(self.images_dir, digest)
+        return (digest, path) if path.exists() else None
+
+    def remember(self, digest: str, card_id: str, file_id: str):
+        self.file_ids[digest] = file_id
+        asyncio.ensure_future(self._run(self._save, digest, card_id, file_id))
+
+    def forget(self, digest: str):
+        """
+        file_id больше не принимается Telegram: картинка загрузится заново.
+        """
+        if self.file_ids.pop(digest, None) is not None:
+            asyncio.ensure_future(self._run(self._delete, digest))
+
+    def _connect(self):
+        if self.conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS card_file_ids (digest TEXT PRIMARY KEY, card_id TEXT NOT NULL, "
+                "file_id TEXT NOT NULL)"
+            )
+            self.conn.commit()
+        return self.conn
+
+    def _save(self, digest: str, card_id: str, file_id: str):
+        conn = self._connect()
+        with conn:
+            # REPLACE даёт строке новый rowid: другие воркеры увидят её в _load_new
+            conn.execute("INSERT OR REPLACE INTO card_file_ids (digest, card_id, file_id) VALUES (?, ?, ?)",
+                         (digest, card_id, file_id))
+
+    def _delete(self, digest: str):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM card_file_ids WHERE digest = ?", (digest,))
+
+    def _load_new(self) -> list:
+        rows = self._connect().execute(
+            "SELECT rowid, digest, file_id FROM card_file_ids WHERE rowid > ? ORDER BY rowid", (self.last_rowid,)
+        ).fetchall()
+        if rows:
+            self.last_rowid = rows[-1][0]
+        return rows
+
+    async def _run(self, func, *args):
+        try:
+            return await asyncio.get_event_loop().run_in_executor(self.executor, func, *args)
+        except Exception as e:
+            logging.error(f"Ошибка таблицы file_id картинок ({func.__name__}): {e}")
+
+    async def refresh(self):
+        """
+        Подхватывает file_id, записанные с прошлого раза (при старте — все).
+        """
+        for _, digest, file_id in await self._run(self._load_new) or ():
+            self.file_ids[digest] = file_id
+
+    async def refresh_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh()
+
+    def _close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    async def close(self):
+        await asyncio.get_event_loop().run_in_executor(self.executor, self._close)
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,387 @@
+"""
+card_import.py
+
+Импорт карточек из CSV (разделитель ';') в data/cards.json — движок
+upload_cards.py (import_cards.py — его прежнее имя).
+
+- CSV читается построчно; каждая строка превращается в карточку и проверяется
+  по card_schema.json (CardValidator компилируется один раз на прогон).
+- Принятые карточки складываются во временную SQLite-таблицу по id (повтор id
+  в CSV заменяет карточку), так что память не зависит от размера выгрузки.
+- cards.json читается и пишется потоково: существующие карточки заменяются
+  по id на месте, новые дописываются в конец в порядке CSV. Запись атомарная
+  (временный файл + os.replace) — запущенный бот не увидит недописанный файл.
+  Следом собирается снимок cards.bin и, если задан regions_config.json,
+  файлы шардов по городам и языкам (см. card_shards.py).
+- Итоги прогона — в ImportStats.
+"""
+
+import csv
+import json
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from card_shards import load_regions, write_shards
+from card_store import CARDS_PATH, SNAPSHOT_PATH, iter_cards, save_cards, write_snapshot
+
+SCHEMA_PATH = Path(__file__).parent / "card_schema.json"
+
+# Столбцы CSV; tags и boost (вес карточки при выборе) могут отсутствовать
+CSV_COLUMNS = (
+    "id", "interactive", "language", "city", "address", "gps_lat", "gps_lng", "title", "text",
+    "question", "options", "correct_index", "reality", "explanation", "routes", "persons", "tags",
+    "boost",
+)
+MIN_COLUMNS = len(CSV_COLUMNS) - 2
+
+LEGEND_ICON = "🧙🏻‍♂️"
+FACT_ICON = "📖"
+
+# Сколько ошибок хранить для отчёта (считаются все)
+MAX_REPORTED_ERRORS = 50
+
+
+def _split_list(value: str) -> list:
+    # Внутри одной ячейки CSV элементы списка тоже разделены ';'
+    return [item.strip() for item in value.split(";") if item.strip()]
+
+
+def _to_float(value: str):
+    try:
+        return float(value.strip()) if value.strip() else None
+    except ValueError:
+        return None
+
+
+def _to_int(value: str):
+    try:
+        return int(value.strip()) if value.strip() else None
+    except ValueError:
+        return None
+
+
+def row_to_card(row: list) -> dict:
+    """
+    Карточка из строки CSV. Поля квиза заполняются только для interactive-карточек.
+    """
+    if len(row) < MIN_COLUMNS:
+        raise ValueError(f"недостаточно столбцов ({len(row)} из {MIN_COLUMNS})")
+    fields = dict(zip(CSV_COLUMNS, row))
+    fields.setdefault("tags", "")
+    fields.setdefault("boost", "")
+    interactive = fields["interactive"].strip().lower() == "true"
+    reality = fields["reality"].strip().lower()
+    card = {
+        "id": fields["id"].strip(),
+        "interactive": interactive,
+        "language": fields["language"].strip().lower(),
+        "city": fields["city"].strip().lower(),
+        "icon": LEGEND_ICON if reality == "legend" else FACT_ICON,
+        "title": fields["title"].strip().strip('"'),
+        "text": fields["text"].strip().strip('"'),
+        "reality": reality,
+        "routes": _split_list(fields["routes"]),
+        "persons": _split_list(fields["persons"]),
+        "tags": _split_list(fields["tags"]),
+        "location": {},
+    }
+    boost = _to_float(fields["boost"])
+    if boost is not None:
+        card["boost"] = boost
+    if interactive:
+        card["question"] = fields["question"].strip()
+        card["options"] = _split_list(fields["options"])
+        correct_index = _to_int(fields["correct_index"])
+        if correct_index is not None:
+            card["correct_index"] = correct_index
+        card["explanation"] = fields["explanation"].strip()
+
+    location = {}
+    address = fields["address"].strip().strip('"')
+    if address:
+        location["address"] = address
+    lat, lng = _to_float(fields["gps_lat"]), _to_float(fields["gps_lng"])
+    if lat is not None and lng is not None:
+        location["gps"] = {"lat": lat, "lng": lng}
+    card["location"] = location
+    return card
+
+
+def _is_number(value) -> bool:
+    return type(value) in (int, float)
+
+
+# Проверки "type" так, как их понимает Draft 7 (bool — не число)
+_TYPE_CHECKS = {
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: type(v) is int,
+    "number": _is_number,
+    "boolean": lambda v: type(v) is bool,
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "null": lambda v: v is None,
+}
+
+
+def _compile_check(schema: dict):
+    """
+    Быстрая проверка для подмножества JSON Schema, которым пользуется card_schema.json.
+    Возвращает функцию value -> bool или None, если в схеме есть другие ключевые слова.
+    True гарантирует корректность; False лишь означает "спросить полный валидатор".
+    """
+    checks = []
+    for keyword, arg in schema.items():
+        if keyword in ("$schema", "title", "description"):
+            continue
+        if keyword == "type":
+            if arg not in _TYPE_CHECKS:
+                return None
+            checks.append(_TYPE_CHECKS[arg])
+        elif keyword == "required":
+            checks.append(lambda v, keys=tuple(arg): not isinstance(v, dict) or all(k in v for k in keys))
+        elif keyword == "enum":
+            if not all(isinstance(e, str) for e in arg):
+                return None
+            checks.append(lambda v, allowed=frozenset(arg): isinstance(v, str) and v in allowed)
+        elif keyword == "properties":
+            sub = {}
+            for name, sub_schema in arg.items():
+                sub[name] = _compile_check(sub_schema)
+                if sub[name] is None:
+                    return None
+            checks.append(lambda v, sub=tuple(sub.items()):
+                          not isinstance(v, dict) or all(check(v[name]) for name, check in sub if name in v))
+        elif keyword == "items":
+            item_check = _compile_check(arg) if isinstance(arg, dict) else None
+            if item_check is None:
+                return None
+            checks.append(lambda v, check=item_check: not isinstance(v, list) or all(check(x) for x in v))
+        elif keyword == "minItems":
+            checks.append(lambda v, n=arg: not isinstance(v, list) or len(v) >= n)
+        elif keyword == "maxItems":
+            checks.append(lambda v, n=arg: not isinstance(v, list) or len(v) <= n)
+        elif keyword == "minimum":
+            checks.append(lambda v, n=arg: not _is_number(v) or v >= n)
+        elif keyword == "maximum":
+            checks.append(lambda v, n=arg: not _is_number(v) or v <= n)
+        else:
+            return None
+    checks = tuple(checks)
+    return lambda v: all(check(v) for check in checks)
+
+
+class CardValidator:
+    """
+    card_schema.json, скомпилированная один раз: корректные карточки проходят
+    быструю проверку на Python, тексты ошибок даёт jsonschema (Draft7Validator).
+    """
+
+    def __init__(self, schema: dict):
+        try:
+            from jsonschema import Draft7Validator
+        except ImportError:
+            raise RuntimeError("Для проверки карточек установите пакет jsonschema (pip install jsonschema)")
+        Draft7Validator.check_schema(schema)
+        self.validator = Draft7Validator(schema)
+        self.quick = _compile_check(schema)
+
+    def errors(self, card) -> list:
+        """
+        Все ошибки карточки (пустой список — карточка корректна).
+        """
+        if self.quick is None or not self.quick(card):
+            errors = []
+            for error in self.validator.iter_errors(card):
+                where = "/".join(str(p) for p in error.absolute_path)
+                errors.append(f"{where}: {error.message}" if where else error.message)
+            if errors:
+                return sorted(errors)
+        if isinstance(card, dict) and not card.get("id"):
+            return ["пустой id"]
+        return []
+
+
+def load_validator(path: Path = SCHEMA_PATH) -> CardValidator:
+    """
+    Валидатор карточек по схеме из файла. Требует пакет jsonschema.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return CardValidator(json.load(f))
+
+
+class ImportStats:
+    """
+    Итоги прогона импорта. source / unit — как называть входные записи в отчёте.
+    """
+
+    def __init__(self, source: str = "Строк CSV", unit: str = "Строка"):
+        self.source = source
+        self.unit = unit
+        self.rows = 0           # входных записей
+        self.accepted = 0       # записей, прошедших проверку
+        self.rejected = 0       # записей с ошибками
+        self.added = 0          # новых карточек в каталоге
+        self.updated = 0        # заменённых карточек каталога
+        self.total = 0          # карточек в каталоге после импорта
+        self.dropped = 0        # карточек каталога без id или с повтором id
+        self.catalog_reset = False  # cards.json не читался и собран заново
+        self.shards = {}        # путь файла шарда -> карточек в нём
+        self.unsharded = 0      # карточек вне regions_config.json
+        self.errors = []        # (номер записи, id, текст ошибки)
+
+    def error(self, row_num: int, card_id: str, message: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_num, card_id, message))
+
+    def summary(self) -> str:
+        lines = []
+        if self.catalog_reset:
+            lines.append("⚠️ Файл cards.json повреждён или пуст. Перезаписан заново.")
+        for row_num, card_id, message in self.errors:
+            lines.append(f"⚠️ {self.unit} {row_num} (id={card_id or '???'}): {message}. Пропущено.")
+        if self.rejected > len(self.errors):
+            lines.append(f"⚠️ ... и ещё {self.rejected - len(self.errors)} записей с ошибками")
+        if self.dropped:
+            lines.append(f"⚠️ Из каталога убрано карточек без id или с повтором id: {self.dropped}")
+        if self.shards:
+            lines.append(f"🗂 Шардов записано: {len(self.shards)}, карточек в них: {sum(self.shards.values())}")
+        if self.unsharded:
+            lines.append(f"⚠️ Карточек с городом или языком вне regions_config.json: {self.unsharded}")
+        lines.append(
+            f"✅ {self.source}: {self.rows}, принято: {self.accepted}, отклонено: {self.rejected}. "
+            f"Добавлено карточек: {self.added}, Обновлено: {self.updated}, всего в каталоге: {self.total}"
+        )
+        return "\n".join(lines)
+
+
+class _BrokenCatalog(Exception):
+    pass
+
+
+def _existing_cards(cards_path: Path):
+    try:
+        yield from iter_cards(cards_path)
+    except ValueError as e:
+        raise _BrokenCatalog(str(e))
+
+
+class CardStaging:
+    """
+    Временная SQLite-таблица принятых карточек по id и их слияние с каталогом.
+
+        with CardStaging() as staging:
+            staging.add(card, seq)
+            staging.write_catalog(cards_path, snapshot_path, stats, regions_path)
+    """
+
+    def __enter__(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="ww-import-")
+        self.conn = sqlite3.connect(str(Path(self.tmp.name) / "staging.db"))
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(
+            "CREATE TABLE staged (id TEXT PRIMARY KEY, seq INTEGER NOT NULL, data TEXT NOT NULL, "
+            "used INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.conn.execute("CREATE TABLE seen (id TEXT PRIMARY KEY)")
+        return self
+
+    def __exit__(self, *exc):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def add(self, card: dict, seq: int):
+        """
+        Повтор id заменяет карточку, сохраняя место (seq) её первого появления.
+        """
+        self.conn.execute(
+            "INSERT INTO staged (id, seq, data) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+            (card["id"], seq, json.dumps(card, ensure_ascii=False)),
+        )
+
+    def _merged(self, existing, stats: ImportStats):
+        """
+        Каталог после импорта: существующие карточки (заменённые по id) и затем новые.
+        """
+        conn = self.conn
+        for card in existing:
+            card_id = card.get("id") if isinstance(card, dict) else None
+            if not card_id or conn.execute("INSERT OR IGNORE INTO seen (id) VALUES (?)", (card_id,)).rowcount == 0:
+                stats.dropped += 1
+                continue
+            row = conn.execute("SELECT data FROM staged WHERE id = ?", (card_id,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE staged SET used = 1 WHERE id = ?", (card_id,))
+                stats.updated += 1
+                yield json.loads(row[0])
+            else:
+                yield card
+        for (data,) in conn.execute("SELECT data FROM staged WHERE used = 0 ORDER BY seq"):
+            stats.added += 1
+            yield json.loads(data)
+
+    def write_catalog(self, cards_path: Path = CARDS_PATH, snapshot_path: Path = SNAPSHOT_PATH,
+                      stats: ImportStats = None, regions_path: Path = None) -> ImportStats:
+        """
+        Потоково сливает принятые карточки с cards.json, атомарно записывает
+        результат и пересобирает снимок и (если задан regions_path) шарды.
+        """
+        cards_path = Path(cards_path)
+        stats = stats if stats is not None else ImportStats()
+        has_catalog = cards_path.exists() and cards_path.stat().st_size > 0
+        try:
+            existing = _existing_cards(cards_path) if has_catalog else ()
+            stats.total = save_cards(self._merged(existing, stats), cards_path)
+        except _BrokenCatalog:
+            # Недописанный результат ушёл во временный файл; собираем каталог только из новых карточек
+            stats.catalog_reset = True
+            stats.added = stats.updated = stats.dropped = 0
+            self.conn.execute("UPDATE staged SET used = 0")
+            self.conn.execute("DELETE FROM seen")
+            stats.total = save_cards(self._merged((), stats), cards_path)
+        # Снимок — после JSON: в нём подпись записанного cards.json
+        if snapshot_path is not None:
+            write_snapshot(iter_cards(cards_path), snapshot_path, cards_path)
+        if regions_path is not None:
+            stats.shards, stats.unsharded = write_shards(iter_cards(cards_path), load_regions(regions_path))
+        return stats
+
+
+def _stage_csv(csv_path: Path, validator, staging: CardStaging, stats: ImportStats):
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f, delimiter=";", quotechar='"')
+        if next(reader, None) is None:
+            raise ValueError("CSV-файл пуст или некорректен (нет заголовков).")
+        for row_num, row in enumerate(reader, start=2):
+            if not any(cell.strip() for cell in row):
+                continue
+            stats.rows += 1
+            card_id = row[0].strip() if row else ""
+            try:
+                card = row_to_card(row)
+            except ValueError as e:
+                stats.error(row_num, card_id, str(e))
+                continue
+            errors = validator.errors(card)
+            if errors:
+                stats.error(row_num, card_id, "; ".join(errors))
+                continue
+            stats.accepted += 1
+            staging.add(card, row_num)
+
+
+def import_csv(csv_path: Path, cards_path: Path = CARDS_PATH, snapshot_path: Path = SNAPSHOT_PATH,
+               schema_path: Path = SCHEMA_PATH, regions_path: Path = None) -> ImportStats:
+    """
+    Импортирует CSV в cards.json (upsert по id) и пересобирает снимок (и шарды).
+    Бросает ValueError, если CSV пуст, и RuntimeError без jsonschema.
+    """
+    validator = load_validator(schema_path)
+    stats = ImportStats()
+    with CardStaging() as staging:
+        _stage_csv(Path(csv_path), validator, staging, stats)
+        staging.write_catalog(cards_path, snapshot_path, stats, regions_path)
+    return stats
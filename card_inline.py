@@ -0,0 +1,137 @@
+"""
+card_inline.py
+
+Ответы на inline-запросы (@bot moscow legend).
+
+- Слова запроса, называющие город (moscow, москва, спб, 莫斯科...) или
+  легенду/факт (legend, легенда, 传说, fact...), становятся фильтрами; без
+  города в запросе — город из настроек пользователя. Остальные слова —
+  полнотекстовый запрос (card_search); слово, совпадающее с тегом фактов
+  языка, ещё и оставляет только карточки с этим тегом.
+- В выдаче только факты: кнопки квиза в сообщении, отправленном через
+  inline-режим, не к чему привязать.
+- Готовый JSON списка InlineQueryResultArticle кешируется в inline_cache
+  индекса (LRU) по языку, городу и нормализованному запросу: повторный запрос
+  не ищет и не сериализует заново, а новый индекс приходит с пустым кешем.
+  Карточки берутся только из индекса в памяти.
+"""
+
+import json
+
+from aiogram import types
+
+from card_render import fact_text
+from card_search import tokenize
+from card_store import ALL_CITIES, card_city
+from localization import CITY_MAP
+
+# Сколько результатов отдавать (Telegram принимает до 50)
+INLINE_LIMIT = 20
+# Сколько найденных по тексту карточек просматривать, отбирая подходящие под фильтры
+INLINE_SEARCH_DEPTH = 200
+# Сколько карточек корзины просматривать, если в запросе нет текста
+INLINE_SCAN_LIMIT = 1000
+# Длина описания результата (текст карточки), символов
+INLINE_DESCRIPTION = 100
+
+# Токен слова -> город или reality
+CITY_WORDS = {token: city for name, city in CITY_MAP.items() if city != ALL_CITIES
+              for token in tokenize(name)}
+CITY_WORDS.update({token: "spb" for token in tokenize("спб питер petersburg")})
+REALITY_WORDS = {token: reality for reality, names in (
+    ("legend", "legend legends легенда легенды 传说"),
+    ("fact", "fact facts факт факты 事实"),
+) for token in tokenize(names)}
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.casefold().split())
+
+
+def parse_query(index, lang: str, query: str) -> (str, str, frozenset, str):
+    """
+    (город или None, reality или None, токены тегов, текст для поиска).
+    """
+    city = reality = None
+    tags = set()
+    words = []
+    tag_tokens = None
+    for word in query.split():
+        tokens = tokenize(word)
+        if not tokens:
+            continue
+        if all(token in CITY_WORDS for token in tokens):
+            city = CITY_WORDS[tokens[0]]
+        elif all(token in REALITY_WORDS for token in tokens):
+            reality = REALITY_WORDS[tokens[0]]
+        else:
+            words.append(word)
+            if tag_tokens is None:
+                tag_tokens = index.tag_tokens(lang)
+            tags.update(token for token in tokens if token in tag_tokens)
+    return (city, reality, frozenset(tags), " ".join(words))
+
+
+def _matches(card: dict, city: str, reality: str, tags: frozenset) -> bool:
+    if card.get("interactive") or not isinstance(card.get("id"), str):
+        return False
+    if city not in (None, ALL_CITIES) and card_city(card) != city:
+        return False
+    if reality is not None and str(card.get("reality", "")).lower() != reality:
+        return False
+    if tags:
+        card_tags = card.get("tags")
+        card_tokens = {token for tag in (card_tags if isinstance(card_tags, list) else ())
+                       if isinstance(tag, str) for token in tokenize(tag)}
+        return tags <= card_tokens
+    return True
+
+
+def find_cards(index, lang: str, city: str, reality: str, tags: frozenset, text: str) -> list:
+    """
+    До INLINE_LIMIT фактов языка под фильтры: по тексту — в порядке
+    релевантности, без текста — в порядке корзины.
+    """
+    if text:
+        candidates = index.search(lang, text, INLINE_SEARCH_DEPTH)
+    else:
+        bucket = index.get(lang, city or ALL_CITIES, False)
+        candidates = (bucket[i] for i in range(min(len(bucket), INLINE_SCAN_LIMIT)))
+    found = []
+    for card in candidates:
+        if _matches(card, city, reality, tags):
+            found.append(card)
+            if len(found) >= INLINE_LIMIT:
+                break
+    return found
+
+
+def build_results(index, cards: list) -> str:
+    results = []
+    for card in cards:
+        text = " ".join(str(card.get("text", "")).split())
+        if len(text) > INLINE_DESCRIPTION:
+            text = text[:INLINE_DESCRIPTION - 1].rstrip() + "…"
+        results.append(types.InlineQueryResultArticle(
+            id=card["id"],
+            title=f"{card.get('icon', '')} {card.get('title', '')}".strip(),
+            description=text or None,
+            input_message_content=types.InputTextMessageContent(
+                fact_text(index, card), parse_mode="Markdown", disable_web_page_preview=True,
+            ),
+        ).to_python())
+    return json.dumps(results, ensure_ascii=False)
+
+
+def inline_results(index, lang: str, city: str, query: str) -> str:
+    """
+    JSON результатов inline-запроса для answerInlineQuery (из кеша индекса).
+    city — город пользователя, если запрос его не называет.
+    """
+    key = (lang, city, normalize_query(query))
+    results = index.inline_cache.get(key)
+    if results is None:
+        query_city, reality, tags, text = parse_query(index, lang, key[2])
+        cards = find_cards(index, lang, query_city or city, reality, tags, text)
+        results = index.inline_cache[key] = build_results(index, cards)
+    return results
@@ -0,0 +1,217 @@
+"""
+card_render.py
+
+Готовые к отправке представления карточек.
+
+- Текст факта (Markdown с экранированием, адрес, ссылка на Google Maps) и подпись
+  к картинке факта (заголовок и адрес).
+- Вопрос квиза и сериализованная inline-клавиатура с вариантами. В callback_data
+  только номер квиза, несколько бит хеша его id и вариант ("q<число>"), верный
+  ответ знает лишь сервер. Кнопка, номер которой достался другому квизу
+  (потерян реестр номеров), не совпадёт по хешу и получит "вопрос недоступен".
+- Кнопка "Подробнее об этом месте" под фактом и карточка объекта
+  (описание + кнопки его карточек на языке пользователя).
+- Результаты поиска (/search) — кнопками найденных карточек.
+- Результаты кешируются в CardIndex.render_cache: карточки неизменны между
+  перезагрузками, а новый индекс приходит с пустым кешем. Ключ — id карточки;
+  карточка без id собирается заново при каждой отправке.
+"""
+
+import zlib
+
+from aiogram import types
+
+from keyboards import serialize_markup
+from markdown_text import escape_markdown
+from localization import translations, LANG_OPTIONS
+from object_index import card_base
+
+# Сколько карточек объекта показывать кнопками
+OBJECT_CARDS_LIMIT = 8
+
+def _location_text(card: dict) -> str:
+    text_msg = ""
+    loc = card.get("location", {})
+    if isinstance(loc, dict):
+        addr = loc.get("address", "")
+        if addr:
+            text_msg += f"\n📍 {escape_markdown(addr)}"
+        gps = loc.get("gps", {})
+        if "lat" in gps and "lng" in gps:
+            lat, lng = gps["lat"], gps["lng"]
+            text_msg += f"\n[{lat},{lng}](https://maps.google.com/?q={lat},{lng})"
+    elif isinstance(loc, str):
+        text_msg += f"\n📍 {escape_markdown(loc)}"
+    return text_msg
+
+
+def build_fact_text(card: dict) -> str:
+    text_msg = (
+        f"{card.get('icon','')} {escape_markdown(card.get('title',''))}\n"
+        f"{escape_markdown(card.get('text',''))}"
+    )
+    return text_msg + _location_text(card)
+
+
+def build_fact_caption(card: dict) -> str:
+    # Текст факта уже на картинке: в подписи заголовок и адрес
+    return f"{card.get('icon','')} {escape_markdown(card.get('title',''))}" + _location_text(card)
+
+
+# callback_data квиза: "q" + ((((номер * число языков + язык) << QUIZ_CHECK_BITS) + проверка)
+# * QUIZ_MAX_OPTIONS + вариант). Номер — стабильный номер карточки в корзине
+# (язык, "all", квизы), см. card_store; проверка — младшие биты crc32 id квиза.
+# Даже при номере в миллиарды строка короче 25 байт (лимит Telegram — 64).
+QUIZ_PREFIX = "q"
+QUIZ_MAX_OPTIONS = 16
+QUIZ_CHECK_BITS = 8
+# Прежний формат "quiz:<id>:<вариант>[:<верный>]" (кнопки в уже отправленных сообщениях)
+LEGACY_QUIZ_PREFIX = "quiz:"
+
+
+def quiz_callback_data(card: dict, handle, option: int) -> str:
+    lang = card.get("language", "").lower()
+    if handle is None or lang not in LANG_OPTIONS or len(card.get("options", [])) > QUIZ_MAX_OPTIONS:
+        # Квиз без номера (нет id или необычный язык): id в кнопке, ответ всё равно проверяет сервер
+        return f"{LEGACY_QUIZ_PREFIX}{card.get('id', '')}:{option}"
+    code = ((handle * len(LANG_OPTIONS) + LANG_OPTIONS.index(lang)) << QUIZ_CHECK_BITS) + _quiz_check(card)
+    return f"{QUIZ_PREFIX}{code * QUIZ_MAX_OPTIONS + option}"
+
+
+def _quiz_check(card: dict) -> int:
+    # crc32, а не hash(): строки в Python хешируются по-разному от запуска к запуску
+    return zlib.crc32(str(card.get("id", "")).encode("utf-8")) & ((1 << QUIZ_CHECK_BITS) - 1)
+
+
+def _is_number(text: str) -> bool:
+    # isdigit() пропускает "²" и прочие цифры, которых не понимает int()
+    return text.isascii() and text.isdigit()
+
+
+def is_quiz_callback(data: str) -> bool:
+    return data.startswith(LEGACY_QUIZ_PREFIX) or (data[:1] == QUIZ_PREFIX and _is_number(data[1:]))
+
+
+def quiz_callback_language(data: str):
+    """
+    Язык квиза по callback_data (шарды какого языка нужны resolve_quiz_callback)
+    или None, если у id в старом формате нет языкового суффикса.
+    """
+    if data.startswith(LEGACY_QUIZ_PREFIX):
+        parts = data.split(":")
+        return card_base(parts[1])[1] if len(parts) > 1 else None
+    code = int(data[len(QUIZ_PREFIX):]) // QUIZ_MAX_OPTIONS >> QUIZ_CHECK_BITS
+    return LANG_OPTIONS[code % len(LANG_OPTIONS)]
+
+
+def resolve_quiz_callback(index, data: str):
+    """
+    (карточка квиза, выбранный вариант) по callback_data или (None, None),
+    если формат неверен, квиза больше нет в каталоге или номер теперь у другого квиза.
+    """
+    if data.startswith(LEGACY_QUIZ_PREFIX):
+        parts = data.split(":")
+        if len(parts) not in (3, 4) or not _is_number(parts[2]):
+            return (None, None)
+        return (index.loaded_card(parts[1]), int(parts[2]))
+    code, option = divmod(int(data[len(QUIZ_PREFIX):]), QUIZ_MAX_OPTIONS)
+    code, check = divmod(code, 1 << QUIZ_CHECK_BITS)
+    handle, lang = divmod(code, len(LANG_OPTIONS))
+    card = index.quiz_by_handle(LANG_OPTIONS[lang], handle)
+    if card is None or _quiz_check(card) != check:
+        return (None, None)
+    return (card, option)
+
+
+def build_quiz(card: dict, handle=None) -> (str, str):
+    question = card.get("question", "Вопрос не задан.")
+    options = card.get("options", [])
+    kb = types.InlineKeyboardMarkup()
+    for i, opt in enumerate(options):
+        kb.add(types.InlineKeyboardButton(f"{i+1}) {opt}", callback_data=quiz_callback_data(card, handle, i)))
+    return (question, serialize_markup(kb))
+
+
+def _cached(index, kind: str, card: dict, build):
+    card_id = card.get("id")
+    if not isinstance(card_id, str) or not card_id:
+        # Без id кешировать не по чему: карточки снимка — временные словари,
+        # и id() объекта может достаться другой карточке
+        return build(card)
+    key = (kind, card_id)
+    rendered = index.render_cache.get(key)
+    if rendered is None:
+        rendered = index.render_cache[key] = build(card)
+    return rendered
+
+
+def fact_text(index, card: dict) -> str:
+    """
+    Markdown-текст факта из кеша индекса.
+    """
+    return _cached(index, "fact", card, build_fact_text)
+
+
+def fact_caption(index, card: dict) -> str:
+    """
+    Markdown-подпись к картинке факта (card_images) из кеша индекса.
+    """
+    return _cached(index, "caption", card, build_fact_caption)
+
+
+def quiz_message(index, card: dict) -> (str, str):
+    """
+    (вопрос, JSON inline-клавиатуры) квиза из кеша индекса.
+    """
+    return _cached(index, "quiz", card, lambda c: build_quiz(c, index.quiz_handle(c)))
+
+
+def more_about_markup(index, object_id: str, lang: str) -> str:
+    """
+    JSON inline-клавиатуры "Подробнее об этом месте" для объекта.
+    """
+    key = ("more", object_id, lang)
+    markup = index.render_cache.get(key)
+    if markup is None:
+        kb = types.InlineKeyboardMarkup()
+        kb.add(types.InlineKeyboardButton(translations[lang]["more_about_place"],
+                                          callback_data=f"obj:{object_id}"))
+        markup = index.render_cache[key] = serialize_markup(kb)
+    return markup
+
+
+def build_object_message(index, obj, lang: str) -> (str, str):
+    text_msg = f"🏛 *{escape_markdown(obj.name(lang))}*"
+    description = obj.description(lang)
+    if description:
+        text_msg += f"\n{escape_markdown(description)}"
+    if obj.gps is not None:
+        lat, lng = obj.gps
+        text_msg += f"\n[{lat},{lng}](https://maps.google.com/?q={lat},{lng})"
+    card_ids = index.objects.cards_for_object(obj.object_id, lang)
+    cards = [card for card in map(index.loaded_card, card_ids) if card is not None][:OBJECT_CARDS_LIMIT]
+    if not cards:
+        return (f"{text_msg}\n\n{translations[lang]['place_no_cards']}", None)
+    return (text_msg, cards_markup(cards))
+
+
+def cards_markup(cards) -> str:
+    """
+    JSON inline-клавиатуры: по кнопке на карточку (открывается по "card:<id>").
+    """
+    kb = types.InlineKeyboardMarkup()
+    for card in cards:
+        kb.add(types.InlineKeyboardButton(f"{card.get('icon', '')} {card.get('title', '')}".strip(),
+                                          callback_data=f"card:{card['id']}"))
+    return serialize_markup(kb)
+
+
+def object_message(index, obj, lang: str) -> (str, str):
+    """
+    (Markdown-текст объекта, JSON клавиатуры его карточек или None) из кеша индекса.
+    """
+    key = ("object", obj.object_id, lang)
+    rendered = index.render_cache.get(key)
+    if rendered is None:
+        rendered = index.render_cache[key] = build_object_message(index, obj, lang)
+    return rendered
@@ -0,0 +1,298 @@
+"""
+card_search.py
+
+Полнотекстовый поиск по карточкам (/search).
+
+- Обратный индекс по title, text, tags и persons, отдельный для каждого языка:
+  токен -> {id карточки: вес}.
+- Русские и английские слова приводятся к нижнему регистру (ё -> е) и
+  усекаются лёгким стеммером: "Невский", "Невского", "Невском" -> "невск".
+- В китайском тексте нет пробелов: отрезки иероглифов режутся на биграммы
+  (и отдельные иероглифы — для запросов из одного знака).
+- Вес токена — BM25 с фиксированной средней длиной карточки: он зависит
+  только от самой карточки, поэтому при перезагрузке каталога индекс
+  обновляется по изменившимся карточкам, а не строится заново.
+- Новый индекс делит с прежним нетронутые списки карточек токенов (копирование
+  при записи): прежний индекс остаётся рабочим, пока на него ссылаются обработчики.
+- Запрос — все токены обязательны. Если подходящих карточек много, списки
+  карточек токенов читаются по убыванию веса (готовые списки кешируются
+  в индексе) до порога, за которым лучшие limit карточек уже не поменяются
+  (см. search_many).
+"""
+
+import heapq
+import math
+import re
+import sys
+from collections import Counter
+
+# Поле карточки -> во сколько раз вхождение в нём весомее вхождения в text
+FIELD_WEIGHTS = {"title": 3.0, "tags": 2.0, "persons": 2.0, "text": 1.0}
+
+# Параметры BM25; AVG_TOKENS — типичная длина карточки в токенах (постоянная, см. выше)
+BM25_K1 = 1.2
+BM25_B = 0.75
+AVG_TOKENS = 80.0
+
+# Сколько токенов запроса учитывать
+MAX_QUERY_TOKENS = 16
+# До скольких найденных карточек оценивать каждую (больше — пороговый алгоритм)
+SCAN_LIMIT = 256
+
+# Иероглифы CJK (основной блок, расширение A и совместимые)
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_WORD_RE = re.compile(f"[^\\W_{_CJK}]+")
+_CJK_RE = re.compile(f"[{_CJK}]+")
+_CYRILLIC_RE = re.compile("[а-я]")
+
+# Окончания для усечения русских слов
+_RU_ENDINGS = frozenset((
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ией", "иям", "иях",
+    "ах", "ях", "ов", "ев", "ей", "ий", "ый", "ой", "ая", "яя", "ое", "ее", "ие", "ые",
+    "ом", "ем", "ам", "ям", "ую", "юю", "ью", "ия", "ию", "ии", "ых", "их",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+))
+_RU_ENDING_LENGTHS = sorted({len(e) for e in _RU_ENDINGS}, reverse=True)
+# Столько букв остаётся у слова после усечения как минимум
+_MIN_STEM = 3
+
+# Слово -> токен: словарь каталога невелик, а слова повторяются из карточки в карточку
+_WORD_TOKENS = {}
+_WORD_TOKENS_MAX = 1 << 18
+
+
+def _stem_ru(word: str) -> str:
+    # Самое длинное подходящее окончание
+    for n in _RU_ENDING_LENGTHS:
+        if len(word) - n >= _MIN_STEM and word[-n:] in _RU_ENDINGS:
+            return word[:-n]
+    return word
+
+
+def _stem_en(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str, unigrams: bool = False) -> list:
+    """
+    Токены текста: усечённые слова и биграммы китайского текста (отрезок из
+    одного иероглифа — сам иероглиф). unigrams — ещё и все иероглифы по одному.
+    """
+    text = text.casefold().replace("ё", "е")
+    get = _WORD_TOKENS.get
+    tokens = [get(word) or _word_token(word) for word in _WORD_RE.findall(text)]
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+            continue
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        if unigrams:
+            tokens.extend(run)
+    return tokens
+
+
+def _word_token(word: str) -> str:
+    if word.isdigit():
+        token = word
+    elif _CYRILLIC_RE.search(word):
+        token = _stem_ru(word)
+    else:
+        token = _stem_en(word)
+    if len(_WORD_TOKENS) >= _WORD_TOKENS_MAX:
+        _WORD_TOKENS.clear()
+    token = _WORD_TOKENS[word] = sys.intern(token)
+    return token
+
+
+def _field_text(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return " ".join(v for v in value if isinstance(v, str))
+    return ""
+
+
+def card_terms(card: dict) -> dict:
+    """
+    {токен: вес BM25} карточки.
+    """
+    counts = {}
+    length = 0
+    for field, boost in FIELD_WEIGHTS.items():
+        # Одиночные иероглифы — для запросов из одного знака
+        tokens = tokenize(_field_text(card.get(field)), unigrams=True)
+        length += len(tokens)
+        for token, n in Counter(tokens).items():
+            counts[token] = counts.get(token, 0.0) + boost * n
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / AVG_TOKENS)
+    return {token: tf * (BM25_K1 + 1) / (tf + norm) for token, tf in counts.items()}
+
+
+def card_fingerprint(card: dict) -> int:
+    """
+    Отпечаток полей, по которым ищется карточка: карточка с тем же отпечатком
+    не переиндексируется.
+    """
+    return hash((str(card.get("language", "")).lower(),)
+                + tuple(_field_text(card.get(field)) for field in FIELD_WEIGHTS))
+
+
+class SearchIndex:
+    """
+    Неизменяемый обратный индекс. Новая версия каталога — SearchIndex.updated.
+    """
+
+    def __init__(self):
+        self.docs = {}      # id карточки -> (язык, отпечаток, токены)
+        self.postings = {}  # язык -> {токен: {id карточки: вес}}
+        self.sizes = {}     # язык -> число карточек
+        self.ranked = {}    # (язык, токен) -> [(вес, id)] по убыванию, строится при запросе
+
+    def __len__(self):
+        return len(self.docs)
+
+    def updated(self, documents, load) -> "SearchIndex":
+        """
+        Индекс новой версии каталога. documents — (id, отпечаток, ссылка) всех
+        карточек, load(ссылка) — карточка; читаются только новые и изменённые.
+        """
+        new = SearchIndex()
+        new.postings = {lang: dict(tokens) for lang, tokens in self.postings.items()}
+        new.sizes = dict(self.sizes)
+        touched = {}  # язык -> {токен: список карточек, уже скопированный для new}
+
+        def postings(lang: str) -> (dict, dict):
+            return (new.postings.setdefault(lang, {}), touched.setdefault(lang, {}))
+
+        def remove(card_id: str, doc: tuple):
+            lang, _, tokens = doc
+            lang_postings, lang_touched = postings(lang)
+            for token in tokens:
+                ids = lang_touched.get(token)
+                if ids is None:
+                    ids = lang_touched[token] = lang_postings[token] = dict(lang_postings[token])
+                ids.pop(card_id, None)
+            new.sizes[lang] -= 1
+
+        for card_id, fingerprint, ref in documents:
+            old = self.docs.get(card_id)
+            if old is not None and old[1] == fingerprint:
+                new.docs[card_id] = old
+                continue
+            if old is not None:
+                remove(card_id, old)
+            card = load(ref)
+            lang = str(card.get("language", "")).lower()
+            terms = card_terms(card)
+            lang_postings, lang_touched = postings(lang)
+            for token, weight in terms.items():
+                ids = lang_touched.get(token)
+                if ids is None:
+                    # Список карточек токена копируется при первом изменении
+                    ids = lang_touched[token] = lang_postings[token] = dict(lang_postings.get(token, ()))
+                ids[card_id] = weight
+            new.docs[card_id] = (lang, fingerprint, tuple(terms))
+            new.sizes[lang] = new.sizes.get(lang, 0) + 1
+        for card_id, doc in self.docs.items():
+            if card_id not in new.docs:
+                remove(card_id, doc)
+        for lang, tokens in touched.items():
+            for token, ids in tokens.items():
+                if not ids:
+                    del new.postings[lang][token]
+        # Готовые списки по убыванию веса переходят к новому индексу для нетронутых токенов
+        new.ranked = {key: ranked for key, ranked in dict(self.ranked).items()
+                      if key[1] not in touched.get(key[0], ())}
+        return new
+
+    def ranked_posting(self, lang: str, token: str) -> list:
+        key = (lang, token)
+        ranked = self.ranked.get(key)
+        if ranked is None:
+            ids = self.postings.get(lang, {}).get(token, {})
+            ranked = self.ranked[key] = sorted(((w, card_id) for card_id, w in ids.items()), reverse=True)
+        return ranked
+
+    def search(self, lang: str, query: str, limit: int) -> list:
+        """
+        [(оценка, id)] лучших limit карточек языка по запросу.
+        """
+        return search_many([self], lang, query, limit)
+
+
+def search_many(indexes: list, lang: str, query: str, limit: int) -> list:
+    """
+    Поиск сразу по нескольким индексам (шарды каталога) с общей idf.
+
+    Карточки со всеми токенами запроса — пересечение множеств id. Если их
+    немного (SCAN_LIMIT), оценивается каждая. Иначе — пороговый алгоритм
+    Фейгина: списки токенов читаются параллельно по убыванию веса, у непрочитанной
+    карточки оценка не больше суммы текущих весов (порога), и как только
+    limit-я лучшая оценка не ниже порога, чтение закончено.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TOKENS]
+    if not terms or limit <= 0:
+        return []
+    total = sum(index.sizes.get(lang, 0) for index in indexes)
+    idfs = []
+    for token in terms:
+        df = sum(len(index.postings.get(lang, {}).get(token, ())) for index in indexes)
+        if not df:
+            return []
+        idfs.append(math.log(1 + (total - df + 0.5) / (df + 0.5)))
+
+    matches = []  # (списки карточек токенов, id карточек со всеми токенами) по индексам
+    for index in indexes:
+        lang_postings = index.postings.get(lang, {})
+        parts = [lang_postings.get(token) for token in terms]
+        if not all(parts):
+            continue
+        shortest = min(parts, key=len)
+        ids = shortest.keys()
+        for part in parts:
+            if part is not shortest:
+                ids = ids & part.keys()
+        if ids:
+            matches.append((parts, ids))
+    found = sum(len(ids) for _, ids in matches)
+    if found <= SCAN_LIMIT:
+        scored = []
+        for parts, ids in matches:
+            for card_id in ids:
+                scored.append((sum(part[card_id] * idf for part, idf in zip(parts, idfs)), card_id))
+        return heapq.nlargest(limit, scored)
+
+    streams = []
+    for token, idf in zip(terms, idfs):
+        ranked = [index.ranked_posting(lang, token) for index in indexes]
+        streams.append((idf, iter(ranked[0]) if len(ranked) == 1 else heapq.merge(*ranked, reverse=True)))
+    top = []  # куча (оценка, id) лучших limit карточек
+    seen = set()
+    while True:
+        threshold = 0.0
+        for idf, stream in streams:
+            item = next(stream, None)
+            if item is None:
+                # Все карточки с этим токеном (а значит, и все подходящие) уже встречены
+                return sorted(top, reverse=True)
+            weight, card_id = item
+            threshold += weight * idf
+            if card_id in seen:
+                continue
+            seen.add(card_id)
+            for parts, ids in matches:
+                if card_id in ids:
+                    score = sum(part[card_id] * other_idf for part, other_idf in zip(parts, idfs))
+                    if len(top) < limit:
+                        heapq.heappush(top, (score, card_id))
+                    elif score > top[0][0]:
+                        heapq.heapreplace(top, (score, card_id))
+                    break
+        if len(top) >= limit and top[0][0] >= threshold:
+            return sorted(top, reverse=True)
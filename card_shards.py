@@ -0,0 +1,387 @@
+"""
+card_shards.py
+
+Каталог, разбитый по городам и языкам (regions_config.json).
+
+- regions_config.json: {"Город": {"facts": {"RU": путь, ...}, "quizzes": {...}}};
+  шард — карточки одного города на одном языке (факты + квизы).
+- Шард читается при первом обращении; в памяти держится не больше max_shards
+  шардов (LRU), вытесненный шард перечитается при следующем обращении.
+- Город "all" — объединённое представление шардов языка: корзины, номера
+  карточек и таблицы выбора склеиваются без копирования карточек.
+- ShardedCardStore следит за regions_config.json и файлами шардов; после
+  изменения индекс заменяется новым, и шарды читаются заново по мере обращений.
+- Поиск (/search) — по полнотекстовым индексам всех шардов языка с общей idf;
+  индекс шарда строится при первом поиске, а не при чтении шарда.
+- write_shards раскладывает каталог по файлам шардов (для шагов импорта).
+"""
+
+import logging
+import asyncio
+import bisect
+import json
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from card_store import (ALL_CITIES, CardIndex, CardStore, HANDLES_PATH, SNAPSHOT_RENDER_CACHE, _RenderLRU,
+                        assign_handles, card_city, file_signature, read_cards, save_cards)
+from localization import CITY_MAP
+from object_index import OBJECTS_DIR, ObjectIndex, card_base, load_objects, object_files
+from selection import SELECTION_CONFIG_PATH, build_alias, load_selection_config
+
+REGIONS_CONFIG_PATH = Path(__file__).parent / "regions_config.json"
+
+# Сколько шардов (город + язык) держать в памяти по умолчанию
+MAX_SHARDS = 8
+
+# Раздел regions_config.json -> interactive
+_KINDS = {"facts": False, "quizzes": True}
+
+
+def load_regions(path: Path = REGIONS_CONFIG_PATH) -> dict:
+    """
+    {(язык, город): {interactive: путь к файлу}} из regions_config.json.
+    Пути относительны каталога конфигурации.
+    """
+    path = Path(path)
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{path.name}: ожидается объект {{город: {{facts, quizzes}}}}")
+    regions = {}
+    for city_name, kinds in config.items():
+        city = CITY_MAP.get(city_name.lower(), city_name.lower())
+        for kind, files in kinds.items():
+            if kind not in _KINDS:
+                raise ValueError(f"{path.name}: неизвестный раздел {kind!r} у города {city_name}")
+            for lang, file in files.items():
+                regions.setdefault((lang.lower(), city), {})[_KINDS[kind]] = path.parent / file
+    return regions
+
+
+def write_shards(cards, regions: dict) -> (dict, int):
+    """
+    Раскладывает карточки по файлам шардов (атомарно, в формате cards.json).
+    Файлы шардов без карточек перезаписываются пустыми. Возвращает
+    ({путь: число карточек}, число карточек вне regions_config.json).
+    """
+    spools = {}
+    skipped = 0
+    with tempfile.TemporaryDirectory(prefix="ww-shards-") as tmp:
+        try:
+            for card in cards:
+                if not isinstance(card, dict):
+                    continue
+                key = (card.get("language", "").lower(), card_city(card))
+                path = regions.get(key, {}).get(card.get("interactive", False) is True)
+                if path is None:
+                    skipped += 1
+                    continue
+                if path not in spools:
+                    spools[path] = open(Path(tmp) / f"{len(spools)}.jsonl", "w+", encoding="utf-8")
+                spools[path].write(json.dumps(card, ensure_ascii=False) + "\n")
+
+            counts = {}
+            for files in regions.values():
+                for path in files.values():
+                    spool = spools.get(path)
+                    lines = ()
+                    if spool is not None:
+                        spool.seek(0)
+                        lines = spool
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    counts[path] = save_cards((json.loads(line) for line in lines), path)
+        finally:
+            for spool in spools.values():
+                spool.close()
+    return (counts, skipped)
+
+
+class _MergedBucket:
+    """
+    Склейка корзин шардов одного языка: последовательность без копирования.
+    """
+
+    __slots__ = ("parts", "starts")
+
+    def __init__(self, parts: list):
+        self.parts = parts
+        self.starts = []
+        total = 0
+        for part in parts:
+            self.starts.append(total)
+            total += len(part)
+        self.starts.append(total)
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        part = bisect.bisect_right(self.starts, i) - 1
+        return self.parts[part][i - self.starts[part]]
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
+
+
+class _MergedHandleSpace:
+    """
+    Номера корзины "all": у каждого шарда свои карточки в общем реестре номеров
+    корзины "язык|all|0/1", на чужих номерах у него None.
+    """
+
+    __slots__ = ("parts",)
+
+    def __init__(self, parts: list):
+        self.parts = parts
+
+    def __len__(self):
+        return max((len(part) for part in self.parts), default=0)
+
+    def __getitem__(self, handle: int):
+        for part in self.parts:
+            if handle < len(part):
+                card = part[handle]
+                if card is not None:
+                    return card
+        return None
+
+
+class ShardedCardIndex(CardIndex):
+    """
+    Интерфейс CardIndex поверх шардов, которые читаются по мере обращений.
+    Каждый шард — обычный CardIndex со своими номерами карточек и таблицами выбора.
+    """
+
+    def __init__(self, regions: dict, max_shards: int = MAX_SHARDS, handles_path: Path = HANDLES_PATH,
+                 selection=None, objects_dir: Path = OBJECTS_DIR):
+        super().__init__([])
+        self.regions = regions
+        self.cities = {}
+        for lang, city in sorted(regions):
+            self.cities.setdefault(lang, []).append(city)
+        # Представление "all" держит все города языка одновременно
+        self.max_shards = max(max_shards, max(map(len, self.cities.values()), default=1))
+        self.handles_path = handles_path
+        if selection is not None:
+            self.selection = selection
+        self.objects_dir = objects_dir
+        self._objects = None
+        self.shards = OrderedDict()  # (язык, город) -> CardIndex, последний — самый свежий
+        self.lock = threading.Lock()
+        self.render_cache = _RenderLRU(SNAPSHOT_RENDER_CACHE)
+
+    @property
+    def objects(self) -> ObjectIndex:
+        # Граф строится без проверки карточек по шардам (см. object_index): наличие
+        # карточки проверяет loaded_card по уже прочитанным шардам
+        if self._objects is None:
+            self._objects = ObjectIndex(load_objects(self.objects_dir))
+        return self._objects
+
+    @objects.setter
+    def objects(self, value: ObjectIndex):
+        self._objects = value
+
+    @property
+    def count(self) -> int:
+        return sum(shard.count for shard in list(self.shards.values()))
+
+    @count.setter
+    def count(self, value: int):
+        pass
+
+    def describe(self) -> str:
+        return (f"{len(self.regions)} shards in {REGIONS_CONFIG_PATH.name}, "
+                f"loaded on demand (up to {self.max_shards} in memory)")
+
+    def _read_shard(self, key: tuple) -> CardIndex:
+        cards = []
+        for path in self.regions[key].values():
+            if path.exists():
+                cards.extend(read_cards(path))
+        shard = CardIndex(cards)
+        if self.handles_path is not None:
+            shard.set_handles(assign_handles(self.handles_path, shard.bucket_ids()))
+        shard.set_selection(self.selection)
+        return shard
+
+    def shard(self, lang: str, city: str) -> CardIndex:
+        key = (lang, city)
+        with self.lock:
+            shard = self.shards.get(key)
+            if shard is not None:
+                self.shards.move_to_end(key)
+                return shard
+        try:
+            shard = self._read_shard(key)
+        except Exception as e:
+            logging.error(f"Ошибка чтения шарда {lang}/{city}: {e}")
+            shard = CardIndex([])
+        with self.lock:
+            # Параллельное чтение того же шарда: остаётся первый
+            shard = self.shards.setdefault(key, shard)
+            self.shards.move_to_end(key)
+            while len(self.shards) > self.max_shards:
+                (old_lang, _), _ = self.shards.popitem(last=False)
+                self._forget(old_lang)
+        return shard
+
+    def _forget(self, lang: str):
+        # Кеши представления "all" ссылаются на карточки вытесненного шарда
+        self.geo = {key: geo for key, geo in self.geo.items() if key[0] != lang}
+        self.selectors = {key: value for key, value in self.selectors.items() if key[0] != lang}
+
+    def loaded(self, lang: str, city: str) -> bool:
+        cities = self.cities.get(lang, ()) if city == ALL_CITIES else (city,)
+        return all((lang, c) in self.shards for c in cities)
+
+    def load(self, lang: str, city: str):
+        for c in (self.cities.get(lang, ()) if city == ALL_CITIES else (city,)):
+            if (lang, c) in self.regions:
+                self.shard(lang, c)
+
+    def _lang_shards(self, lang: str) -> list:
+        return [self.shard(lang, city) for city in self.cities.get(lang, ())]
+
+    def get(self, lang: str, city: str, interactive: bool):
+        if (lang, city) in self.regions:
+            return self.shard(lang, city).get(lang, city, interactive)
+        if city == ALL_CITIES and lang in self.cities:
+            return _MergedBucket([shard.get(lang, ALL_CITIES, interactive) for shard in self._lang_shards(lang)])
+        return ()
+
+    def handle_space(self, lang: str, city: str, interactive: bool):
+        lang, city = lang.lower(), city.lower()
+        if (lang, city) in self.regions:
+            return self.shard(lang, city).handle_space(lang, city, interactive)
+        if city == ALL_CITIES and lang in self.cities:
+            return _MergedHandleSpace([shard.handle_space(lang, ALL_CITIES, interactive)
+                                       for shard in self._lang_shards(lang)])
+        return ()
+
+    def selector(self, lang: str, city: str, interactive: bool):
+        lang, city = lang.lower(), city.lower()
+        if (lang, city) in self.regions:
+            return self.shard(lang, city).selector(lang, city, interactive)
+        if city != ALL_CITIES or lang not in self.cities:
+            return None
+        # Таблица для "all" — по склеенным весам шардов, пока ни один из них не вытеснен
+        key = (lang, city, interactive)
+        shards = self._lang_shards(lang)
+        cached = self.selectors.get(key)
+        if cached is None or any(a is not b for a, b in zip(cached[0], shards)):
+            weights = []
+            for shard in shards:
+                weights += shard._bucket_weights(key, self.selection, fresh=False)
+            self._apply_freshness(weights, shards, key)
+            cached = self.selectors[key] = (shards, build_alias(weights))
+        return cached[1]
+
+    def _apply_freshness(self, weights: list, shards: list, key: tuple):
+        """
+        Поправка на новизну по общему реестру номеров корзины "all": свежие —
+        последние fresh_newest карточки языка, а не каждого шарда.
+        """
+        config = self.selection
+        newest = config.fresh_newest if config.fresh_weight != 1.0 else 0
+        if not newest:
+            return
+        positions = {id(card): i for i, card in enumerate(_MergedBucket([shard.get(*key) for shard in shards]))}
+        space = _MergedHandleSpace([shard.handle_space(*key) for shard in shards])
+        found = 0
+        for handle in range(len(space) - 1, -1, -1):
+            if found >= newest:
+                break
+            card = space[handle]
+            if card is not None:
+                weights[positions[id(card)]] *= config.fresh_weight
+                found += 1
+
+    def text_ready(self, lang: str) -> bool:
+        lang = lang.lower()
+        with self.lock:
+            shards = [self.shards.get((lang, city)) for city in self.cities.get(lang, ())]
+        return all(shard is not None and shard.text_ready(lang) for shard in shards)
+
+    def search_indexes(self, lang: str) -> list:
+        lang = lang.lower()
+        return [shard.text_index(lang) for shard in self._lang_shards(lang)]
+
+    def tag_tokens(self, lang: str) -> frozenset:
+        return frozenset().union(*(shard.tag_tokens(lang) for shard in self._lang_shards(lang.lower())))
+
+    def quiz_handle(self, card: dict):
+        key = (card.get("language", "").lower(), card_city(card))
+        return self.shard(*key).quiz_handle(card) if key in self.regions else None
+
+    def _shards_for_id(self, card_id: str) -> list:
+        _, lang = card_base(card_id)
+        keys = [key for key in self.regions if lang is None or key[0] == lang]
+        # Сначала уже загруженные шарды
+        return sorted(keys, key=lambda key: key not in self.shards)
+
+    def card_by_id(self, card_id: str):
+        for key in self._shards_for_id(card_id):
+            card = self.shard(*key).card_by_id(card_id)
+            if card is not None:
+                return card
+        return None
+
+    def has_card(self, card_id: str) -> bool:
+        return any(self.shard(*key).has_card(card_id) for key in self._shards_for_id(card_id))
+
+    def loaded_card(self, card_id: str):
+        """
+        Карточка по id только из прочитанных шардов: не читает шарды в цикле событий.
+        """
+        with self.lock:
+            shards = list(self.shards.values())
+        for shard in shards:
+            card = shard.card_by_id(card_id)
+            if card is not None:
+                return card
+        return None
+
+
+class ShardedCardStore(CardStore):
+    """
+    CardStore для каталога из regions_config.json: индекс — ShardedCardIndex.
+    """
+
+    def __init__(self, regions_path: Path = REGIONS_CONFIG_PATH, max_shards: int = MAX_SHARDS,
+                 objects_dir: Path = OBJECTS_DIR, handles_path: Path = HANDLES_PATH,
+                 selection_path: Path = SELECTION_CONFIG_PATH):
+        super().__init__(None, None, objects_dir, handles_path, selection_path)
+        self.regions_path = Path(regions_path)
+        self.max_shards = max_shards
+
+    def _signature(self):
+        try:
+            files = sorted({path for paths in load_regions(self.regions_path).values() for path in paths.values()})
+        except (OSError, ValueError):
+            files = []
+        shards = tuple((str(path), file_signature(path)) for path in files)
+        return (file_signature(self.regions_path),
+                shards if any(sig is not None for _, sig in shards) else None,
+                tuple((p.name, file_signature(p)) for p in object_files(self.objects_dir)),
+                file_signature(self.selection_path))
+
+    def _read_index(self) -> CardIndex:
+        return ShardedCardIndex(load_regions(self.regions_path), self.max_shards, self.handles_path,
+                                load_selection_config(self.selection_path), self.objects_dir)
+
+    async def prepare(self, lang: str, city: str):
+        """
+        Читает недостающие шарды языка и города в пуле потоков, не задерживая цикл событий.
+        """
+        index = self.index
+        if isinstance(index, ShardedCardIndex) and not index.loaded(lang, city):
+            await asyncio.get_event_loop().run_in_executor(None, index.load, lang, city)
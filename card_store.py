@@ -0,0 +1,967 @@
+"""
+card_store.py
+
+Хранилище карточек в памяти.
+
+- data/cards.json читается один раз (при старте), а не на каждый "Go!".
+- Карточки раскладываются по корзинам (язык, город, interactive).
+- Город "all" — заранее собранное объединение всех городов языка.
+- Выборка для вращения колеса — поиск в словаре за O(1).
+- Горячая перезагрузка: изменения файла (mtime/inode/size) отслеживаются в фоне,
+  новый индекс строится в потоке и подменяется одной операцией присваивания.
+- Снимок data/cards.bin (пишется шагом импорта): только нужные боту поля,
+  таблица смещений и готовые корзины. Файл отображается в память (mmap),
+  в памяти процесса — лишь словарь корзин; карточка декодируется при выборе.
+- Для "рядом со мной" — сетка GeoIndex по координатам карточек (язык, interactive),
+  строится при первом запросе по языку.
+- Стабильные номера карточек в корзинах (реестр data/card_handles.json) для
+  колод без повторов (card_deck.py): номер карточки переживает перезагрузку
+  каталога и перезапуск, новые карточки получают следующие номера.
+- Таблицы Уокера для взвешенного выбора (selection.py) строятся по каждой корзине
+  вместе с индексом; веса — из selection_config.json, он перечитывается с каталогом.
+- Объекты из objects_*.json (см. object_index.py) связываются с карточками
+  при построении индекса и перечитываются вместе с ним.
+- Полнотекстовый индекс (card_search.py) строится по языку при первом поиске
+  (CardStore.prepare_search, в пуле потоков), а не при загрузке: старт и память
+  снимка не зависят от поиска. После перезагрузки индекс языка получается из
+  прежнего — по новым, изменённым и удалённым карточкам.
+- Готовые ответы на inline-запросы (card_inline.py) — в LRU индекса.
+"""
+
+import logging
+import json
+import asyncio
+import fcntl
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+from card_search import SearchIndex, card_fingerprint, search_many, tokenize
+from geo_index import GeoIndex
+from metrics import METRICS
+from object_index import OBJECTS_DIR, ObjectIndex, load_objects, object_files
+from selection import SELECTION_CONFIG_PATH, SelectionConfig, build_alias, load_selection_config
+
+CARDS_PATH = Path(__file__).parent / "data" / "cards.json"
+SNAPSHOT_PATH = Path(__file__).parent / "data" / "cards.bin"
+HANDLES_PATH = Path(__file__).parent / "data" / "card_handles.json"
+
+# Ключ города, объединяющий все города языка
+ALL_CITIES = "all"
+
+
+def read_cards(path: Path = CARDS_PATH) -> list:
+    """
+    Считывает карточки из файла, бросая исключение при любой ошибке
+    (файл отсутствует, недописан, не является массивом).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError("cards.json должен быть массивом JSON-объектов!")
+    return data
+
+
+def load_cards(path: Path = CARDS_PATH) -> list:
+    """
+    Считываем ВСЕ карточки из data/cards.json.
+    """
+    if not path.exists():
+        logging.error(f"cards.json not found: {path}")
+        return []
+    try:
+        return read_cards(path)
+    except Exception as e:
+        logging.error(f"Ошибка чтения cards.json: {e}")
+        return []
+
+
+def _write_atomic(path: Path, write, mode: str = "w"):
+    """
+    Пишет файл через write(f) во временный файл рядом, затем os.replace.
+    Читатель видит либо старый, либо новый файл целиком.
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, mode, **({"encoding": "utf-8"} if "b" not in mode else {})) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp создаёт файл с правами 0600: сохраняем права прежнего файла
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+def iter_cards(path: Path = CARDS_PATH, chunk_size: int = 1 << 16):
+    """
+    Потоково читает JSON-массив карточек: в памяти одна карточка и буфер чтения.
+    Бросает ValueError (в т.ч. json.JSONDecodeError), если файл не массив или обрывается.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf, pos = "", 0
+
+        def more() -> bool:
+            nonlocal buf, pos
+            chunk = f.read(chunk_size)
+            buf, pos = buf[pos:] + chunk, 0
+            return bool(chunk)
+
+        def next_char() -> str:
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n":
+                    pos += 1
+                if pos < len(buf) or not more():
+                    return buf[pos] if pos < len(buf) else ""
+
+        if next_char() != "[":
+            raise ValueError("cards.json должен быть массивом JSON-объектов!")
+        pos += 1
+        if next_char() == "]":
+            return
+        while True:
+            next_char()
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                # Значение считается целым, только если за ним уже виден следующий символ
+                complete = end < len(buf)
+            except json.JSONDecodeError:
+                complete = False
+            if not complete:
+                if more():
+                    continue
+                # Файл кончился: значение либо оборвано, либо это не JSON
+                decoder.raw_decode(buf, pos)  # бросит JSONDecodeError с позицией
+                raise ValueError("cards.json обрывается посреди массива")
+            yield item
+            pos = end
+            delimiter = next_char()
+            if delimiter == "]":
+                return
+            if delimiter != ",":
+                raise ValueError(f"cards.json: ожидалась ',' или ']', найдено {delimiter!r}")
+            pos += 1
+
+
+def save_cards(cards, path: Path = CARDS_PATH) -> int:
+    """
+    Атомарно записывает карточки в JSON (в том же виде, что json.dump(indent=2)).
+    cards — список или любой итерируемый источник: пишется по одной карточке.
+    Возвращает число записанных карточек.
+    """
+    written = 0
+
+    def write(f):
+        nonlocal written
+        f.write("[")
+        for card in cards:
+            f.write(",\n  " if written else "\n  ")
+            f.write(json.dumps(card, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+            written += 1
+        f.write("\n]" if written else "]")
+
+    _write_atomic(path, write)
+    return written
+
+
+def file_signature(path: Path):
+    """
+    (mtime_ns, inode, size) файла или None, если файла нет.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+
+def card_city(card: dict) -> str:
+    """
+    Город карточки в нижнем регистре: поле city, иначе location.city / location-строка.
+    """
+    city = card.get("city", "").lower()
+    if city:
+        return city
+    loc = card.get("location", {})
+    if isinstance(loc, dict):
+        return loc.get("city", "").lower()
+    if isinstance(loc, str):
+        return loc.lower()
+    return ""
+
+
+def card_gps(card: dict):
+    """
+    (lat, lng) карточки из location.gps или None.
+    """
+    loc = card.get("location")
+    gps = loc.get("gps") if isinstance(loc, dict) else None
+    if not isinstance(gps, dict):
+        return None
+    lat, lng = gps.get("lat"), gps.get("lng")
+    if type(lat) not in (int, float) or type(lng) not in (int, float):
+        return None
+    return (float(lat), float(lng))
+
+
+def bucket_keys(card: dict) -> list:
+    """
+    Корзины (язык, город, interactive), в которые попадает карточка.
+    """
+    lang = card.get("language", "").lower()
+    city = card_city(card)
+    interactive = card.get("interactive", False) is True
+    keys = [(lang, city, interactive)]
+    if city != ALL_CITIES:
+        keys.append((lang, ALL_CITIES, interactive))
+    return keys
+
+
+def bucket_name(key: tuple) -> str:
+    """
+    Имя корзины "язык|город|0/1" (в снимке, реестре номеров и колодах пользователей).
+    """
+    lang, city, interactive = key
+    return f"{lang}|{city}|{int(interactive)}"
+
+
+def assign_handles(path: Path, bucket_ids: dict) -> dict:
+    """
+    Номера карточек в корзинах: {имя корзины: {id: номер}}.
+
+    Реестр {имя корзины: [id, ...]} (номер — позиция id в списке) только растёт:
+    новые id дописываются в конец, удалённые остаются дырами. Воркеры одного
+    бота обновляют его под flock, так что номер id везде один и тот же.
+    Если реестр не записать, номера новых карточек живут до перезапуска.
+    """
+    path = Path(path)
+    with open(path.with_name(path.name + ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            registry = {}
+            if path.exists():
+                with open(path, "r", encoding="utf-8") as f:
+                    registry = json.load(f)
+            if not isinstance(registry, dict):
+                raise ValueError("ожидается объект {корзина: [id, ...]}")
+        except (OSError, ValueError) as e:
+            # Без реестра колоды пользователей начнутся заново, но бот работает
+            logging.error(f"Реестр номеров карточек {path} не читается, создаём новый: {e}")
+            registry = {}
+        changed = False
+        handles = {}
+        for name, ids in bucket_ids.items():
+            known = registry.setdefault(name, [])
+            numbers = handles[name] = {card_id: h for h, card_id in enumerate(known)}
+            for card_id in ids:
+                if card_id not in numbers:
+                    numbers[card_id] = len(known)
+                    known.append(card_id)
+                    changed = True
+        if changed:
+            try:
+                _write_atomic(path, lambda f: json.dump(registry, f, ensure_ascii=False, separators=(",", ":")))
+            except OSError as e:
+                logging.error(f"Не удалось сохранить реестр номеров карточек {path}: {e}")
+    return handles
+
+
+class CardIndex:
+    """
+    Неизменяемый индекс карточек: корзины (язык, город, interactive) -> кортеж карточек.
+    """
+
+    def __init__(self, cards: list):
+        self.cards = tuple(c for c in cards if isinstance(c, dict))
+        self.count = len(self.cards)
+        self.by_id = {}
+        buckets = {}
+        for c in self.cards:
+            if "id" in c:
+                self.by_id[c["id"]] = c
+            for key in bucket_keys(c):
+                buckets.setdefault(key, []).append(c)
+        self.buckets = {key: tuple(bucket) for key, bucket in buckets.items()}
+        # Готовые к отправке тексты/клавиатуры (см. card_render), живут вместе с индексом
+        self.render_cache = {}
+        self.geo = {}  # (язык, interactive) -> GeoIndex, строится при первом запросе
+        self.objects = ObjectIndex({}, self.has_card)
+        self.handles = {}  # (язык, город, interactive) -> [карточка или None по номеру]
+        self.quiz_handles = {}  # язык -> {id квиза: номер в корзине (язык, "all", квизы)}
+        self.selection = SelectionConfig()
+        self.selectors = {}  # (язык, город, interactive) -> AliasTable или None (веса равны)
+        self.text_indexes = {}  # язык -> SearchIndex, строится при первом поиске
+        self.previous_text = {}  # язык -> SearchIndex прежней версии каталога
+        self.text_lock = threading.Lock()
+        self.tag_vocab = {}  # язык -> токены тегов фактов
+        self.inline_cache = _RenderLRU(INLINE_CACHE_SIZE)
+
+    def describe(self) -> str:
+        return f"{self.count} cards, {len(self.buckets)} buckets, {len(self.objects.objects)} objects"
+
+    def get(self, lang: str, city: str, interactive: bool) -> tuple:
+        return self.buckets.get((lang, city, interactive), ())
+
+    def card_by_id(self, card_id: str):
+        return self.by_id.get(card_id)
+
+    def has_card(self, card_id: str) -> bool:
+        return card_id in self.by_id
+
+    def loaded_card(self, card_id: str):
+        """
+        Карточка по id, если она уже в памяти (весь каталог в памяти — любая).
+        """
+        return self.card_by_id(card_id)
+
+    def bucket_ids(self) -> dict:
+        """
+        {имя корзины: [id карточек]} для реестра номеров.
+        """
+        return {bucket_name(key): [c["id"] for c in bucket if isinstance(c.get("id"), str)]
+                for key, bucket in self.buckets.items()}
+
+    def set_handles(self, handles: dict):
+        """
+        Раскладывает карточки корзин по номерам из assign_handles.
+        """
+        for key, bucket in self.buckets.items():
+            numbers = handles.get(bucket_name(key), {})
+            space = [None] * (max(numbers.values()) + 1 if numbers else 0)
+            for c in bucket:
+                if isinstance(c.get("id"), str):
+                    space[numbers[c["id"]]] = c
+            self.handles[key] = space
+            if key[1] == ALL_CITIES and key[2]:
+                self.quiz_handles[key[0]] = numbers
+
+    def handle_space(self, lang: str, city: str, interactive: bool):
+        """
+        Карточки корзины по стабильным номерам: space[номер] — карточка или None.
+        """
+        return self.handles.get((lang.lower(), city.lower(), interactive), ())
+
+    def _bucket_weights(self, key: tuple, config: SelectionConfig, fresh: bool = True) -> list:
+        """
+        Веса карточек корзины: config.weight, для config.fresh_newest карточек
+        с наибольшими номерами (добавлены последними) — ещё и config.fresh_weight
+        (fresh=False — без поправки на новизну).
+        """
+        newest = config.fresh_newest if fresh and config.fresh_weight != 1.0 else 0
+        space = self.handles.get(key, ())
+        fresh = set()
+        for handle in range(len(space) - 1, -1, -1):
+            if len(fresh) >= newest:
+                break
+            if space[handle] is not None:
+                fresh.add(id(space[handle]))
+        return [config.weight(c) * (config.fresh_weight if id(c) in fresh else 1.0) for c in self.get(*key)]
+
+    def set_selection(self, config: SelectionConfig):
+        """
+        Строит таблицы взвешенного выбора для всех корзин (после set_handles).
+        """
+        self.selection = config
+        self.selectors = {key: build_alias(self._bucket_weights(key, config)) for key in self.buckets}
+
+    def selector(self, lang: str, city: str, interactive: bool):
+        """
+        AliasTable корзины (номер карточки в get(...)) или None — выбирать равномерно.
+        """
+        return self.selectors.get((lang.lower(), city.lower(), interactive))
+
+    def quiz_handle(self, card: dict):
+        """
+        Стабильный номер квиза в корзине (язык, "all", квизы) или None.
+        """
+        return self.quiz_handles.get(card.get("language", "").lower(), {}).get(card.get("id"))
+
+    def quiz_by_handle(self, lang: str, handle: int):
+        space = self.handle_space(lang, ALL_CITIES, True)
+        return space[handle] if 0 <= handle < len(space) else None
+
+    def search_documents(self, lang: str):
+        """
+        (id, отпечаток, ссылка) карточек языка для SearchIndex.updated; карточка — search_card(ссылка).
+        """
+        for card in self.get(lang, ALL_CITIES, False) + self.get(lang, ALL_CITIES, True):
+            card_id = card.get("id")
+            if isinstance(card_id, str) and self.by_id.get(card_id) is card:
+                yield (card_id, card_fingerprint(card), card)
+
+    def search_card(self, ref) -> dict:
+        return ref
+
+    def keep_text_indexes(self, previous: "CardIndex"):
+        """
+        Полнотекстовые индексы прежней версии каталога: из них индекс языка
+        обновится при первом поиске, а не будет построен заново.
+        """
+        self.previous_text = {**previous.previous_text, **previous.text_indexes}
+
+    def text_ready(self, lang: str) -> bool:
+        return lang.lower() in self.text_indexes
+
+    def text_index(self, lang: str) -> SearchIndex:
+        """
+        Полнотекстовый индекс языка; строится при первом обращении (долго —
+        обработчики сначала ждут CardStore.prepare_search).
+        """
+        lang = lang.lower()
+        text = self.text_indexes.get(lang)
+        if text is None:
+            with self.text_lock:
+                text = self.text_indexes.get(lang)
+                if text is None:
+                    previous = self.previous_text.pop(lang, None) or SearchIndex()
+                    text = self.text_indexes[lang] = previous.updated(self.search_documents(lang), self.search_card)
+        return text
+
+    def search_indexes(self, lang: str) -> list:
+        """
+        Полнотекстовые индексы, по которым ищутся карточки языка (у шардов — по одному на шард).
+        """
+        return [self.text_index(lang)]
+
+    def search(self, lang: str, query: str, limit: int) -> list:
+        """
+        До limit карточек языка, лучше всего подходящих под запрос.
+        """
+        found = search_many(self.search_indexes(lang), lang.lower(), query, limit)
+        cards = (self.card_by_id(card_id) for _, card_id in found)
+        return [card for card in cards if card is not None]
+
+    def _fact_tags(self, lang: str):
+        return (card.get("tags") for card in self.get(lang, ALL_CITIES, False))
+
+    def tag_tokens(self, lang: str) -> frozenset:
+        """
+        Токены (card_search.tokenize) тегов фактов языка: по ним слово запроса узнаётся как тег.
+        """
+        vocab = self.tag_vocab.get(lang)
+        if vocab is None:
+            vocab = self.tag_vocab[lang] = frozenset(
+                token for tags in self._fact_tags(lang) if isinstance(tags, list)
+                for tag in tags if isinstance(tag, str) for token in tokenize(tag)
+            )
+        return vocab
+
+    def facts_and_quizzes(self, lang: str, city: str) -> (tuple, tuple):
+        """
+        Факты и квизы для языка и города (city="all" — все города языка).
+        """
+        lang = lang.lower()
+        city = city.lower()
+        return (self.get(lang, city, False), self.get(lang, city, True))
+
+    def _geo_points(self, lang: str, interactive: bool):
+        for card in self.get(lang, ALL_CITIES, interactive):
+            gps = card_gps(card)
+            if gps is not None:
+                yield (card, gps[0], gps[1])
+
+    def geo_index(self, lang: str, interactive: bool) -> GeoIndex:
+        key = (lang, interactive)
+        geo = self.geo.get(key)
+        if geo is None:
+            geo = self.geo[key] = GeoIndex(self._geo_points(lang, interactive))
+        return geo
+
+    def near(self, lang: str, lat: float, lng: float, radius_km: float, limit: int) -> (list, list):
+        """
+        До limit ближайших фактов и квизов языка в радиусе radius_km от точки.
+        """
+        lang = lang.lower()
+        return tuple(
+            [card for _, card in self.geo_index(lang, interactive).nearest(lat, lng, limit, radius_km)]
+            for interactive in (False, True)
+        )
+
+# ---------------------------
+# Снимок каталога (data/cards.bin)
+# ---------------------------
+# Формат (целые — little-endian):
+#   SNAPSHOT_MAGIC | u32 длина заголовка | заголовок JSON | выравнивание до 8 байт | секции
+# Заголовок: число карточек, подпись cards.json, из которого собран снимок,
+# корзины "язык|город|0/1" -> [начало, длина] в секции positions и смещения секций:
+#   offsets      u64[count + 1] — границы карточек в data
+#   positions    u32[]          — номера карточек, корзина за корзиной
+#   id_offsets   u32[k + 1]     — границы id в id_blob (id отсортированы)
+#   id_positions u32[k]         — номер карточки для каждого id
+#   gps          f64[2 * count] — широта и долгота карточки (NaN, если координат нет)
+#   features     u32[count]     — номер набора (reality, tags, boost) карточки в заголовке
+#                                 "features": веса выбора считаются без декодирования карточек
+#   id_blob, data               — UTF-8: id подряд и карточки компактным JSON
+SNAPSHOT_MAGIC = b"WWCARDS1"
+SNAPSHOT_VERSION = 4
+
+# Поля, которые читает бот; routes, explanation и прочее в снимок не попадают
+# (reality, tags и boost для весов выбора — в таблице features; tags и persons — ещё и для поиска)
+SNAPSHOT_FIELDS = ("id", "interactive", "language", "city", "icon", "title", "text",
+                   "location", "question", "options", "correct_index", "tags", "persons")
+
+# Поля карточки, от которых зависит её вес при выборе (selection.py)
+WEIGHT_FIELDS = ("reality", "tags", "boost")
+
+# Сколько отрендеренных карточек снимка держать в памяти
+SNAPSHOT_RENDER_CACHE = 2048
+# Сколько готовых ответов на inline-запросы держать в памяти
+INLINE_CACHE_SIZE = 4096
+
+_HEADER_PREFIX = struct.Struct("<8sI")
+
+
+def _align8(n: int) -> int:
+    return n + (-n % 8)
+
+
+def _le_bytes(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def write_snapshot(cards, path: Path = SNAPSHOT_PATH, source_path: Path = CARDS_PATH):
+    """
+    Атомарно пишет снимок рядом с только что сохранённым cards.json.
+    cards — любой итерируемый источник (список или iter_cards): тексты карточек
+    копятся во временном файле, в памяти — только таблицы смещений и корзин.
+    """
+    path = Path(path)
+    source = file_signature(source_path)
+    offsets = array("Q", [0])
+    gps = array("d")
+    features = array("I")
+    feature_table = {}
+    buckets = {}
+    ids = {}
+    count = 0
+    with tempfile.TemporaryFile(dir=path.parent) as spool:
+        for c in cards:
+            if not isinstance(c, dict):
+                continue
+            blob = json.dumps({k: c[k] for k in SNAPSHOT_FIELDS if k in c}, ensure_ascii=False,
+                              separators=(",", ":")).encode("utf-8")
+            spool.write(blob)
+            offsets.append(offsets[-1] + len(blob))
+            gps.extend(card_gps(c) or (math.nan, math.nan))
+            feature = json.dumps([c.get(k) for k in WEIGHT_FIELDS], ensure_ascii=False)
+            features.append(feature_table.setdefault(feature, len(feature_table)))
+            for key in bucket_keys(c):
+                if key not in buckets:
+                    buckets[key] = array("I")
+                buckets[key].append(count)
+            if isinstance(c.get("id"), str):
+                ids[c["id"]] = count  # как в CardIndex.by_id: при повторе id побеждает последняя
+            count += 1
+
+        positions = array("I")
+        bucket_table = {}
+        for key, members in buckets.items():
+            bucket_table[bucket_name(key)] = [len(positions), len(members)]
+            positions.extend(members)
+
+        id_offsets = array("I", [0])
+        id_positions = array("I")
+        encoded_ids = []
+        for card_id in sorted(ids):
+            encoded = card_id.encode("utf-8")
+            encoded_ids.append(encoded)
+            id_offsets.append(id_offsets[-1] + len(encoded))
+            id_positions.append(ids[card_id])
+
+        tables = [
+            ("offsets", _le_bytes(offsets)),
+            ("positions", _le_bytes(positions)),
+            ("id_offsets", _le_bytes(id_offsets)),
+            ("id_positions", _le_bytes(id_positions)),
+            ("gps", _le_bytes(gps)),
+            ("features", _le_bytes(features)),
+            ("id_blob", b"".join(encoded_ids)),
+        ]
+        layout = {}
+        size = 0
+        for name, data in tables + [("data", None)]:
+            length = offsets[-1] if data is None else len(data)
+            layout[name] = [size, length]
+            size = _align8(size + length)
+        header = json.dumps({
+            "version": SNAPSHOT_VERSION,
+            "count": count,
+            "source": list(source) if source else None,
+            "buckets": bucket_table,
+            "features": [json.loads(feature) for feature in feature_table],
+            "sections": layout,
+        }, ensure_ascii=False).encode("utf-8")
+        head = _HEADER_PREFIX.pack(SNAPSHOT_MAGIC, len(header)) + header
+
+        def write(f):
+            f.write(head + b"\0" * (_align8(len(head)) - len(head)))
+            for _, data in tables:
+                f.write(data + b"\0" * (-len(data) % 8))
+            spool.seek(0)
+            shutil.copyfileobj(spool, f)
+
+        _write_atomic(path, write, mode="wb")
+
+
+class _RenderLRU(OrderedDict):
+    """
+    LRU-словарь: render_cache снимка (только недавно показанные карточки)
+    и inline_cache индекса.
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def get(self, key, default=None):
+        value = super().get(key, default)
+        if value is not default:
+            self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+class _LazyBucket:
+    """
+    Корзина снимка: последовательность карточек, декодируемых при обращении.
+    """
+
+    __slots__ = ("index", "positions")
+
+    def __init__(self, index: "SnapshotIndex", positions):
+        self.index = index
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i: int) -> dict:
+        return self.index.card_at(self.positions[i])
+
+    def __iter__(self):
+        return (self.index.card_at(pos) for pos in self.positions)
+
+
+class _LazyHandleSpace(_LazyBucket):
+    """
+    Номера корзины снимка: positions[номер] — номер карточки в снимке или -1.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, i: int):
+        pos = self.positions[i]
+        return None if pos < 0 else self.index.card_at(pos)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self.positions)))
+
+
+class SnapshotIndex(CardIndex):
+    """
+    Индекс поверх отображённого в память снимка. Интерфейс CardIndex
+    (get, facts_and_quizzes, card_by_id); корзины — _LazyBucket.
+    """
+
+    def __init__(self, path: Path = SNAPSHOT_PATH):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_len = _HEADER_PREFIX.unpack_from(self.mm, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path}: не снимок карточек")
+        header = json.loads(self.mm[_HEADER_PREFIX.size:_HEADER_PREFIX.size + header_len])
+        if header.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"{path}: неподдерживаемая версия снимка {header.get('version')}")
+        base = _align8(_HEADER_PREFIX.size + header_len)
+        view = memoryview(self.mm)
+
+        def section(name: str, typecode: str = None):
+            start, size = header["sections"][name]
+            data = view[base + start:base + start + size]
+            if typecode is None:
+                return data
+            if sys.byteorder == "little":
+                return data.cast(typecode)
+            values = array(typecode, data.tobytes())
+            values.byteswap()
+            return values
+
+        self.source = tuple(header["source"]) if header.get("source") else None
+        self.count = header["count"]
+        self.offsets = section("offsets", "Q")
+        self.id_offsets = section("id_offsets", "I")
+        self.id_positions = section("id_positions", "I")
+        self.gps = section("gps", "d")
+        self.features = section("features", "I")
+        self.feature_table = [dict(zip(WEIGHT_FIELDS, values)) for values in header["features"]]
+        self.id_blob = section("id_blob")
+        self.data = section("data")
+        positions = section("positions", "I")
+        self.buckets = {}
+        for key, (start, length) in header["buckets"].items():
+            lang, city, interactive = key.split("|")
+            self.buckets[(lang, city, interactive == "1")] = _LazyBucket(self, positions[start:start + length])
+        self.render_cache = _RenderLRU(SNAPSHOT_RENDER_CACHE)
+        self.geo = {}
+        self.objects = ObjectIndex({}, self.has_card)
+        self.handles = {}
+        self.quiz_handles = {}
+        self.selection = SelectionConfig()
+        self.selectors = {}
+        self.text_indexes = {}  # язык -> SearchIndex, строится при первом поиске
+        self.previous_text = {}  # язык -> SearchIndex прежней версии каталога
+        self.text_lock = threading.Lock()
+        self.tag_vocab = {}
+        self.inline_cache = _RenderLRU(INLINE_CACHE_SIZE)
+
+    def _geo_points(self, lang: str, interactive: bool):
+        # Координаты берутся из таблицы gps: карточки не декодируются
+        bucket = self.get(lang, ALL_CITIES, interactive)
+        for pos in (bucket.positions if bucket else ()):
+            lat, lng = self.gps[2 * pos], self.gps[2 * pos + 1]
+            if not math.isnan(lat):
+                yield (pos, lat, lng)
+
+    def near(self, lang: str, lat: float, lng: float, radius_km: float, limit: int) -> (list, list):
+        lang = lang.lower()
+        return tuple(
+            _LazyBucket(self, [pos for _, pos in
+                               self.geo_index(lang, interactive).nearest(lat, lng, limit, radius_km)])
+            for interactive in (False, True)
+        )
+
+    def _card_ids(self) -> list:
+        """
+        id по номеру карточки в снимке (None для карточки без id или с повторным id).
+        """
+        ids = [None] * self.count
+        for rank, pos in enumerate(self.id_positions):
+            ids[pos] = bytes(self.id_blob[self.id_offsets[rank]:self.id_offsets[rank + 1]]).decode("utf-8")
+        return ids
+
+    def bucket_ids(self) -> dict:
+        # Читаются только таблицы id и корзин: карточки не декодируются
+        ids = self._card_ids()
+        return {bucket_name(key): [ids[pos] for pos in bucket.positions if ids[pos] is not None]
+                for key, bucket in self.buckets.items()}
+
+    def set_handles(self, handles: dict):
+        ids = self._card_ids()
+        for key, bucket in self.buckets.items():
+            numbers = handles.get(bucket_name(key), {})
+            space = array("i", [-1]) * (max(numbers.values()) + 1 if numbers else 0)
+            for pos in bucket.positions:
+                if ids[pos] is not None:
+                    space[numbers[ids[pos]]] = pos
+            self.handles[key] = _LazyHandleSpace(self, space)
+            if key[1] == ALL_CITIES and key[2]:
+                self.quiz_handles[key[0]] = numbers
+
+    def _bucket_weights(self, key: tuple, config: SelectionConfig, fresh: bool = True) -> list:
+        # Вес считается один раз на набор (reality, tags, boost), карточки не декодируются
+        by_feature = [config.weight(feature) for feature in self.feature_table]
+        newest = config.fresh_newest if fresh and config.fresh_weight != 1.0 else 0
+        space = self.handles.get(key)
+        fresh = set()
+        for pos in reversed(space.positions if space is not None else ()):
+            if len(fresh) >= newest:
+                break
+            if pos >= 0:
+                fresh.add(pos)
+        return [by_feature[self.features[pos]] * (config.fresh_weight if pos in fresh else 1.0)
+                for pos in self.get(*key).positions]
+
+    def search_documents(self, lang: str):
+        # Отпечаток — по байтам карточки в снимке: декодируются только новые и изменённые
+        positions = set()
+        for interactive in (False, True):
+            bucket = self.get(lang, ALL_CITIES, interactive)
+            positions.update(bucket.positions if bucket else ())
+        for rank, pos in enumerate(self.id_positions):
+            if pos not in positions:
+                continue
+            card_id = bytes(self.id_blob[self.id_offsets[rank]:self.id_offsets[rank + 1]]).decode("utf-8")
+            yield (card_id, hash(bytes(self.data[self.offsets[pos]:self.offsets[pos + 1]])), pos)
+
+    def search_card(self, ref) -> dict:
+        return self.card_at(ref)
+
+    def _fact_tags(self, lang: str):
+        # Теги — из таблицы features: карточки не декодируются
+        bucket = self.get(lang, ALL_CITIES, False)
+        return (self.feature_table[self.features[pos]].get("tags") for pos in (bucket.positions if bucket else ()))
+
+    def card_at(self, pos: int) -> dict:
+        return json.loads(bytes(self.data[self.offsets[pos]:self.offsets[pos + 1]]))
+
+    def _id_position(self, card_id: str):
+        """
+        Номер карточки по id: двоичный поиск по отсортированным id (сравнение
+        байтов UTF-8 совпадает с порядком строк Python). None, если id нет.
+        """
+        key = card_id.encode("utf-8")
+        lo, hi = 0, len(self.id_positions)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found = bytes(self.id_blob[self.id_offsets[mid]:self.id_offsets[mid + 1]])
+            if found < key:
+                lo = mid + 1
+            elif found > key:
+                hi = mid
+            else:
+                return self.id_positions[mid]
+        return None
+
+    def card_by_id(self, card_id: str):
+        pos = self._id_position(card_id)
+        return None if pos is None else self.card_at(pos)
+
+    def has_card(self, card_id: str) -> bool:
+        return self._id_position(card_id) is not None
+
+
+class CardStore:
+    """
+    Держит текущий индекс карточек: из снимка cards.bin, если он собран из
+    текущей версии cards.json, иначе CardIndex из самого cards.json.
+
+    Обработчики берут ссылку store.index один раз и работают с ней до конца:
+    индекс неизменяем, а перезагрузка лишь подменяет ссылку на новый.
+    """
+
+    def __init__(self, path: Path = CARDS_PATH, snapshot_path: Path = SNAPSHOT_PATH,
+                 objects_dir: Path = OBJECTS_DIR, handles_path: Path = HANDLES_PATH,
+                 selection_path: Path = SELECTION_CONFIG_PATH):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.objects_dir = objects_dir
+        self.handles_path = handles_path
+        self.selection_path = selection_path
+        self.index = CardIndex([])
+        self.signature = None
+        self.bad_signature = None  # версия файлов, которую не удалось прочитать
+
+    def _signature(self):
+        return (file_signature(self.path),
+                file_signature(self.snapshot_path) if self.snapshot_path is not None else None,
+                tuple((p.name, file_signature(p)) for p in object_files(self.objects_dir)),
+                file_signature(self.selection_path))
+
+    def _read_index(self) -> CardIndex:
+        """
+        Строит индекс вместе с номерами карточек, таблицами выбора и графом объектов,
+        бросая исключение, если карточки не читаются.
+        """
+        index = self._read_cards()
+        if self.handles_path is not None:
+            index.set_handles(assign_handles(self.handles_path, index.bucket_ids()))
+        index.set_selection(load_selection_config(self.selection_path))
+        index.objects = ObjectIndex(load_objects(self.objects_dir), index.has_card)
+        index.keep_text_indexes(self.index)
+        return index
+
+    def _read_cards(self) -> CardIndex:
+        source = file_signature(self.path)
+        if self.snapshot_path is not None and file_signature(self.snapshot_path) is not None:
+            try:
+                index = SnapshotIndex(self.snapshot_path)
+            except Exception as e:
+                logging.warning(f"Снимок {self.snapshot_path} не читается, используем cards.json: {e}")
+            else:
+                if source is None or index.source == source:
+                    return index
+                logging.info("Снимок карточек собран из другой версии cards.json, используем cards.json")
+        return CardIndex(read_cards(self.path))
+
+    def load(self) -> CardIndex:
+        self.signature = self._signature()
+        with METRICS.timer("card_load"):
+            try:
+                self.index = self._read_index()
+            except Exception as e:
+                logging.error(f"Ошибка чтения карточек: {e}")
+                self.index = CardIndex([])
+        logging.info(f"Card index built ({type(self.index).__name__}): {self.index.describe()}")
+        return self.index
+
+    def changed(self) -> bool:
+        return self._signature() not in (self.signature, self.bad_signature)
+
+    async def prepare(self, lang: str, city: str):
+        """
+        Загружает карточки языка и города до обращения к индексу. Весь каталог
+        уже в памяти — ничего не делает (см. card_shards.ShardedCardStore).
+        """
+
+    async def prepare_search(self, lang: str):
+        """
+        Строит полнотекстовый индекс языка в пуле потоков, если его ещё нет.
+        """
+        index = self.index
+        if not index.text_ready(lang):
+            await asyncio.get_event_loop().run_in_executor(None, index.search_indexes, lang)
+
+    def reload(self) -> bool:
+        """
+        Перестраивает индекс, если файлы изменились. Недописанный или битый файл
+        не применяется: остаётся старый индекс, попытка повторится позже.
+        """
+        signature = self._signature()
+        if signature[:2] == (None, None) or signature in (self.signature, self.bad_signature):
+            return False
+        start = time.perf_counter()
+        try:
+            index = self._read_index()
+        except Exception as e:
+            self.bad_signature = signature
+            logging.warning(f"cards.json изменён, но не читается (ждём следующей проверки): {e}")
+            return False
+        if self._signature() != signature:
+            # Файл переписывали, пока мы его читали
+            return False
+        self.index = index
+        self.signature = signature
+        METRICS.observe("card_load", (time.perf_counter() - start) * 1000)
+        logging.info(f"Card index reloaded ({type(index).__name__}): {index.describe()}")
+        return True
+
+    async def watch(self, interval: float):
+        """
+        Фоновая задача: раз в interval секунд проверяет stat() файлов и
+        при изменении перестраивает индекс в пуле потоков.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if not self.changed():
+                continue
+            try:
+                await loop.run_in_executor(None, self.reload)
+            except Exception as e:
+                logging.error(f"Ошибка перезагрузки карточек: {e}")
@@ -0,0 +1,316 @@
+"""
+check_selection.py
+
+Проверка выбора карточки при вращении колеса так, как его делает бот.
+
+- Из каталога data/cards.json во временном каталоге собираются все три вида
+  индекса: CardIndex (cards.json), SnapshotIndex (cards.bin) и ShardedCardIndex
+  (шарды regions_config.json) — через CardStore/ShardedCardStore, с реестром
+  номеров и таблицами выбора, как при запуске бота.
+- Выборки идут тем же путём, что в main.spin_wheel: card_deck.pick_kind
+  (факт или квиз), затем card_deck.choose_card (таблица Уокера или колода);
+  "рядом со мной" (main.spin_near) — pick_kind и card_deck.choose_near по
+  спискам ближайших карточек к точке первой карточки языка с координатами.
+- Ожидаемые вероятности считаются здесь же — по полям карточек, JSON
+  конфигурации выбора и реестру номеров (свежесть), без selection.py.
+  Частоты карточек языка и города (факты и квизы вместе) сравниваются с ними
+  критерием хи-квадрат, доля квизов — z-критерием.
+- Конфигурации: selection_config.json (обычно равные веса — колода без повторов)
+  и CHECK_CONFIG с весами reality, тегов, boost и свежести. Для boost части
+  карточек временного каталога задан собственный множитель.
+- AliasTable на синтетических весах: равные, с нулями, с большим разбросом, один элемент.
+
+Запуск: python check_selection.py [выборок_на_проверку] [путь_к_selection_config.json]
+Код возврата 1, если хотя бы одна проверка не прошла. Выборки детерминированы
+(random.Random(7)); Dockerfile запускает проверку при сборке образа.
+"""
+
+import json
+import math
+import random
+import shutil
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+from card_deck import choose_card, choose_near, pick_kind
+from card_shards import REGIONS_CONFIG_PATH, ShardedCardStore, load_regions, write_shards
+from card_store import ALL_CITIES, CARDS_PATH, CardStore, bucket_name, card_city, read_cards, save_cards, write_snapshot
+from selection import SELECTION_CONFIG_PATH, AliasTable
+from user_state import UserState
+
+# Уровень значимости критерия: 1e-3 при нескольких десятках проверок почти исключает ложную тревогу
+Z_CRITICAL = 3.09
+
+# Веса, при которых корзины выбираются по таблицам Уокера
+CHECK_CONFIG = {
+    "kinds": {"fact": 70, "quiz": 30},
+    "reality": {"fact": 1.0, "legend": 3.0},
+    "tags": {"история": 2.0, "history": 2.0, "历史": 2.0, "архитектура": 0.5, "революция": 0},
+    "freshness": {"newest": 3, "weight": 4.0},
+}
+# Каждой BOOST_EVERY-й карточке временного каталога — boost BOOST
+BOOST_EVERY = 7
+BOOST = 2.5
+# "Рядом со мной": радиус и число ближайших карточек (как NEAR_RADIUS_KM и NEAR_LIMIT в main.py)
+NEAR_RADIUS_KM = 5.0
+NEAR_LIMIT = 10
+
+
+def chi2_critical(df: int) -> float:
+    """
+    Критическое значение хи-квадрат (аппроксимация Уилсона — Хилферти).
+    """
+    h = 2.0 / (9 * df)
+    return df * (1 - h + Z_CRITICAL * math.sqrt(h)) ** 3
+
+
+def chi2_test(name: str, expected: dict, counts: Counter, samples: int) -> bool:
+    """
+    expected — {ключ: вероятность}, counts — наблюдённые частоты.
+    """
+    unexpected = sum(n for key, n in counts.items() if not expected.get(key))
+    if unexpected:
+        print(f"FAIL {name}: {unexpected} выборок карточек с нулевой вероятностью")
+        return False
+    chi2 = 0.0
+    df = -1
+    for key, p in expected.items():
+        if p > 0:
+            chi2 += (counts[key] - samples * p) ** 2 / (samples * p)
+            df += 1
+    if df == 0:
+        print(f"ok   {name}: единственная карточка")
+        return True
+    limit = chi2_critical(df)
+    ok = chi2 <= limit
+    print(f"{'ok  ' if ok else 'FAIL'} {name}: chi2={chi2:.1f} (df={df}, предел {limit:.1f})")
+    return ok
+
+
+def check_weights(name: str, weights: list, samples: int, rng: random.Random) -> bool:
+    table = AliasTable(weights)
+    counts = Counter(table.sample(rng) for _ in range(samples))
+    total = sum(weights)
+    return chi2_test(name, {i: w / total for i, w in enumerate(weights)}, counts, samples)
+
+
+def check_share(name: str, observed: int, share: float, samples: int) -> bool:
+    sigma = math.sqrt(samples * share * (1 - share))
+    z = abs(observed - samples * share) / sigma if sigma else float(observed != samples * share)
+    ok = z <= Z_CRITICAL
+    print(f"{'ok  ' if ok else 'FAIL'} {name}: {observed / samples:.4f} при ожидаемых {share:.4f} (z={z:.2f})")
+    return ok
+
+
+# ---------------------------
+# Ожидаемые вероятности (независимо от selection.py)
+# ---------------------------
+
+def card_weight(card: dict, config: dict) -> float:
+    reality = {k.lower(): float(v) for k, v in config.get("reality", {}).items()}
+    tags = {k.lower(): float(v) for k, v in config.get("tags", {}).items()}
+    w = reality.get(str(card.get("reality", "")).lower(), 1.0)
+    for tag in card.get("tags") or ():
+        w *= tags.get(str(tag).lower(), 1.0)
+    boost = card.get("boost", 1.0)
+    if type(boost) in (int, float) and boost >= 0:
+        w *= boost
+    return w
+
+
+def bucket_probabilities(cards: list, name: str, config: dict, registry: dict) -> dict:
+    """
+    {id: вероятность} карточек одной корзины: вес карточки, свежим (последние
+    freshness.newest по реестру номеров корзины) — ещё и freshness.weight.
+    Все веса равны (или нулевые) — выбор равномерный.
+    """
+    freshness = config.get("freshness", {})
+    present = {card["id"] for card in cards}
+    order = [card_id for card_id in registry.get(name, ()) if card_id in present]
+    newest = int(freshness.get("newest", 0))
+    fresh = set(order[len(order) - newest:]) if newest > 0 else set()
+    weights = {card["id"]: card_weight(card, config) * (float(freshness.get("weight", 1.0))
+                                                        if card["id"] in fresh else 1.0)
+               for card in cards}
+    if len(set(weights.values())) <= 1 or sum(weights.values()) <= 0:
+        return {card_id: 1.0 / len(weights) for card_id in weights}
+    total = sum(weights.values())
+    return {card_id: w / total for card_id, w in weights.items()}
+
+
+def expected_quiz_share(config: dict, facts: list, quizzes: list) -> float:
+    kinds = config.get("kinds", {})
+    fact, quiz = float(kinds.get("fact", 80)), float(kinds.get("quiz", 20))
+    if not facts:
+        return 1.0
+    if not quizzes:
+        return 0.0
+    return quiz / (fact + quiz)
+
+
+def spin_probabilities(cards: list, lang: str, city: str, config: dict, registry: dict) -> (dict, float):
+    """
+    ({id: вероятность вытянуть при вращении}, доля квизов) для языка и города.
+    """
+    chosen = {}
+    for interactive in (False, True):
+        chosen[interactive] = [c for c in cards if c.get("language", "").lower() == lang
+                               and (c.get("interactive", False) is True) == interactive
+                               and (city == ALL_CITIES or card_city(c) == city)]
+    quiz_share = expected_quiz_share(config, chosen[False], chosen[True])
+    expected = {}
+    for interactive, share in ((False, 1 - quiz_share), (True, quiz_share)):
+        if chosen[interactive] and share > 0:
+            name = bucket_name((lang, city, interactive))
+            for card_id, p in bucket_probabilities(chosen[interactive], name, config, registry).items():
+                expected[card_id] = share * p
+    return (expected, quiz_share)
+
+
+def near_probabilities(facts: list, quizzes: list, config: dict) -> (dict, float):
+    """
+    ({id: вероятность}, доля квизов) для списков ближайших карточек: веса без
+    свежести, равные (или нулевые) веса — равномерный выбор.
+    """
+    quiz_share = expected_quiz_share(config, facts, quizzes)
+    expected = {}
+    for near, share in ((facts, 1 - quiz_share), (quizzes, quiz_share)):
+        if not near or share <= 0:
+            continue
+        weights = [card_weight(card, config) for card in near]
+        if len(set(weights)) <= 1 or sum(weights) <= 0:
+            weights = [1.0] * len(near)
+        total = sum(weights)
+        for card, w in zip(near, weights):
+            expected[card["id"]] = expected.get(card["id"], 0.0) + share * w / total
+    return (expected, quiz_share)
+
+
+# ---------------------------
+# Выборки через индексы бота
+# ---------------------------
+
+def check_index(label: str, index, cards: list, config: dict, handles_path: Path, samples: int,
+                rng: random.Random) -> list:
+    results = []
+    langs = sorted({c.get("language", "").lower() for c in cards})
+    for lang in langs:
+        cities = sorted({card_city(c) for c in cards if c.get("language", "").lower() == lang}) + [ALL_CITIES]
+        for city in cities:
+            facts, quizzes = index.facts_and_quizzes(lang, city)
+            if not facts and not quizzes:
+                continue
+            state = UserState()
+            counts = Counter()
+            quiz_count = 0
+            for _ in range(samples):
+                interactive = pick_kind(rng.random(), facts, quizzes, index.selection.quiz_share)
+                card = choose_card(state, index, lang, city, interactive, quizzes if interactive else facts, rng)
+                counts[card["id"]] += 1
+                quiz_count += interactive
+            # Реестр читается после выборок: шарды дописывают в него номера при загрузке
+            with open(handles_path, "r", encoding="utf-8") as f:
+                registry = json.load(f)
+            expected, quiz_share = spin_probabilities(cards, lang, city, config, registry)
+            name = f"{label} {lang}|{city}"
+            results.append(check_share(f"{name} доля квизов", quiz_count, quiz_share, samples))
+            results.append(chi2_test(f"{name} карточки", expected, counts, samples))
+    results += check_near(label, index, cards, config, samples, rng)
+    return results
+
+
+def card_gps(card: dict):
+    loc = card.get("location")
+    gps = loc.get("gps") if isinstance(loc, dict) else None
+    return gps if isinstance(gps, dict) and "lat" in gps and "lng" in gps else None
+
+
+def check_near(label: str, index, cards: list, config: dict, samples: int, rng: random.Random) -> list:
+    results = []
+    for lang in sorted({c.get("language", "").lower() for c in cards}):
+        located = sorted((c for c in cards if c.get("language", "").lower() == lang and card_gps(c)),
+                         key=lambda c: c["id"])
+        if not located:
+            continue
+        gps = card_gps(located[0])
+        facts, quizzes = index.near(lang, gps["lat"], gps["lng"], NEAR_RADIUS_KM, NEAR_LIMIT)
+        facts, quizzes = list(facts), list(quizzes)
+        counts = Counter()
+        quiz_count = 0
+        for _ in range(samples):
+            interactive = pick_kind(rng.random(), facts, quizzes, index.selection.quiz_share)
+            counts[choose_near(index, quizzes if interactive else facts, rng)["id"]] += 1
+            quiz_count += interactive
+        expected, quiz_share = near_probabilities(facts, quizzes, config)
+        name = f"{label} рядом {lang} ({len(facts)} фактов, {len(quizzes)} квизов)"
+        results.append(check_share(f"{name} доля квизов", quiz_count, quiz_share, samples))
+        results.append(chi2_test(f"{name} карточки", expected, counts, samples))
+    return results
+
+
+def check_config(label: str, config: dict, cards: list, samples: int, rng: random.Random) -> list:
+    results = []
+    with tempfile.TemporaryDirectory(prefix="ww-check-") as tmp:
+        tmp = Path(tmp)
+        cards_path, snapshot_path, selection_path = tmp / "cards.json", tmp / "cards.bin", tmp / "selection.json"
+        save_cards(cards, cards_path)
+        with open(selection_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False)
+        write_snapshot(cards, snapshot_path, cards_path)
+        regions_path = tmp / REGIONS_CONFIG_PATH.name
+        shutil.copy(REGIONS_CONFIG_PATH, regions_path)
+        regions = load_regions(regions_path)
+        write_shards(cards, regions)
+        # В шардах — только города regions_config.json
+        sharded_cards = [c for c in cards if (c.get("language", "").lower(), card_city(c)) in regions]
+
+        stores = (
+            ("CardIndex", CardStore(cards_path, None, handles_path=tmp / "handles_json.json",
+                                    selection_path=selection_path), cards, tmp / "handles_json.json"),
+            ("SnapshotIndex", CardStore(cards_path, snapshot_path, handles_path=tmp / "handles_bin.json",
+                                        selection_path=selection_path), cards, tmp / "handles_bin.json"),
+            ("ShardedCardIndex", ShardedCardStore(regions_path, handles_path=tmp / "handles_shards.json",
+                                                  selection_path=selection_path),
+             sharded_cards, tmp / "handles_shards.json"),
+        )
+        for name, store, store_cards, handles_path in stores:
+            index = store.load()
+            if type(index).__name__ != name:
+                print(f"FAIL {label} {name}: собран {type(index).__name__}")
+                results.append(False)
+                continue
+            results += check_index(f"{label} {name}", index, store_cards, config, handles_path, samples, rng)
+    return results
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    config_path = Path(sys.argv[2]) if len(sys.argv) > 2 else SELECTION_CONFIG_PATH
+    rng = random.Random(7)
+    results = [
+        check_weights("равные веса", [1.0] * 10, samples, rng),
+        check_weights("веса с нулями", [0, 3, 0, 1, 5, 0.5], samples, rng),
+        check_weights("разброс 1:1000", [1000] + [1] * 50, samples, rng),
+        check_weights("случайные веса", [rng.random() for _ in range(200)], samples, rng),
+        check_weights("один элемент", [2.5], 1000, rng),
+    ]
+
+    cards = [c for c in read_cards(CARDS_PATH) if isinstance(c, dict) and isinstance(c.get("id"), str)]
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+    results += check_config(config_path.name, config, cards, samples, rng)
+    boosted = [dict(c, boost=BOOST) if i % BOOST_EVERY == 0 else c for i, c in enumerate(cards)]
+    results += check_config("CHECK_CONFIG", CHECK_CONFIG, boosted, samples, rng)
+
+    failed = results.count(False)
+    print(f"Проверок: {len(results)}, не прошло: {failed}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
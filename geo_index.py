@@ -0,0 +1,142 @@
+"""
+geo_index.py
+
+Пространственный индекс точек (карточек) для выборки "рядом со мной".
+
+- Равномерная сетка по широте/долготе: ячейка CELL_DEG x CELL_DEG градусов,
+  в ячейке — номера точек. Строится один раз, дальше не меняется.
+- Запрос по радиусу просматривает только ячейки, покрывающие окружность;
+  запрос k ближайших — кольца ячеек вокруг точки, пока они могут дать точку
+  ближе уже найденных. Время запроса зависит от плотности точек вокруг
+  пользователя, а не от размера каталога.
+"""
+
+import math
+from array import array
+
+KM_PER_DEG_LAT = 111.32
+
+# Размер ячейки сетки в градусах (~2 км по широте)
+CELL_DEG = 0.02
+
+
+def km_per_deg_lng(lat: float) -> float:
+    return KM_PER_DEG_LAT * max(0.01, math.cos(math.radians(lat)))
+
+
+def local_distance_km(lat0: float, lng0: float, lat: float, lng: float) -> float:
+    """
+    Расстояние от (lat0, lng0) в локальной равнопромежуточной проекции вокруг неё:
+    на радиусах в десятки километров отличается от расстояния по большому кругу
+    на доли процента и не требует тригонометрии на каждую точку.
+    """
+    dy = (lat - lat0) * KM_PER_DEG_LAT
+    dx = (lng - lng0) * km_per_deg_lng(lat0)
+    return math.sqrt(dx * dx + dy * dy)
+
+
+class GeoIndex:
+    """
+    Неизменяемый индекс точек: items[i] — произвольный ключ (карточка или её номер),
+    lats[i] / lngs[i] — её координаты. Расстояния — local_distance_km.
+    """
+
+    def __init__(self, points, cell_deg: float = CELL_DEG):
+        self.cell_deg = cell_deg
+        self.items = []
+        self.lats = array("d")
+        self.lngs = array("d")
+        cells = {}
+        for item, lat, lng in points:
+            i = len(self.items)
+            self.items.append(item)
+            self.lats.append(lat)
+            self.lngs.append(lng)
+            cells.setdefault(self._cell(lat, lng), array("I")).append(i)
+        self.cells = cells
+
+    def __len__(self):
+        return len(self.items)
+
+    def _cell(self, lat: float, lng: float) -> (int, int):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def _scan(self, members, lat: float, lng: float, kx: float, radius_km: float, found: list):
+        # kx — км на градус долготы у точки запроса (см. local_distance_km)
+        lats, lngs = self.lats, self.lngs
+        r2 = radius_km * radius_km
+        for i in members:
+            dy = (lats[i] - lat) * KM_PER_DEG_LAT
+            dx = (lngs[i] - lng) * kx
+            d2 = dx * dx + dy * dy
+            if d2 <= r2:
+                found.append((d2, i))
+
+    def within(self, lat: float, lng: float, radius_km: float) -> list:
+        """
+        [(расстояние_км, item)] для точек в радиусе radius_km, ближние первыми.
+        """
+        if not self.cells:
+            return []
+        kx = km_per_deg_lng(lat)
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlng = radius_km / kx
+        lat_lo, lng_lo = self._cell(lat - dlat, lng - dlng)
+        lat_hi, lng_hi = self._cell(lat + dlat, lng + dlng)
+        if (lat_hi - lat_lo + 1) * (lng_hi - lng_lo + 1) <= len(self.cells):
+            candidates = (
+                self.cells.get((cell_lat, cell_lng), ())
+                for cell_lat in range(lat_lo, lat_hi + 1)
+                for cell_lng in range(lng_lo, lng_hi + 1)
+            )
+        else:
+            # Большой радиус: дешевле пройти по непустым ячейкам
+            candidates = (
+                members for (cell_lat, cell_lng), members in self.cells.items()
+                if lat_lo <= cell_lat <= lat_hi and lng_lo <= cell_lng <= lng_hi
+            )
+        found = []
+        for members in candidates:
+            self._scan(members, lat, lng, kx, radius_km, found)
+        found.sort()
+        return [(math.sqrt(d2), self.items[i]) for d2, i in found]
+
+    def nearest(self, lat: float, lng: float, limit: int, radius_km: float) -> list:
+        """
+        До limit ближайших точек в радиусе radius_km: [(расстояние_км, item)], ближние первыми.
+        Ячейки просматриваются кольцами от ячейки запроса, пока следующее кольцо
+        может дать точку ближе уже найденной limit-й.
+        """
+        if not self.cells or limit <= 0:
+            return []
+        kx = km_per_deg_lng(lat)
+        cell_km = self.cell_deg * min(KM_PER_DEG_LAT, kx)
+        center_lat, center_lng = self._cell(lat, lng)
+        found = []
+        ring = 0
+        while True:
+            if ring == 0:
+                ring_cells = [(center_lat, center_lng)]
+            else:
+                lo_lat, hi_lat = center_lat - ring, center_lat + ring
+                lo_lng, hi_lng = center_lng - ring, center_lng + ring
+                ring_cells = [(lo_lat, c) for c in range(lo_lng, hi_lng + 1)]
+                ring_cells += [(hi_lat, c) for c in range(lo_lng, hi_lng + 1)]
+                ring_cells += [(r, lo_lng) for r in range(lo_lat + 1, hi_lat)]
+                ring_cells += [(r, hi_lng) for r in range(lo_lat + 1, hi_lat)]
+            for cell in ring_cells:
+                members = self.cells.get(cell)
+                if members is not None:
+                    self._scan(members, lat, lng, kx, radius_km, found)
+            # Любая точка за этим кольцом не ближе ring * cell_km
+            bound = ring * cell_km
+            if bound > radius_km:
+                break
+            if len(found) >= limit:
+                found.sort()
+                del found[limit:]
+                if bound * bound >= found[-1][0]:
+                    break
+            ring += 1
+        found.sort()
+        return [(math.sqrt(d2), self.items[i]) for d2, i in found[:limit]]
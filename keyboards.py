@@ -0,0 +1,54 @@
+"""
+keyboards.py
+
+Реестр reply-клавиатур бота, собранный один раз при импорте.
+
+Набор клавиатур мал и неизменен: "Start / Старт", выбор языка, выбор города
+(на каждый язык), пара Go!/Return с кнопкой геопозиции и выбор "язык или город"
+(на каждый язык).
+Хранится готовый JSON: aiogram передаёт строку reply_markup в API как есть,
+поэтому обработчики не создают и не сериализуют клавиатуры на каждый апдейт.
+"""
+
+import json
+
+from aiogram import types
+
+from localization import translations, LANG_OPTIONS, CITY_OPTIONS
+
+START_BUTTON = "Start / Старт"
+GO_BUTTON = "Go!"
+RETURN_BUTTON = "Return / Вернуться"
+NEAR_BUTTON = "📍 Near me / Рядом"
+
+
+def serialize_markup(markup) -> str:
+    return json.dumps(markup.to_python(), ensure_ascii=False)
+
+
+def _reply_keyboard(rows, one_time: bool = True) -> str:
+    kb = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=one_time or None)
+    for row in rows:
+        kb.add(*row)
+    return serialize_markup(kb)
+
+
+START_KB = _reply_keyboard([[START_BUTTON]])
+
+LANGUAGE_KB = _reply_keyboard([[lang_opt.upper()] for lang_opt in LANG_OPTIONS])
+
+CITY_KB = {
+    lang: _reply_keyboard([[city_name] for city_name in CITY_OPTIONS[lang]])
+    for lang in LANG_OPTIONS
+}
+
+# Кнопка "рядом" отправляет геопозицию (в клиентах, где это недоступно, — свой текст)
+GO_RETURN_KB = _reply_keyboard(
+    [[GO_BUTTON, RETURN_BUTTON], [types.KeyboardButton(NEAR_BUTTON, request_location=True)]],
+    one_time=False,
+)
+
+CHANGE_KB = {
+    lang: _reply_keyboard([[translations[lang]["change_language"], translations[lang]["change_city"]]])
+    for lang in LANG_OPTIONS
+}
@@ -0,0 +1,219 @@
+"""
+loadtest.py
+
+Нагрузочный прогон диспетчера без сети.
+
+- Подменяет вызовы Telegram API заглушкой, которая записывает исходящие запросы.
+- Для N пользователей строит фейковые Message/CallbackQuery и прогоняет через
+  dp.process_updates весь сценарий: /start -> язык -> город -> Go! x K -> ответ на квиз
+  -> inline-запросы, набираемые по букве (апдейт на каждое нажатие).
+- Отчёт: пропускная способность, p50/p99 задержки обработки апдейта,
+  прирост памяти (RSS, по --trace-memory ещё и tracemalloc).
+
+Запуск: python loadtest.py --users 2000 --spins 5 --concurrency 500 [--inline 1]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import time
+import tracemalloc
+from collections import Counter
+
+# Окружение для импорта main без сети и без файлов на диске
+os.environ.setdefault("API_TOKEN", "123456:LOADTEST-loadtest-loadtest")
+os.environ.setdefault("SETTINGS_BACKEND", "memory")
+os.environ.setdefault("SPIN_DELAY", "0")
+os.environ.setdefault("METRICS_INTERVAL", "0")
+os.environ.setdefault("CARDS_RELOAD_INTERVAL", "0")
+# Лимиты Telegram заглушке не нужны: меряем сам бот
+os.environ.setdefault("OUTBOX_GLOBAL_RATE", "0")
+os.environ.setdefault("OUTBOX_CHAT_RATE", "0")
+
+from aiogram import Bot, Dispatcher, types  # noqa: E402
+
+import main  # noqa: E402
+from localization import LANG_OPTIONS, CITY_OPTIONS  # noqa: E402
+from keyboards import START_BUTTON, GO_BUTTON  # noqa: E402
+
+
+# Что "пользователи" набирают в inline-режиме
+INLINE_QUERIES = {
+    "ru": ["москва легенда", "спб архитектура", "невский проспект", "история"],
+    "en": ["moscow legend", "spb architecture", "nevsky", "history"],
+    "cn": ["莫斯科 传说", "圣彼得堡 建筑", "大街", "历史"],
+}
+
+
+class RecordingApi:
+    """
+    Заглушка Telegram API: считает вызовы и хранит inline-клавиатуры,
+    отправленные каждому чату (из них берутся callback_data квизов).
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.message_id = 0
+        self.inline_keyboards = {}
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        self.calls[method] += 1
+        data = data or {}
+        if method in ("sendMessage", "sendPhoto", "editMessageText"):
+            self.message_id += 1
+            chat_id = int(data["chat_id"])
+            markup = data.get("reply_markup")
+            if markup and "inline_keyboard" in markup:
+                self.inline_keyboards.setdefault(chat_id, []).append(json.loads(markup)["inline_keyboard"])
+            sent = {
+                "message_id": self.message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", ""),
+            }
+            if method == "sendPhoto":
+                # Загруженный файл получает file_id, присланный file_id возвращается как есть
+                file_id = data.get("photo") or f"photo-{self.message_id}"
+                sent["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1080, "height": 1350}]
+            return sent
+        return True
+
+
+class UpdateFactory:
+    def __init__(self):
+        self.update_id = 0
+
+    def _next(self) -> int:
+        self.update_id += 1
+        return self.update_id
+
+    def message(self, user_id: int, text: str) -> types.Update:
+        update_id = self._next()
+        data = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return types.Update(update_id=update_id, message=data)
+
+    def callback(self, user_id: int, callback_data: str) -> types.Update:
+        update_id = self._next()
+        return types.Update(update_id=update_id, callback_query={
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "chat_instance": str(user_id),
+            "data": callback_data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "quiz",
+            },
+        })
+
+    def inline_query(self, user_id: int, query: str) -> types.Update:
+        update_id = self._next()
+        return types.Update(update_id=update_id, inline_query={
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "query": query,
+            "offset": "",
+        })
+
+
+async def run_user(user_id: int, spins: int, inline: int, api: RecordingApi, factory: UpdateFactory,
+                   latencies: list, semaphore: asyncio.Semaphore):
+    lang = random.choice(LANG_OPTIONS)
+    script = [
+        factory.message(user_id, "/start"),
+        factory.message(user_id, START_BUTTON),
+        factory.message(user_id, lang.upper()),
+        factory.message(user_id, random.choice(CITY_OPTIONS[lang])),
+    ] + [factory.message(user_id, GO_BUTTON) for _ in range(spins)]
+
+    async def feed(update):
+        async with semaphore:
+            start = time.perf_counter()
+            await main.dp.process_updates([update])
+            latencies.append(time.perf_counter() - start)
+
+    for update in script:
+        await feed(update)
+    # Квизы доходят до "клиента" асинхронно, через очередь исходящих сообщений
+    await main.OUTBOX.join()
+    for keyboard in api.inline_keyboards.pop(user_id, []):
+        button = random.choice(keyboard)[0]
+        await feed(factory.callback(user_id, button["callback_data"]))
+    for _ in range(inline):
+        query = random.choice(INLINE_QUERIES[lang])
+        for length in range(1, len(query) + 1):
+            await feed(factory.inline_query(user_id, query[:length]))
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(users: int, spins: int, inline: int, concurrency: int, trace_memory: bool):
+    api = RecordingApi()
+    main.bot.request = api.request
+    Bot.set_current(main.bot)
+    Dispatcher.set_current(main.dp)
+    factory = UpdateFactory()
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    if trace_memory:
+        # tracemalloc заметно замедляет прогон: задержки с ним не сравнимы с обычными
+        tracemalloc.start()
+    mem_before, _ = tracemalloc.get_traced_memory()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_user(1_000_000 + i, spins, inline, api, factory, latencies, semaphore) for i in range(users)
+    ))
+    await main.OUTBOX.join()
+    await main.SETTINGS.flush()
+    elapsed = time.perf_counter() - start
+    mem_after, mem_peak = tracemalloc.get_traced_memory()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.stop()
+
+    print(f"users:        {users} (spins per user: {spins}, inline queries: {inline}, "
+          f"concurrency: {concurrency})")
+    print(f"updates:      {len(latencies)} in {elapsed:.2f} s -> {len(latencies) / elapsed:.0f} updates/s")
+    print(f"latency:      p50={percentile(latencies, 0.5) * 1000:.2f} ms "
+          f"p99={percentile(latencies, 0.99) * 1000:.2f} ms max={max(latencies) * 1000:.2f} ms")
+    memory = f"max RSS +{rss_after - rss_before} KiB"
+    if trace_memory:
+        memory += (f", +{(mem_after - mem_before) / 1024:.0f} KiB traced "
+                   f"(peak {(mem_peak - mem_before) / 1024:.0f} KiB)")
+    print(f"memory:       {memory}")
+    print("api calls:    " + ", ".join(f"{method}={n}" for method, n in api.calls.most_common()))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон диспетчера WanderWheel")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--spins", type=int, default=5)
+    parser.add_argument("--inline", type=int, default=1, help="inline-запросов на пользователя")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace-memory", action="store_true", help="учёт памяти через tracemalloc")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    random.seed(args.seed)
+    asyncio.run(run(args.users, args.spins, args.inline, args.concurrency, args.trace_memory))
@@ -13,7 +13,15 @@ translations = {
         "quiz_wrong": "Неверно. Правильный ответ: {correct}",
         "what_change": "Что хотите изменить: язык или город?",
         "change_language": "Изменить язык",
-        "change_city": "Изменить город"
+        "change_city": "Изменить город",
+        "near_prompt": "Отправьте свою геопозицию (📎 → Геопозиция), и я найду место рядом с вами.",
+        "near_nothing": "В радиусе {radius} км от вас карточек пока нет. Нажмите Go!",
+        "more_about_place": "ℹ️ Подробнее об этом месте",
+        "place_no_cards": "Других карточек об этом месте на вашем языке пока нет.",
+        "quiz_expired": "Этот вопрос больше недоступен. Нажмите Go!",
+        "search_prompt": "Напишите, что искать: /search Невский проспект",
+        "search_found": "Нашлось по запросу «{query}»:",
+        "search_nothing": "По запросу «{query}» ничего не нашлось."
     },
     "en": {
         "welcome": "Welcome to WanderWheel!",
@@ -27,7 +35,15 @@ translations = {
         "quiz_wrong": "Incorrect. The correct answer is: {correct}",
         "what_change": "What do you want to change: language or city?",
         "change_language": "Change language",
-        "change_city": "Change city"
+        "change_city": "Change city",
+        "near_prompt": "Share your location (📎 → Location) and I will find a place nearby.",
+        "near_nothing": "No cards within {radius} km of you yet. Press Go!",
+        "more_about_place": "ℹ️ More about this place",
+        "place_no_cards": "No cards about this place in your language yet.",
+        "quiz_expired": "This question is no longer available. Press Go!",
+        "search_prompt": "Tell me what to look for: /search Nevsky Prospect",
+        "search_found": "Found for “{query}”:",
+        "search_nothing": "Nothing found for “{query}”."
     },
     "cn": {
         "welcome": "欢迎来到WanderWheel！",
@@ -41,6 +57,38 @@ translations = {
         "quiz_wrong": "错误。正确答案是：{correct}",
         "what_change": "您想更改什么：语言还是城市？",
         "change_language": "更改语言",
-        "change_city": "更改城市"
+        "change_city": "更改城市",
+        "near_prompt": "请发送您的位置（📎 → 位置），我会为您找到附近的地方。",
+        "near_nothing": "您周围 {radius} 公里内暂时没有卡片。请按 Go!",
+        "more_about_place": "ℹ️ 关于这个地方的更多信息",
+        "place_no_cards": "暂时还没有关于这个地方的中文卡片。",
+        "quiz_expired": "此问题已不可用。请按 Go!",
+        "search_prompt": "请输入要搜索的内容：/search 涅瓦大街",
+        "search_found": "“{query}”的搜索结果：",
+        "search_nothing": "没有找到与“{query}”相关的内容。"
     }
 }
+
+# Языковые опции (храним в нижнем регистре, но отображаем в верхнем)
+LANG_OPTIONS = ["ru", "en", "cn"]
+
+# Города для каждого языка
+CITY_OPTIONS = {
+    "ru": ["Москва", "Санкт-Петербург", "Все"],
+    "en": ["Moscow", "Saint Petersburg", "All"],
+    "cn": ["莫斯科", "圣彼得堡", "全部"]
+}
+
+# Сопоставление ввода города (в любом регистре) к ключу "moscow"/"spb"/"all"
+CITY_MAP = {
+    "москва": "moscow",
+    "moscow": "moscow",
+    "санкт-петербург": "spb",
+    "saint petersburg": "spb",
+    "spb": "spb",
+    "莫斯科": "moscow",
+    "圣彼得堡": "spb",
+    "все": "all",
+    "all": "all",
+    "全部": "all"
+}
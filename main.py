@@ -3,25 +3,65 @@ main.py
 
 Версия 1.3.0
 
-- Единая база карточек в data/cards.json.
+- Единая база карточек в data/cards.json, индекс в памяти строится один раз при старте
+  и подменяется в фоне при изменении файла. Если импорт собрал снимок data/cards.bin,
+  он отображается в память и карточки декодируются по одной при выборе.
+  При CARDS_SHARDED каталог читается по шардам (город + язык) из regions_config.json
+  при первом обращении, в памяти — не больше CARD_SHARDS_MAX шардов.
 - Выбор языка (/start, /lang) и города.
 - Кнопка "Go!" с анимацией "Колесо крутится...", вывод которой ограничен (не чаще 1 раза из 5).
-- 80% факт, 20% квиз (если есть квиз).
+  Карточка выбирается сразу и отправляется отложенно, только если спиннер был показан.
+- 80% факт, 20% квиз (если есть квиз; доли и веса карточек — в selection_config.json).
+  Если веса различают карточки корзины, выбор по таблице Уокера за O(1); иначе
+  карточки идут из колоды пользователя без повторов, пока корзина не пройдена.
 - Фильтрация карточек по языку (ru/en/cn) и городу (moscow/spb/all).
-- Inline-кнопки для викторин.
+- Inline-кнопки для викторин: в кнопке только номер квиза и вариант, ответ проверяется
+  по индексу карточек. Статистика ответов копится в памяти и сбрасывается в SQLite.
+- "Подробнее об этом месте" под фактом, связанным с объектом из objects_*.json:
+  описание объекта и его карточки на языке пользователя (переводы — по основе id).
+- "Рядом со мной": пользователь присылает геопозицию, карточка выбирается
+  в радиусе NEAR_RADIUS_KM по сеточному геоиндексу.
+- /search <запрос>: полнотекстовый поиск по карточкам языка пользователя
+  (русский и английский — по основам слов, китайский — по биграммам иероглифов).
+- Inline-режим (@bot moscow legend): факты языка пользователя с фильтрами по городу,
+  легенде/факту и тегу; готовые ответы кешируются по запросу (LRU) и Telegram (cache_time).
+- CARD_IMAGES=1: факт отправляется картинкой, нарисованной заранее (render_cards.py).
+  Картинка загружается в Telegram один раз, дальше — по запомненному file_id (SQLite).
 - Локализация всех стандартных сообщений через localization.py.
-- Пользовательские настройки хранятся в памяти.
+- Пользовательские настройки хранятся в SQLite (WAL) с LRU-кешем компактных записей
+  (вытеснение по TTL) и отложенной записью.
+- Long polling или webhook (aiohttp), если задан WEBHOOK_HOST.
+- BOT_WORKERS > 1: несколько процессов, апдейты шардируются по user_id.
+- Исходящие сообщения идут через очередь с лимитами Telegram и учётом RetryAfter.
+- Метрики (вращения, задержки) — сводкой в лог и на локальном /metrics.
 """
 
 import logging
+import functools
+import itertools
 import random
-import json
 import asyncio
 import os
-from pathlib import Path
 
-from aiogram import Bot, Dispatcher, executor, types
+from aiogram import Dispatcher, executor, types
+from aiogram.utils.exceptions import BadRequest
 from localization import translations  # Импорт локализации
+from card_store import ALL_CITIES, CardStore, card_city
+from card_shards import ShardedCardStore
+from card_deck import choose_card, choose_near, pick_kind
+from card_render import (fact_text, fact_caption, quiz_message, more_about_markup, object_message, cards_markup,
+                         is_quiz_callback, quiz_callback_language, resolve_quiz_callback)
+from card_inline import inline_results
+from object_index import card_base
+from card_images import CardImages, CARD_IMAGES_DIR, CARD_FILE_IDS_DB_PATH, image_path
+from router import build_text_router
+from keyboards import START_KB, LANGUAGE_KB, CITY_KB, GO_RETURN_KB, CHANGE_KB
+from settings_store import SettingsStore, SETTINGS_DB_PATH, create_backend
+from quiz_stats import QuizStats, QUIZ_STATS_DB_PATH
+from webhook_server import start_webhook
+from outbox import Outbox
+import sharding
+from metrics import METRICS, MetricsMiddleware, MeteredBot, report_loop, start_metrics_server
 
 logging.basicConfig(level=logging.INFO)
 logging.info("=== BOT STARTED: 'WanderWheel' VERSION 1.3.0 (Single cards.json) ===")
@@ -30,110 +70,174 @@ API_TOKEN = os.getenv("API_TOKEN")
 if not API_TOKEN:
     raise ValueError("API_TOKEN не задан. Установите его в переменной окружения.")
 
-bot = Bot(token=API_TOKEN)
+# Режим webhook включается, если задан WEBHOOK_HOST (например, https://bot.example.com);
+# иначе бот работает через long polling.
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("PORT", "8080"))
+
+# Число процессов-обработчиков (режим long polling): апдейты шардируются по user_id
+BOT_WORKERS = max(1, int(os.getenv("BOT_WORKERS", "1")))
+if WEBHOOK_HOST and BOT_WORKERS > 1:
+    # Webhook принимает один процесс; масштабирование — экземплярами за балансировщиком
+    logging.warning(f"BOT_WORKERS={BOT_WORKERS} не действует в режиме webhook (WEBHOOK_HOST): работает один процесс")
+    BOT_WORKERS = 1
+
+# Подробная трассировка выборки карточек (CARD_TRACE=1). Выключена — ничего не стоит.
+CARD_TRACE = os.getenv("CARD_TRACE", "") not in ("", "0")
+# Период строки-сводки метрик в логе (секунды, 0 — не писать) и порт локального /metrics
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "60"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+bot = MeteredBot(token=API_TOKEN)
 dp = Dispatcher(bot)
+dp.middleware.setup(MetricsMiddleware())
 
 # ---------------------------
-# Глобальные переменные для настроек пользователя и счетчики сообщений
+# Настройки пользователя и счетчики сообщений (постоянное хранилище + LRU-кеш)
 # ---------------------------
-USER_LANGS = {}  # { user_id: {"language": "ru", "city": "moscow"} }
-MESSAGE_COUNTERS = {}  # для ограничения повторений стандартных сообщений
-
-# Языковые опции (храним в нижнем регистре, но отображаем в верхнем)
-LANG_OPTIONS = ["ru", "en", "cn"]
-
-# Города для каждого языка
-CITY_OPTIONS = {
-    "ru": ["Москва", "Санкт-Петербург", "Все"],
-    "en": ["Moscow", "Saint Petersburg", "All"],
-    "cn": ["莫斯科", "圣彼得堡", "全部"]
-}
-
-# Сопоставление ввода города (в любом регистре) к ключу "moscow"/"spb"/"all"
-CITY_MAP = {
-    "москва": "moscow",
-    "moscow": "moscow",
-    "санкт-петербург": "spb",
-    "saint petersburg": "spb",
-    "spb": "spb",
-    "莫斯科": "moscow",
-    "圣彼得堡": "spb",
-    "все": "all",
-    "all": "all",
-    "全部": "all"
-}
+# SETTINGS_BACKEND: "sqlite" (по умолчанию, файл SETTINGS_DB), "redis" (SETTINGS_REDIS_URL,
+# общее хранилище для нескольких машин) или "memory"
+SETTINGS_BACKEND = os.getenv("SETTINGS_BACKEND", "sqlite")
+SETTINGS_DB = os.getenv("SETTINGS_DB", str(SETTINGS_DB_PATH))
+SETTINGS_REDIS_URL = os.getenv("SETTINGS_REDIS_URL", "")
+SETTINGS_CACHE_SIZE = int(os.getenv("SETTINGS_CACHE_SIZE", "10000"))
+SETTINGS_FLUSH_INTERVAL = float(os.getenv("SETTINGS_FLUSH_INTERVAL", "1"))
+# Через сколько секунд без активности пользователь покидает кеш (0 — без ограничения по времени)
+SETTINGS_TTL = float(os.getenv("SETTINGS_TTL", "1800"))
+
+# { user_id: UserState(language, city, счётчики сообщений) }
+SETTINGS = SettingsStore(
+    create_backend(SETTINGS_BACKEND, SETTINGS_DB, SETTINGS_REDIS_URL),
+    cache_size=SETTINGS_CACHE_SIZE,
+    ttl=SETTINGS_TTL,
+)
+
+# Статистика ответов на квизы: файл SQLite и период сброса накопленного (секунды)
+QUIZ_STATS_DB = os.getenv("QUIZ_STATS_DB", str(QUIZ_STATS_DB_PATH))
+QUIZ_STATS_FLUSH_INTERVAL = float(os.getenv("QUIZ_STATS_FLUSH_INTERVAL", "30"))
+QUIZ_STATS = QuizStats(QUIZ_STATS_DB)
+
+# Картинки фактов (см. card_images.py): кеш картинок, таблица file_id и период
+# подхвата file_id, загруженных другими воркерами (секунды)
+CARD_IMAGES_ENABLED = os.getenv("CARD_IMAGES", "") not in ("", "0")
+CARD_IMAGES_REFRESH_INTERVAL = float(os.getenv("CARD_IMAGES_REFRESH_INTERVAL", "60"))
+CARD_IMAGES = CardImages(
+    os.getenv("CARD_IMAGES_DIR", str(CARD_IMAGES_DIR)),
+    os.getenv("CARD_FILE_IDS_DB", str(CARD_FILE_IDS_DB_PATH)),
+) if CARD_IMAGES_ENABLED else None
 
 # ---------------------------
 # Функция контроля частоты повторения стандартных сообщений
 # ---------------------------
-def should_send_message(user_id, msg_key):
+def should_send_message(user_id, settings, msg_key):
     """
     Возвращает True, если сообщение msg_key для данного пользователя должно быть отправлено
     (не чаще 1 раза из 5 вызовов). Первое появление – отправляется.
     """
-    global MESSAGE_COUNTERS
-    if user_id not in MESSAGE_COUNTERS:
-        MESSAGE_COUNTERS[user_id] = {}
-    if msg_key not in MESSAGE_COUNTERS[user_id]:
-        MESSAGE_COUNTERS[user_id][msg_key] = 0
-    MESSAGE_COUNTERS[user_id][msg_key] += 1
+    count = settings.bump(msg_key)
+    SETTINGS.mark_dirty(user_id, settings)
     # Отправляем, если вызов в позиции, когда (count % 5) == 1
-    return (MESSAGE_COUNTERS[user_id][msg_key] % 5) == 1
+    return count == 1
 
 # ---------------------------
-# Функции загрузки карточек
+# Исходящие сообщения: очередь с ограничением скорости (см. outbox.py)
+# ---------------------------
+# Лимиты Telegram: ~30 сообщений/с на бота, ~1/с на чат (короткие всплески допустимы).
+# Общий лимит бота делится между воркерами; чат всегда обслуживает один воркер.
+OUTBOX = Outbox(
+    bot,
+    global_rate=float(os.getenv("OUTBOX_GLOBAL_RATE", "30")) / BOT_WORKERS,
+    chat_rate=float(os.getenv("OUTBOX_CHAT_RATE", "1")),
+    chat_burst=float(os.getenv("OUTBOX_CHAT_BURST", "3")),
+    workers=int(os.getenv("OUTBOX_WORKERS", "8")),
+)
+
+def answer(message: types.Message, text: str, **kwargs):
+    return OUTBOX.send_message(message.chat.id, text, **kwargs)
+
+def reply(message: types.Message, text: str, **kwargs):
+    return OUTBOX.send_message(message.chat.id, text, reply_to_message_id=message.message_id, **kwargs)
+
 # ---------------------------
-def load_cards() -> list:
+# Отложенные отправки (анимация колеса не держит обработчик)
+# ---------------------------
+# Пауза между "Колесо крутится..." и карточкой, секунды
+SPIN_DELAY = float(os.getenv("SPIN_DELAY", "1.5"))
+
+_DELAYED_SENDS = {}  # chat_id -> последняя запланированная отправка чата
+
+def _delayed_send_done(chat_id: int, task: asyncio.Task):
+    if _DELAYED_SENDS.get(chat_id) is task:
+        del _DELAYED_SENDS[chat_id]
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"Ошибка отложенной отправки: {task.exception()!r}")
+
+def send_later(chat_id: int, delay: float, coro):
     """
-    Считываем ВСЕ карточки из data/cards.json.
+    Выполняет корутину отправки через delay секунд в фоне, не удерживая обработчик.
+    Отправки чата идут по порядку: каждая ждёт ещё и предыдущую отложенную.
     """
-    path = Path(__file__).parent / "data" / "cards.json"
-    if not path.exists():
-        logging.error(f"cards.json not found: {path}")
-        return []
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, list):
-                return data
-            else:
-                logging.error("cards.json должен быть массивом JSON-объектов!")
-                return []
-    except Exception as e:
-        logging.error(f"Ошибка чтения cards.json: {e}")
-        return []
-
-def get_filtered_cards(lang: str, city: str) -> (list, list):
+    previous = _DELAYED_SENDS.get(chat_id)
+
+    async def _run():
+        await asyncio.sleep(delay)
+        if previous is not None:
+            # Ошибку предыдущей отправки уже залогировал её колбэк
+            await asyncio.wait([previous])
+        await coro
+    task = asyncio.ensure_future(_run())
+    _DELAYED_SENDS[chat_id] = task
+    task.add_done_callback(functools.partial(_delayed_send_done, chat_id))
+    return task
+
+async def drain_delayed_sends(timeout: float):
     """
-    Загружает карточки из cards.json, фильтрует по языку (lang) и городу (city),
-    разделяя их на факты и квизы.
+    Дожидается отложенных отправок (при остановке: иначе карточки, ждущие
+    паузы колеса, не попадут в очередь исходящих).
     """
-    all_cards = load_cards()
-    facts = []
-    quizzes = []
-    lang = lang.lower()
-    city = city.lower()
-    for c in all_cards:
-        card_lang = c.get("language", "").lower()
-        if card_lang != lang:
-            continue
-        card_city = c.get("city", "").lower()
-        if not card_city:
-            loc = c.get("location", {})
-            if isinstance(loc, dict):
-                card_city = loc.get("city", "").lower()
-            elif isinstance(loc, str):
-                card_city = loc.lower()
-            else:
-                card_city = ""
-        if city != "all" and card_city != city:
-            continue
-        if c.get("interactive", False) is True:
-            quizzes.append(c)
-        else:
-            facts.append(c)
-        logging.info(f"CARD_ID={c.get('id')} card_lang={card_lang} card_city={card_city}")
-    logging.info(f"Найдено {len(facts)} фактов, {len(quizzes)} квизов для lang={lang} city={city}")
+    pending = list(_DELAYED_SENDS.values())
+    if not pending:
+        return
+    _, not_done = await asyncio.wait(pending, timeout=timeout)
+    if not_done:
+        logging.warning(f"Остановка: {len(not_done)} отложенных отправок не дождались")
+        for task in not_done:
+            task.cancel()
+
+# ---------------------------
+# Индекс карточек (строится один раз при старте)
+# ---------------------------
+# CARDS_SHARDED=1 — каталог по шардам regions_config.json, шард читается при первом обращении
+CARDS_SHARDED = os.getenv("CARDS_SHARDED", "") not in ("", "0")
+if CARDS_SHARDED:
+    CARD_STORE = ShardedCardStore(max_shards=int(os.getenv("CARD_SHARDS_MAX", "8")))
+else:
+    CARD_STORE = CardStore()
+CARD_STORE.load()
+
+# Период проверки data/cards.json на изменения (секунды, 0 — не следить)
+CARDS_RELOAD_INTERVAL = float(os.getenv("CARDS_RELOAD_INTERVAL", "5"))
+# Радиус поиска карточек "рядом со мной", км
+NEAR_RADIUS_KM = float(os.getenv("NEAR_RADIUS_KM", "2"))
+# Из скольких ближайших карточек выбирается случайная
+NEAR_LIMIT = int(os.getenv("NEAR_LIMIT", "10"))
+# Сколько найденных карточек показывать на /search
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "8"))
+# Сколько секунд Telegram может отдавать тот же ответ на inline-запрос без обращения к боту
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))
+
+def get_filtered_cards(lang: str, city: str) -> (tuple, tuple):
+    """
+    Возвращает факты и квизы для языка (lang) и города (city) из индекса в памяти.
+    """
+    facts, quizzes = CARD_STORE.index.facts_and_quizzes(lang, city)
+    if CARD_TRACE:
+        for c in itertools.chain(facts, quizzes):
+            logging.info(f"CARD_ID={c.get('id')} card_lang={lang} card_city={c.get('city')}")
+        logging.info(f"Найдено {len(facts)} фактов, {len(quizzes)} квизов для lang={lang} city={city}")
     return (facts, quizzes)
 
 # ---------------------------
@@ -142,161 +246,337 @@ def get_filtered_cards(lang: str, city: str) -> (list, list):
 @dp.message_handler(commands=['start'])
 async def cmd_start(message: types.Message):
     user_id = message.from_user.id
-    USER_LANGS[user_id] = {"language": "ru", "city": "all"}
-    lang = USER_LANGS[user_id]["language"]
-    kb = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    kb.add("Start / Старт")
+    settings = await SETTINGS.get(user_id)
+    settings.reset()
+    SETTINGS.mark_dirty(user_id, settings)
+    lang = settings.language
     welcome_text = translations[lang]["welcome"] + "\n" + translations[lang]["start_prompt"]
-    await message.reply(welcome_text, reply_markup=kb)
+    reply(message, welcome_text, reply_markup=START_KB)
 
 @dp.message_handler(commands=['lang'])
 async def cmd_change_lang(message: types.Message):
     await change_language(message)
 
-@dp.message_handler(lambda msg: msg.text == "Start / Старт")
-async def choose_language(message: types.Message):
-    kb = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    for lang_opt in LANG_OPTIONS:
-        kb.add(lang_opt.upper())
+async def choose_language(message: types.Message, arg=None):
     # Пока устанавливаем язык по умолчанию "ru"
-    await message.reply(translations["ru"]["choose_language"], reply_markup=kb)
+    reply(message, translations["ru"]["choose_language"], reply_markup=LANGUAGE_KB)
 
-@dp.message_handler(lambda msg: msg.text and msg.text.lower() in LANG_OPTIONS)
-async def language_selection(message: types.Message):
+async def language_selection(message: types.Message, chosen_lang: str):
     user_id = message.from_user.id
-    chosen_lang = message.text.lower()
-    USER_LANGS[user_id]["language"] = chosen_lang
-    kb = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    for city_name in CITY_OPTIONS[chosen_lang]:
-        kb.add(city_name)
-    await message.reply(translations[chosen_lang]["choose_city"], reply_markup=kb)
-
-@dp.message_handler(lambda msg: msg.text and msg.text.lower() in CITY_MAP.keys())
-async def city_selection(message: types.Message):
+    settings = await SETTINGS.get(user_id)
+    settings.language = chosen_lang
+    SETTINGS.mark_dirty(user_id, settings)
+    reply(message, translations[chosen_lang]["choose_city"], reply_markup=CITY_KB[chosen_lang])
+
+async def city_selection(message: types.Message, city_key: str):
     user_id = message.from_user.id
-    lang = USER_LANGS[user_id]["language"]
+    settings = await SETTINGS.get(user_id)
+    lang = settings.language
     city_raw = message.text
-    city_key = CITY_MAP.get(city_raw.lower(), "all")
-    USER_LANGS[user_id]["city"] = city_key
-    kb = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    kb.add("Go!", "Return / Вернуться")
+    settings.city = city_key
+    SETTINGS.mark_dirty(user_id, settings)
     city_selected_text = translations[lang]["city_selected"].format(city=city_raw)
-    await message.reply(city_selected_text, reply_markup=kb)
+    reply(message, city_selected_text, reply_markup=GO_RETURN_KB)
 
-@dp.message_handler(lambda msg: msg.text == "Go!")
-async def spin_wheel(message: types.Message):
+async def spin_wheel(message: types.Message, arg=None):
     user_id = message.from_user.id
-    if user_id not in USER_LANGS:
+    settings = await SETTINGS.get(user_id, create=False)
+    if settings is None:
         await cmd_start(message)
         return
-    lang = USER_LANGS[user_id]["language"]
-    if should_send_message(user_id, "wheel_spinning"):
-        await message.answer(translations[lang]["wheel_spinning"])
-    await asyncio.sleep(1.5)
-    roll = random.randint(1, 100)
-    logging.info(f"User {user_id} pressed Go! -> Random roll = {roll}")
-    city = USER_LANGS[user_id]["city"]
+    lang = settings.language
+    roll = random.random()
+    if CARD_TRACE:
+        logging.info(f"User {user_id} pressed Go! -> Random roll = {roll:.3f}")
+    city = settings.city
+    METRICS.inc("spins", lang, city)
+    await CARD_STORE.prepare(lang, city)
     facts, quizzes = get_filtered_cards(lang, city)
     if not facts and not quizzes:
-        await message.reply("⚠️ Нет карточек для выбранного языка/города.")
+        reply(message, "⚠️ Нет карточек для выбранного языка/города.")
         return
-    if roll <= 20 and quizzes:
-        quiz_card = random.choice(quizzes)
-        await send_quiz_card(message, quiz_card)
+    # Карточка выбирается сразу; пауза "колеса" — только косметика при показанном спиннере
+    index = CARD_STORE.index
+    interactive = pick_kind(roll, facts, quizzes, index.selection.quiz_share)
+    card = choose_card(settings, index, lang, city, interactive, quizzes if interactive else facts)
+    send_card = send_quiz_card if interactive else send_fact_card
+    SETTINGS.mark_dirty(user_id, settings)
+    if should_send_message(user_id, settings, "wheel_spinning") and SPIN_DELAY > 0:
+        answer(message, translations[lang]["wheel_spinning"])
+        send_later(message.chat.id, SPIN_DELAY, send_card(message, card))
+    elif message.chat.id in _DELAYED_SENDS:
+        # Карточка прошлого нажатия ещё ждёт паузы: эта уйдёт после неё
+        send_later(message.chat.id, 0, send_card(message, card))
     else:
-        if facts:
-            fact_card = random.choice(facts)
-            await send_fact_card(message, fact_card)
-        else:
-            quiz_card = random.choice(quizzes)
-            await send_quiz_card(message, quiz_card)
+        await send_card(message, card)
 
-async def send_fact_card(message: types.Message, card: dict):
+@dp.message_handler(content_types=types.ContentType.LOCATION)
+async def spin_near(message: types.Message):
+    """
+    "Рядом со мной": одна из NEAR_LIMIT ближайших карточек языка пользователя
+    в радиусе NEAR_RADIUS_KM от присланной геопозиции (выбранный город не учитывается),
+    с долей квизов и весами selection_config.json, как при вращении колеса.
+    """
     user_id = message.from_user.id
-    lang = USER_LANGS[user_id]["language"]
-    text_msg = (
-        f"{card.get('icon','')} {card.get('title','')}\n"
-        f"{card.get('text','')}"
-    )
-    loc = card.get("location", {})
-    if isinstance(loc, dict):
-        addr = loc.get("address", "")
-        if addr:
-            text_msg += f"\n📍 {addr}"
-        gps = loc.get("gps", {})
-        if "lat" in gps and "lng" in gps:
-            lat, lng = gps["lat"], gps["lng"]
-            text_msg += f"\n[{lat},{lng}](https://maps.google.com/?q={lat},{lng})"
-    elif isinstance(loc, str):
-        text_msg += f"\n📍 {loc}"
-    await message.answer(text_msg, parse_mode="Markdown", disable_web_page_preview=True)
-    kb = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    kb.add("Go!", "Return / Вернуться")
+    settings = await SETTINGS.get(user_id, create=False)
+    if settings is None:
+        await cmd_start(message)
+        return
+    lang = settings.language
+    location = message.location
+    METRICS.inc("spins_near", lang)
+    await CARD_STORE.prepare(lang, "all")
+    facts, quizzes = CARD_STORE.index.near(lang, location.latitude, location.longitude,
+                                              NEAR_RADIUS_KM, NEAR_LIMIT)
+    if CARD_TRACE:
+        logging.info(f"User {user_id} near ({location.latitude}, {location.longitude}): "
+                     f"{len(facts)} фактов, {len(quizzes)} квизов в радиусе {NEAR_RADIUS_KM} км")
+    if not facts and not quizzes:
+        answer(message, translations[lang]["near_nothing"].format(radius=f"{NEAR_RADIUS_KM:g}"),
+               reply_markup=GO_RETURN_KB)
+        return
+    index = CARD_STORE.index
+    interactive = pick_kind(random.random(), facts, quizzes, index.selection.quiz_share)
+    card = choose_near(index, quizzes if interactive else facts)
+    send_card = send_quiz_card if interactive else send_fact_card
+    await send_card(message, card)
+
+@dp.message_handler(commands=['search'])
+async def cmd_search(message: types.Message):
+    """
+    /search <запрос>: лучшие SEARCH_LIMIT карточек языка пользователя кнопками.
+    """
+    lang = (await SETTINGS.get(message.from_user.id)).language
+    query = message.get_args().strip()
+    if not query:
+        reply(message, translations[lang]["search_prompt"])
+        return
+    METRICS.inc("searches", lang)
+    await CARD_STORE.prepare(lang, "all")
+    await CARD_STORE.prepare_search(lang)
+    with METRICS.timer("search"):
+        cards = CARD_STORE.index.search(lang, query, SEARCH_LIMIT)
+    if CARD_TRACE:
+        logging.info(f"User {message.from_user.id} search {query!r}: {[c.get('id') for c in cards]}")
+    if not cards:
+        reply(message, translations[lang]["search_nothing"].format(query=query))
+        return
+    reply(message, translations[lang]["search_found"].format(query=query), reply_markup=cards_markup(cards))
+
+@dp.inline_handler()
+async def inline_query(query: types.InlineQuery):
+    """
+    Inline-запрос приходит на каждое нажатие клавиши: ответ — готовый JSON из кеша индекса.
+    """
+    settings = await SETTINGS.get(query.from_user.id)
+    lang = settings.language
+    METRICS.inc("inline_queries", lang)
+    await CARD_STORE.prepare(lang, ALL_CITIES)
+    await CARD_STORE.prepare_search(lang)
+    with METRICS.timer("inline"):
+        results = inline_results(CARD_STORE.index, lang, settings.city, query.query)
+    # Ответ зависит от языка и города пользователя
+    await query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=True)
+
+async def near_prompt(message: types.Message, arg=None):
+    lang = (await SETTINGS.get(message.from_user.id)).language
+    answer(message, translations[lang]["near_prompt"], reply_markup=GO_RETURN_KB)
+
+async def send_fact_card(message: types.Message, card: dict, user_id: int = None):
+    user_id = user_id or message.from_user.id
+    settings = await SETTINGS.get(user_id)
+    lang = settings.language
+    await CARD_STORE.prepare(card.get("language", lang).lower(), card_city(card))
+    index = CARD_STORE.index
+    objects = index.objects.objects_for_card(card.get("id", ""))
+    kb = more_about_markup(index, objects[0], lang) if objects else None
     # Отправляем стандартное сообщение не чаще 1 раза из 5
-    if should_send_message(user_id, "go_or_return"):
-        await message.answer(translations[lang]["go_or_return"], reply_markup=kb)
+    follow_up = None
+    if should_send_message(user_id, settings, "go_or_return"):
+        follow_up = lambda: answer(message, translations[lang]["go_or_return"], reply_markup=GO_RETURN_KB,
+                                   follow_up=True)
+    photo = CARD_IMAGES.photo(index, card) if CARD_IMAGES is not None else None
+    if photo is not None:
+        # Картинка уходит не сразу: сообщение после неё ставит в очередь send_fact_photo
+        send_fact_photo(message, index, card, photo, kb, follow_up)
+        return
+    answer(message, fact_text(index, card), parse_mode="Markdown", disable_web_page_preview=True, reply_markup=kb)
+    if follow_up is not None:
+        follow_up()
 
-async def send_quiz_card(message: types.Message, card: dict):
-    lang = USER_LANGS[message.from_user.id]["language"]
-    question = card.get("question", "Вопрос не задан.")
-    options = card.get("options", [])
-    correct_idx = card.get("correct_index", 0)
-    kb = types.InlineKeyboardMarkup()
-    for i, opt in enumerate(options):
-        callback_data = f"quiz:{card.get('id','')}:{i}:{correct_idx}"
-        kb.add(types.InlineKeyboardButton(f"{i+1}) {opt}", callback_data=callback_data))
-    await message.answer(question, reply_markup=kb)
+def file_id_rejected(error) -> bool:
+    # BadRequest о самом файле (wrong file identifier, type of file mismatch...), а не сбой сети
+    return isinstance(error, BadRequest) and "file" in str(error).lower()
 
-@dp.callback_query_handler(lambda c: c.data.startswith("quiz:"))
+def send_fact_photo(message: types.Message, index, card: dict, photo: tuple, kb, follow_up=None):
+    """
+    Факт картинкой: по file_id или загрузкой файла, file_id которого запоминается.
+    file_id, который отверг Telegram, забывается, и картинка загружается из
+    файла заново; при прочих ошибках (сеть, таймаут) и неудачной загрузке факт
+    уходит текстом. follow_up() ставится в очередь после картинки (или текста),
+    чтобы сообщения пришли по порядку.
+    """
+    digest, file = photo
+    uploading = not isinstance(file, str)
+    METRICS.inc("card_images", "upload" if uploading else "file_id")
+    future = OUTBOX.send_photo(message.chat.id, file, caption=fact_caption(index, card), parse_mode="Markdown",
+                               reply_markup=kb)
+
+    def sent(future):
+        error = future.exception()
+        sent_message = future.result() if error is None else None
+        if sent_message is not None and sent_message.photo:
+            if uploading:
+                CARD_IMAGES.remember(digest, card.get("id", ""), sent_message.photo[-1].file_id)
+        else:
+            if not uploading and file_id_rejected(error):
+                CARD_IMAGES.forget(digest)
+                path = image_path(CARD_IMAGES.images_dir, digest)
+                if path.exists():
+                    send_fact_photo(message, index, card, (digest, path), kb, follow_up)
+                    return
+            answer(message, fact_text(index, card), parse_mode="Markdown", disable_web_page_preview=True,
+                   reply_markup=kb)
+        if follow_up is not None:
+            follow_up()
+
+    future.add_done_callback(sent)
+
+async def send_quiz_card(message: types.Message, card: dict, user_id: int = None):
+    question, kb = quiz_message(CARD_STORE.index, card)
+    answer(message, question, reply_markup=kb)
+
+@dp.callback_query_handler(lambda c: is_quiz_callback(c.data))
 async def process_quiz_answer(callback_query: types.CallbackQuery):
+    """
+    Ответ на квиз: карточка и верный вариант берутся из индекса по номеру из кнопки.
+    """
     user_id = callback_query.from_user.id
-    lang = USER_LANGS[user_id]["language"]
-    parts = callback_query.data.split(":")
-    if len(parts) != 4:
-        await callback_query.answer("Ошибка формата квиза", show_alert=True)
-        return
-    try:
-        user_choice = int(parts[2])
-        correct_idx = int(parts[3])
-    except ValueError:
-        await callback_query.answer("Ошибка индексов", show_alert=True)
+    lang = (await SETTINGS.get(user_id)).language
+    await CARD_STORE.prepare(quiz_callback_language(callback_query.data) or lang, ALL_CITIES)
+    card, user_choice = resolve_quiz_callback(CARD_STORE.index, callback_query.data)
+    if card is None or not 0 <= user_choice < len(card.get("options", [])):
+        await callback_query.answer(translations[lang]["quiz_expired"], show_alert=True)
         return
+    correct_idx = card.get("correct_index", 0)
+    QUIZ_STATS.record(card.get("id", ""), user_choice, user_choice == correct_idx)
+    METRICS.inc("quiz_answers", "correct" if user_choice == correct_idx else "wrong")
     if user_choice == correct_idx:
         answer_text = translations[lang]["quiz_correct"]
     else:
         answer_text = translations[lang]["quiz_wrong"].format(correct=correct_idx+1)
-    await callback_query.message.answer(answer_text)
     await callback_query.answer()
-    kb = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    kb.add("Go!", "Return / Вернуться")
-    await callback_query.message.answer(translations[lang]["go_or_return"], reply_markup=kb)
+    # Оба сообщения ставятся в очередь подряд и уходят одним сообщением с клавиатурой
+    answer(callback_query.message, answer_text)
+    answer(callback_query.message, translations[lang]["go_or_return"], reply_markup=GO_RETURN_KB, follow_up=True)
+
+@dp.callback_query_handler(lambda c: c.data.startswith("obj:"))
+async def more_about_object(callback_query: types.CallbackQuery):
+    """
+    "Подробнее об этом месте": описание объекта и кнопки его карточек на языке пользователя.
+    """
+    lang = (await SETTINGS.get(callback_query.from_user.id)).language
+    # Карточки объекта — на языке пользователя (object_message)
+    await CARD_STORE.prepare(lang, ALL_CITIES)
+    index = CARD_STORE.index
+    obj = index.objects.get(callback_query.data[len("obj:"):])
+    await callback_query.answer()
+    if obj is None:
+        # Объект убрали из каталога после отправки кнопки
+        return
+    text_msg, kb = object_message(index, obj, lang)
+    answer(callback_query.message, text_msg, parse_mode="Markdown", disable_web_page_preview=True,
+           reply_markup=kb)
 
-@dp.message_handler(lambda msg: msg.text == "Return / Вернуться")
-async def return_handler(message: types.Message):
+@dp.callback_query_handler(lambda c: c.data.startswith("card:"))
+async def open_card(callback_query: types.CallbackQuery):
+    card_id = callback_query.data[len("card:"):]
+    # Язык — по суффиксу id, без суффикса — язык пользователя (кнопки /search и объектов)
+    lang = card_base(card_id)[1] or (await SETTINGS.get(callback_query.from_user.id)).language
+    await CARD_STORE.prepare(lang, ALL_CITIES)
+    card = CARD_STORE.index.loaded_card(card_id)
+    await callback_query.answer()
+    if card is None:
+        return
+    send_card = send_quiz_card if card.get("interactive") else send_fact_card
+    await send_card(callback_query.message, card, callback_query.from_user.id)
+
+async def return_handler(message: types.Message, arg=None):
     user_id = message.from_user.id
-    lang = USER_LANGS.get(user_id, {}).get("language", "ru")
+    lang = (await SETTINGS.get(user_id)).language
     text_ = translations[lang]["what_change"]
-    kb = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    kb.add(translations[lang]["change_language"], translations[lang]["change_city"])
-    await message.answer(text_, reply_markup=kb)
+    answer(message, text_, reply_markup=CHANGE_KB[lang])
 
-@dp.message_handler(lambda msg: msg.text in [translations["ru"]["change_language"], translations["en"]["change_language"], translations["cn"]["change_language"]])
-async def change_language(message: types.Message):
+async def change_language(message: types.Message, arg=None):
     user_id = message.from_user.id
-    kb = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    for lang_opt in LANG_OPTIONS:
-        kb.add(lang_opt.upper())
-    curr_lang = USER_LANGS.get(user_id, {}).get("language", "ru")
-    await message.answer(translations[curr_lang]["choose_language"], reply_markup=kb)
-
-@dp.message_handler(lambda msg: msg.text in [translations["ru"]["change_city"], translations["en"]["change_city"], translations["cn"]["change_city"]])
-async def change_city(message: types.Message):
+    curr_lang = (await SETTINGS.get(user_id)).language
+    answer(message, translations[curr_lang]["choose_language"], reply_markup=LANGUAGE_KB)
+
+async def change_city(message: types.Message, arg=None):
     user_id = message.from_user.id
-    lang = USER_LANGS.get(user_id, {}).get("language", "ru")
-    kb = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    for city_name in CITY_OPTIONS[lang]:
-        kb.add(city_name)
-    await message.answer(translations[lang]["choose_city"], reply_markup=kb)
+    lang = (await SETTINGS.get(user_id)).language
+    answer(message, translations[lang]["choose_city"], reply_markup=CITY_KB[lang])
+
+# ---------------------------
+# Маршрутизация текстовых кнопок: одна таблица вместо цепочки фильтров
+# ---------------------------
+TEXT_ROUTER = build_text_router(
+    on_start=choose_language,
+    on_language=language_selection,
+    on_city=city_selection,
+    on_go=spin_wheel,
+    on_return=return_handler,
+    on_change_language=change_language,
+    on_change_city=change_city,
+    on_near=near_prompt,
+)
+
+@dp.message_handler(content_types=types.ContentType.TEXT)
+async def route_text(message: types.Message):
+    route = TEXT_ROUTER.resolve(message.text)
+    if route is None:
+        return
+    handler, arg = route
+    await handler(message, arg)
+
+async def on_startup(dispatcher: Dispatcher):
+    if CARDS_RELOAD_INTERVAL > 0:
+        asyncio.ensure_future(CARD_STORE.watch(CARDS_RELOAD_INTERVAL))
+    if METRICS_INTERVAL > 0:
+        asyncio.ensure_future(report_loop(METRICS_INTERVAL))
+    if METRICS_PORT:
+        await start_metrics_server(METRICS_PORT + sharding.SHARD_INDEX)
+    asyncio.ensure_future(SETTINGS.flush_loop(SETTINGS_FLUSH_INTERVAL))
+    asyncio.ensure_future(QUIZ_STATS.flush_loop(QUIZ_STATS_FLUSH_INTERVAL))
+    if CARD_IMAGES is not None:
+        await CARD_IMAGES.refresh()
+        if CARD_IMAGES_REFRESH_INTERVAL > 0:
+            asyncio.ensure_future(CARD_IMAGES.refresh_loop(CARD_IMAGES_REFRESH_INTERVAL))
+
+async def on_shutdown(dispatcher: Dispatcher):
+    await drain_delayed_sends(SPIN_DELAY + 10)
+    try:
+        await asyncio.wait_for(OUTBOX.join(), timeout=10)
+    except asyncio.TimeoutError:
+        logging.warning(f"Остановка: в очереди осталось {OUTBOX.depth} неотправленных сообщений")
+    await SETTINGS.close()
+    await QUIZ_STATS.close()
+    if CARD_IMAGES is not None:
+        await CARD_IMAGES.close()
 
 if __name__ == "__main__":
-    executor.start_polling(dp, skip_updates=True)
+    if WEBHOOK_HOST:
+        start_webhook(
+            dp,
+            webhook_url=WEBHOOK_HOST.rstrip("/") + WEBHOOK_PATH,
+            webhook_path=WEBHOOK_PATH,
+            host=WEBAPP_HOST,
+            port=WEBAPP_PORT,
+            on_startup=on_startup,
+            on_shutdown=on_shutdown,
+            secret=WEBHOOK_SECRET,
+        )
+    elif BOT_WORKERS > 1:
+        sharding.run_sharded(dp, BOT_WORKERS, on_startup=on_startup, on_shutdown=on_shutdown)
+    else:
+        executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -0,0 +1,16 @@
+"""
+markdown_text.py
+
+Экранирование текста для parse_mode="Markdown" (Telegram, Markdown первой версии).
+Общее для представления карточек (card_render) и очереди исходящих (outbox),
+чтобы транспорт не зависел от модуля карточек.
+"""
+
+# Символы, которые нужно экранировать в parse_mode="Markdown"
+_MARKDOWN_SPECIAL = ("_", "*", "`", "[")
+
+
+def escape_markdown(text: str) -> str:
+    for ch in _MARKDOWN_SPECIAL:
+        text = text.replace(ch, "\\" + ch)
+    return text
@@ -1,52 +1,118 @@
 #!/usr/bin/env python3
-import json
+"""
+merge_cards.py
+
+Слияние выгрузки новых карточек (JSON-массив) с основным каталогом.
+
+- card_schema.json компилируется в CardValidator один раз (в каждом процессе пула):
+  быстрая проверка на Python, jsonschema — только для текстов ошибок.
+- Карточки проверяются пачками параллельно в пуле процессов; собираются все
+  ошибки схемы с id карточки.
+- Корректные карточки сливаются с каталогом по id (существующие заменяются,
+  новые дописываются) и записываются атомарно вместе со снимком cards.bin
+  (и шардами regions_config.json при --shards).
+
+Запуск: python merge_cards.py [new_cards.json] [--main data/cards.json] [--workers N] [--shards] [--dry-run]
+"""
+
+import argparse
+import os
 import sys
-from jsonschema import validate, ValidationError
-
-CARDS_MAIN = "cards.json"
-CARDS_NEW = "new_cards.json"
-SCHEMA_FILE = "card_schema.json"
-
-def load_json(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_json(data, path):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-print("Попытка открыть основной файл:", CARDS_MAIN)
-try:
-    main_cards = load_json(CARDS_MAIN)
-    print(f"Загружено {len(main_cards)} карточек из {CARDS_MAIN}.")
-except:
-    print(f"Файл {CARDS_MAIN} не найден или повреждён. Начинаем с пустого массива.")
-    main_cards = []
-
-print("Попытка открыть файл с новыми карточками:", CARDS_NEW)
-try:
-    new_cards = load_json(CARDS_NEW)
-except:
-    print(f"Не удалось прочитать {CARDS_NEW}. Проверьте, что там валидный JSON (массив).")
-    sys.exit(1)
-
-if not isinstance(new_cards, list):
-    print(f"Ошибка: {CARDS_NEW} должен содержать массив ([{{...}}, {{...}}]).")
-    sys.exit(1)
-
-print("Пытаемся открыть схему:", SCHEMA_FILE)
-try:
-    with open(SCHEMA_FILE, "r", encoding="utf-8") as f:
-        schema = json.load(f)
-except:
-    print(f"Ошибка: не удалось загрузить схему {SCHEMA_FILE}.")
-    sys.exit(1)
-
-existing_ids = {card.get("id") for card in main_cards if "id" in card}
-
-for card in new_cards:
-    try:
-        validate(instance=card, schema=schema)
-    except ValidationError as e:
-        print(f"\nОшибка валидации для карточки id={card.get('id','???')}:\n{e}")
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from card_import import CardStaging, ImportStats, SCHEMA_PATH, load_validator
+from card_store import read_cards
+
+CARDS_MAIN = "data/cards.json"
+CARDS_NEW = "data/new_cards.json"
+CARDS_SNAPSHOT = "data/cards.bin"
+SCHEMA_FILE = str(SCHEMA_PATH)
+REGIONS_FILE = "regions_config.json"
+
+# Карточек в одной пачке для процесса пула
+BATCH_SIZE = 1000
+
+_VALIDATOR = None
+
+
+def _init_worker(schema_file: str):
+    global _VALIDATOR
+    _VALIDATOR = load_validator(schema_file)
+
 
+def _validate_batch(start: int, batch: list) -> list:
+    """
+    [(номер карточки, ошибки)] для некорректных карточек пачки.
+    """
+    return [(start + i, errors) for i, card in enumerate(batch) if (errors := _VALIDATOR.errors(card))]
+
+
+def validate_cards(cards: list, schema_file: str = SCHEMA_FILE, workers: int = None) -> dict:
+    """
+    {номер карточки: [ошибки]} для всех некорректных карточек.
+    Небольшие выгрузки проверяются в текущем процессе: пул дороже самой проверки.
+    """
+    workers = workers or os.cpu_count() or 1
+    batches = [(start, cards[start:start + BATCH_SIZE]) for start in range(0, len(cards), BATCH_SIZE)]
+    if workers == 1 or len(batches) <= 1:
+        _init_worker(schema_file)
+        results = [_validate_batch(start, batch) for start, batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(schema_file,)) as pool:
+            results = list(pool.map(_validate_batch, *zip(*batches)))
+    return {pos: errors for result in results for pos, errors in result}
+
+
+def merge_cards(new_file: str = CARDS_NEW, main_file: str = CARDS_MAIN, snapshot_file: str = CARDS_SNAPSHOT,
+                schema_file: str = SCHEMA_FILE, workers: int = None, dry_run: bool = False,
+                regions_file: str = None) -> ImportStats:
+    new_cards = read_cards(new_file)
+    stats = ImportStats(source="Карточек в выгрузке", unit="Карточка")
+    stats.rows = len(new_cards)
+
+    start = time.perf_counter()
+    invalid = validate_cards(new_cards, schema_file, workers)
+    print(f"Проверено {len(new_cards)} карточек за {time.perf_counter() - start:.2f} с, с ошибками: {len(invalid)}")
+    for pos in sorted(invalid):
+        card = new_cards[pos]
+        card_id = card.get("id", "") if isinstance(card, dict) else ""
+        stats.error(pos + 1, card_id, "; ".join(invalid[pos]))
+    stats.accepted = stats.rows - stats.rejected
+    if dry_run:
+        return stats
+
+    with CardStaging() as staging:
+        for pos, card in enumerate(new_cards):
+            if pos not in invalid:
+                staging.add(card, pos)
+        del new_cards
+        staging.write_catalog(main_file, snapshot_file, stats, regions_file)
+    return stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Проверка и слияние новых карточек с каталогом")
+    parser.add_argument("new_file", nargs="?", default=CARDS_NEW, help="JSON-массив новых карточек")
+    parser.add_argument("--main", default=CARDS_MAIN, help="основной каталог cards.json")
+    parser.add_argument("--snapshot", default=CARDS_SNAPSHOT, help="снимок каталога для бота")
+    parser.add_argument("--schema", default=SCHEMA_FILE)
+    parser.add_argument("--workers", type=int, default=None, help="процессов проверки (по умолчанию — число CPU)")
+    parser.add_argument("--shards", nargs="?", const=REGIONS_FILE, default=None, metavar="REGIONS",
+                        help=f"разложить каталог по шардам (по умолчанию {REGIONS_FILE})")
+    parser.add_argument("--dry-run", action="store_true", help="только проверить, каталог не менять")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        result = merge_cards(args.new_file, args.main, args.snapshot, args.schema, args.workers, args.dry_run,
+                              args.shards)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(result.summary())
+    if args.dry_run:
+        print("Каталог не изменён (--dry-run).")
+    sys.exit(1 if args.dry_run and result.rejected else 0)
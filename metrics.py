@@ -0,0 +1,190 @@
+"""
+metrics.py
+
+Агрегированные метрики бота вместо построчного логирования.
+
+- Счётчики с метками (например, вращения по языку/городу).
+- Гистограммы задержек в миллисекундах с фиксированными корзинами.
+- Периодическая строка-сводка в лог (METRICS_INTERVAL) и локальный
+  HTTP-эндпоинт /metrics в текстовом формате Prometheus (METRICS_PORT).
+- Middleware для задержки обработки апдейтов и Bot, замеряющий вызовы Telegram API.
+"""
+
+import logging
+import asyncio
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+# Верхние границы корзин гистограмм, мс
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами: O(число корзин) памяти на серию.
+    """
+
+    __slots__ = ("counts", "total", "sum")
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value_ms: float):
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if value_ms <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value_ms
+
+    def quantile(self, q: float) -> float:
+        """
+        Оценка квантиля: верхняя граница корзины, в которую он попадает.
+        """
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return LATENCY_BUCKETS_MS[-1]
+
+
+class Metrics:
+    """
+    Реестр счётчиков и гистограмм. Ключ серии — (имя, метки...).
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name: str, *labels, value: int = 1):
+        key = (name,) + labels
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value, *labels):
+        self.gauges[(name,) + labels] = value
+
+    def observe(self, name: str, value_ms: float, *labels):
+        key = (name,) + labels
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = Histogram()
+        hist.observe(value_ms)
+
+    @contextmanager
+    def timer(self, name: str, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000, *labels)
+
+    def summary(self) -> str:
+        """
+        Одна строка для лога: счётчики и p50/p99 гистограмм.
+        """
+        parts = []
+        for key in sorted(self.counters):
+            parts.append(f"{'/'.join(map(str, key))}={self.counters[key]}")
+        for key in sorted(self.gauges):
+            parts.append(f"{'/'.join(map(str, key))}={self.gauges[key]}")
+        for key in sorted(self.histograms):
+            hist = self.histograms[key]
+            parts.append(
+                f"{'/'.join(map(str, key))}:n={hist.total},"
+                f"p50={hist.quantile(0.5):g}ms,p99={hist.quantile(0.99):g}ms"
+            )
+        return " ".join(parts)
+
+    def render_text(self) -> str:
+        """
+        Текстовый формат Prometheus. Метки выводятся как label0, label1, ...
+        """
+        lines = []
+        for key, value in sorted(self.counters.items()):
+            lines.append(f"wanderwheel_{key[0]}_total{_labels(key[1:])} {value}")
+        for key, value in sorted(self.gauges.items()):
+            lines.append(f"wanderwheel_{key[0]}{_labels(key[1:])} {value}")
+        for key, hist in sorted(self.histograms.items()):
+            name = f"wanderwheel_{key[0]}_ms"
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS_MS, hist.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{name}_bucket{_labels(key[1:], le=le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(key[1:])} {hist.sum:.3f}")
+            lines.append(f"{name}_count{_labels(key[1:])} {hist.total}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(values, **extra) -> str:
+    pairs = [f'label{i}="{v}"' for i, v in enumerate(values)]
+    pairs += [f'{k}="{v}"' for k, v in extra.items()]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+METRICS = Metrics()
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Замеряет полное время обработки апдейта диспетчером.
+    """
+
+    async def on_pre_process_update(self, update, data: dict):
+        data["_metrics_start"] = time.perf_counter()
+
+    async def on_post_process_update(self, update, result, data: dict):
+        start = data.get("_metrics_start")
+        if start is not None:
+            METRICS.observe("handler_latency", (time.perf_counter() - start) * 1000)
+
+
+class MeteredBot(Bot):
+    """
+    Bot, замеряющий задержку каждого вызова Telegram API по имени метода.
+    """
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        finally:
+            METRICS.observe("telegram_send", (time.perf_counter() - start) * 1000, method)
+
+
+async def report_loop(interval: float):
+    """
+    Фоновая задача: раз в interval секунд пишет в лог строку-сводку.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        logging.info(f"METRICS {METRICS.summary()}")
+
+
+async def metrics_handler(request):
+    return web.Response(text=METRICS.render_text(), content_type="text/plain")
+
+
+async def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """
+    Поднимает локальный HTTP-сервер с /metrics рядом с ботом.
+    """
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Metrics endpoint: http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,148 @@
+"""
+object_index.py
+
+Граф "объект (достопримечательность) <-> карточки".
+
+- Объекты читаются из objects_<язык>.json (сейчас objects_ru.json): id, название,
+  описание, GPS, теги и список id карточек.
+- Индекс строится один раз вместе с индексом карточек и отвечает в обе стороны:
+  объект -> карточки на нужном языке, карточка -> объекты.
+- Переводы одной карточки связаны общей основой id (SD-0285-CN / SD-0285-RU):
+  объект, в котором указана только -CN карточка, найдётся и по -RU версии,
+  а пользователь с языком ru получит -RU карточку, если она есть в каталоге.
+- Без has_card (каталог по шардам) переводы связываются по суффиксу id без
+  проверки: так граф строится, не читая шарды, а есть ли карточка, проверяет
+  тот, кто её достаёт (CardIndex.loaded_card).
+"""
+
+import logging
+import json
+from pathlib import Path
+
+from localization import LANG_OPTIONS
+
+OBJECTS_DIR = Path(__file__).parent
+OBJECTS_GLOB = "objects_*.json"
+
+# Суффикс языка в id карточки: SD-0140-RU -> ("SD-0140", "ru")
+LANG_SUFFIXES = {f"-{lang.upper()}": lang for lang in LANG_OPTIONS}
+
+
+def card_base(card_id: str) -> (str, str):
+    """
+    (основа id, язык) для id с языковым суффиксом, иначе (card_id, None).
+    """
+    head, sep, tail = card_id.rpartition("-")
+    lang = LANG_SUFFIXES.get(f"-{tail.upper()}") if sep else None
+    return (head, lang) if lang else (card_id, None)
+
+
+def object_files(directory: Path = OBJECTS_DIR) -> list:
+    return sorted(Path(directory).glob(OBJECTS_GLOB))
+
+
+def load_objects(directory: Path = OBJECTS_DIR) -> dict:
+    """
+    {язык: [объекты]} из objects_<язык>.json. Битый файл пропускается с ошибкой в логе.
+    """
+    result = {}
+    for path in object_files(directory):
+        lang = path.stem.split("_", 1)[1].lower()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, list):
+                raise ValueError("ожидается массив объектов")
+        except Exception as e:
+            logging.error(f"Ошибка чтения {path.name}: {e}")
+            continue
+        result[lang] = [obj for obj in data if isinstance(obj, dict) and obj.get("object_id")]
+    return result
+
+
+class PlaceObject:
+    """
+    Объект: названия и описания по языкам (с подстановкой любого доступного), GPS, теги.
+    """
+
+    __slots__ = ("object_id", "names", "descriptions", "gps", "tags")
+
+    def __init__(self, object_id: str):
+        self.object_id = object_id
+        self.names = {}
+        self.descriptions = {}
+        self.gps = None
+        self.tags = ()
+
+    def _localized(self, values: dict, lang: str) -> str:
+        if lang in values:
+            return values[lang]
+        return next(iter(values.values()), "")
+
+    def name(self, lang: str) -> str:
+        return self._localized(self.names, lang) or self.object_id
+
+    def description(self, lang: str) -> str:
+        return self._localized(self.descriptions, lang)
+
+
+class ObjectIndex:
+    """
+    Неизменяемый индекс объектов. has_card(card_id) -> bool — есть ли карточка
+    в каталоге; None — связывать все переводы, не проверяя.
+    """
+
+    def __init__(self, objects_by_lang: dict, has_card=None):
+        self.objects = {}
+        self.cards = {}    # object_id -> {язык: (id карточек, ...)}
+        self.by_card = {}  # card_id -> (object_id, ...)
+        linked = {}
+        for lang, objects in objects_by_lang.items():
+            for data in objects:
+                obj = self.objects.get(data["object_id"])
+                if obj is None:
+                    obj = self.objects[data["object_id"]] = PlaceObject(data["object_id"])
+                if data.get("name"):
+                    obj.names[lang] = data["name"]
+                if data.get("description"):
+                    obj.descriptions[lang] = data["description"]
+                gps = data.get("gps")
+                if obj.gps is None and isinstance(gps, dict) and "latitude" in gps and "longitude" in gps:
+                    obj.gps = (gps["latitude"], gps["longitude"])
+                if data.get("tags"):
+                    obj.tags = tuple(dict.fromkeys(obj.tags + tuple(data["tags"])))
+                ids = linked.setdefault(obj.object_id, {})
+                for card_id in data.get("cards", ()):
+                    ids[card_id] = None
+
+        for object_id, listed in linked.items():
+            per_lang = {}
+            for card_id in listed:
+                base, card_lang = card_base(card_id)
+                # Сама карточка и её переводы, которые есть в каталоге
+                variants = [(card_id, card_lang)] if card_lang is None else [
+                    (f"{base}{suffix}", lang) for suffix, lang in LANG_SUFFIXES.items()
+                ]
+                for variant, lang in variants:
+                    if has_card is not None and not has_card(variant):
+                        continue
+                    per_lang.setdefault(lang, {})[variant] = None
+                    owners = self.by_card.setdefault(variant, [])
+                    if object_id not in owners:
+                        owners.append(object_id)
+            self.cards[object_id] = {lang: tuple(ids) for lang, ids in per_lang.items()}
+        self.by_card = {card_id: tuple(owners) for card_id, owners in self.by_card.items()}
+
+    def get(self, object_id: str):
+        return self.objects.get(object_id)
+
+    def objects_for_card(self, card_id: str) -> tuple:
+        return self.by_card.get(card_id, ())
+
+    def cards_for_object(self, object_id: str, lang: str) -> tuple:
+        """
+        id карточек объекта на языке lang (карточки без языкового суффикса — на любом).
+        Без has_card среди них могут быть переводы, которых нет в каталоге.
+        """
+        per_lang = self.cards.get(object_id, {})
+        return per_lang.get(lang, ()) + per_lang.get(None, ())
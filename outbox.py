@@ -0,0 +1,263 @@
+"""
+outbox.py
+
+Очередь исходящих сообщений в Telegram.
+
+- Обработчик ставит сообщение в очередь и не ждёт отправки.
+- Порядок сообщений внутри чата сохраняется: чат обслуживает один воркер за раз.
+- Ограничения скорости: token bucket на чат и общий token bucket на бота.
+- RetryAfter от Telegram приостанавливает все отправки на указанное время,
+  сообщение отправляется повторно.
+- Сообщение-продолжение (follow_up=True: подсказка "Нажмите Go!..." с клавиатурой)
+  дописывается к предыдущему сообщению чата, если то ещё ждёт отправки.
+- Фото (send_photo) идут той же очередью; файл по пути (Path) открывается только
+  при отправке, так что ожидающие фото не держат открытых файлов.
+- Глубина очереди — в метрике outbox_depth.
+"""
+
+import logging
+import asyncio
+from collections import deque
+from pathlib import Path
+
+from aiogram import types
+from aiogram.utils.exceptions import RetryAfter
+
+from markdown_text import escape_markdown
+from metrics import METRICS
+
+# Предел длины текста сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+# Параметры, с которыми сообщение можно дописать к предыдущему
+_MERGEABLE_KEYS = {"text", "parse_mode", "reply_markup", "disable_web_page_preview"}
+
+
+class TokenBucket:
+    """
+    rate токенов в секунду, не больше capacity накопленных.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        """
+        Забирает токен и возвращает 0, либо возвращает, сколько секунд ждать токена.
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Outgoing:
+    __slots__ = ("method", "kwargs", "futures", "raises")
+
+    def __init__(self, method: str, kwargs: dict, future: asyncio.Future, raises: bool = False):
+        self.method = method
+        self.kwargs = kwargs
+        self.futures = [future]
+        self.raises = raises  # при ошибке future получает исключение, а не None
+
+
+def _merge(prev: _Outgoing, kwargs: dict) -> bool:
+    """
+    Дописывает сообщение kwargs к ещё не отправленному prev, если это возможно.
+    """
+    if prev.method != "send_message" or prev.kwargs.get("reply_markup") is not None \
+            or not set(kwargs) <= _MERGEABLE_KEYS:
+        return False
+    prev_mode = prev.kwargs.get("parse_mode")
+    mode = kwargs.get("parse_mode")
+    text = kwargs["text"]
+    if mode is None and prev_mode == "Markdown":
+        text = escape_markdown(text)
+    elif mode != prev_mode:
+        return False
+    merged = f"{prev.kwargs['text']}\n\n{text}"
+    if len(merged) > MAX_MESSAGE_LENGTH:
+        return False
+    prev.kwargs["text"] = merged
+    if kwargs.get("reply_markup") is not None:
+        prev.kwargs["reply_markup"] = kwargs["reply_markup"]
+    return True
+
+
+class Outbox:
+    """
+    Очередь исходящих сообщений с ограничением скорости (rate=0 — без ограничения).
+    """
+
+    def __init__(self, bot, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 workers: int = 8):
+        self.bot = bot
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.worker_count = workers
+        self.global_bucket = None
+        self.chat_buckets = {}
+        self.queues = {}  # chat_id -> deque[_Outgoing]
+        self.scheduled = set()  # чаты, стоящие в ready, в обработке или в отложенном возврате
+        self.ready = None
+        self.idle = None
+        self.workers = []
+        self.depth = 0
+        self.blocked_until = 0.0
+
+    def _ensure_started(self):
+        if self.workers:
+            return
+        loop = asyncio.get_event_loop()
+        self.ready = asyncio.Queue()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        if self.global_rate > 0:
+            self.global_bucket = TokenBucket(self.global_rate, self.global_rate, loop.time())
+        self.workers = [asyncio.ensure_future(self._worker()) for _ in range(self.worker_count)]
+        if self.chat_rate > 0:
+            self.workers.append(asyncio.ensure_future(self._sweep_buckets()))
+
+    def _set_depth(self, delta: int):
+        self.depth += delta
+        METRICS.set_gauge("outbox_depth", self.depth)
+        if self.depth:
+            self.idle.clear()
+        else:
+            self.idle.set()
+
+    def send_message(self, chat_id: int, text: str, follow_up: bool = False, **kwargs) -> asyncio.Future:
+        """
+        Ставит сообщение в очередь. Возвращает future с отправленным Message
+        (None, если отправить не удалось); ждать его не обязательно.
+        follow_up=True разрешает дописать сообщение к предыдущему неотправленному.
+        """
+        kwargs["text"] = text
+        return self._enqueue(chat_id, "send_message", kwargs, follow_up)
+
+    def send_photo(self, chat_id: int, photo, **kwargs) -> asyncio.Future:
+        """
+        Ставит фото в очередь: photo — file_id или Path файла для загрузки.
+        Future — отправленный Message; если отправить не удалось — исключение
+        Telegram (по нему видно, отверг ли Telegram file_id), его нужно забрать.
+        """
+        kwargs["photo"] = photo
+        return self._enqueue(chat_id, "send_photo", kwargs, False, raises=True)
+
+    def _enqueue(self, chat_id: int, method: str, kwargs: dict, follow_up: bool,
+                 raises: bool = False) -> asyncio.Future:
+        self._ensure_started()
+        future = asyncio.get_event_loop().create_future()
+        queue = self.queues.get(chat_id)
+        if queue is None:
+            queue = self.queues[chat_id] = deque()
+        if follow_up and queue and _merge(queue[-1], kwargs):
+            queue[-1].futures.append(future)
+            METRICS.inc("outbox_merged")
+            return future
+        queue.append(_Outgoing(method, kwargs, future, raises))
+        self._set_depth(1)
+        if chat_id not in self.scheduled:
+            self.scheduled.add(chat_id)
+            self.ready.put_nowait(chat_id)
+        return future
+
+    def _requeue_later(self, chat_id: int, delay: float):
+        asyncio.get_event_loop().call_later(delay, self.ready.put_nowait, chat_id)
+
+    async def _worker(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            chat_id = await self.ready.get()
+            queue = self.queues.get(chat_id)
+            if not queue:
+                self.queues.pop(chat_id, None)
+                self.scheduled.discard(chat_id)
+                continue
+            now = loop.time()
+            if self.blocked_until > now:
+                self._requeue_later(chat_id, self.blocked_until - now)
+                continue
+            if self.chat_rate > 0:
+                bucket = self.chat_buckets.get(chat_id)
+                if bucket is None:
+                    bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+                wait = bucket.reserve(now)
+                if wait > 0:
+                    # Чат ждёт свой токен, не занимая воркер
+                    self._requeue_later(chat_id, wait)
+                    continue
+            if self.global_bucket is not None:
+                wait = self.global_bucket.reserve(loop.time())
+                while wait > 0:
+                    await asyncio.sleep(wait)
+                    wait = self.global_bucket.reserve(loop.time())
+
+            item = queue.popleft()
+            result = None
+            error = None
+            try:
+                kwargs = item.kwargs
+                if isinstance(kwargs.get("photo"), Path):
+                    kwargs = dict(kwargs, photo=types.InputFile(kwargs["photo"]))
+                result = await getattr(self.bot, item.method)(chat_id, **kwargs)
+                METRICS.inc("outbox_sent")
+            except RetryAfter as e:
+                queue.appendleft(item)
+                self.blocked_until = loop.time() + e.timeout
+                METRICS.inc("outbox_retry_after")
+                logging.warning(f"Telegram RetryAfter {e.timeout}s, отправки приостановлены")
+                self._requeue_later(chat_id, e.timeout)
+                continue
+            except Exception as e:
+                METRICS.inc("outbox_failed")
+                logging.error(f"Ошибка отправки в чат {chat_id}: {e!r}")
+                error = e
+            self._set_depth(-1)
+            for future in item.futures:
+                if future.done():
+                    continue
+                if error is not None and item.raises:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+            if queue:
+                # В конец очереди готовых: чаты обслуживаются по кругу
+                self.ready.put_nowait(chat_id)
+            else:
+                del self.queues[chat_id]
+                self.scheduled.discard(chat_id)
+
+    async def _sweep_buckets(self, interval: float = 60):
+        """
+        Удаляет бакеты простаивающих чатов: полный бакет ничем не отличается от нового.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(interval)
+            now = loop.time()
+            for chat_id in [c for c, b in self.chat_buckets.items() if c not in self.scheduled and b.full(now)]:
+                del self.chat_buckets[chat_id]
+
+    async def join(self):
+        """
+        Ждёт, пока очередь опустеет.
+        """
+        if self.idle is not None:
+            await self.idle.wait()
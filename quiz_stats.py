@@ -0,0 +1,84 @@
+"""
+quiz_stats.py
+
+Статистика ответов на квизы по карточкам.
+
+- Нажатие кнопки только увеличивает счётчик в памяти процесса:
+  (id карточки, вариант, верно ли) -> число ответов.
+- Накопленное пачкой прибавляется к таблице SQLite (WAL) раз в flush_interval
+  секунд в отдельном потоке; несколько воркеров пишут в один файл.
+"""
+
+import logging
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+QUIZ_STATS_DB_PATH = Path(__file__).parent / "data" / "quiz_stats.db"
+
+
+class QuizStats:
+    """
+    Счётчики ответов с отложенной записью в таблицу quiz_answers(card_id, option, correct, answers).
+    """
+
+    def __init__(self, path: Path = QUIZ_STATS_DB_PATH):
+        self.path = Path(path)
+        self.conn = None
+        self.pending = {}  # (card_id, option, correct) -> ответов с последнего сброса
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quiz-stats")
+
+    def record(self, card_id: str, option: int, correct: bool):
+        key = (card_id, option, correct)
+        self.pending[key] = self.pending.get(key, 0) + 1
+
+    def _connect(self):
+        if self.conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS quiz_answers (card_id TEXT NOT NULL, option INTEGER NOT NULL, "
+                "correct INTEGER NOT NULL, answers INTEGER NOT NULL, PRIMARY KEY (card_id, option, correct))"
+            )
+            self.conn.commit()
+        return self.conn
+
+    def _save(self, batch: dict):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO quiz_answers (card_id, option, correct, answers) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(card_id, option, correct) DO UPDATE SET answers = answers + excluded.answers",
+                [(card_id, option, int(correct), n) for (card_id, option, correct), n in batch.items()],
+            )
+
+    def _close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(self.executor, self._save, batch)
+        except Exception as e:
+            logging.error(f"Ошибка сохранения статистики квизов ({len(batch)} строк): {e}")
+            # Вернём несохранённое: ответы, пришедшие за время записи, складываются с ним
+            for key, n in batch.items():
+                self.pending[key] = self.pending.get(key, 0) + n
+
+    async def flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    async def close(self):
+        await self.flush()
+        await asyncio.get_event_loop().run_in_executor(self.executor, self._close)
+        self.executor.shutdown(wait=True)
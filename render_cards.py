@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+render_cards.py
+
+Сборка картинок фактов каталога (card_images.py) — шаг после импорта/слияния карточек.
+
+- Картинки рисуются в пуле процессов пачками; уже нарисованные (тот же хеш
+  содержимого) пропускаются, так что повторный запуск рисует только новые
+  и изменившиеся карточки.
+- --prune удаляет картинки карточек, которых больше нет в каталоге.
+
+Запуск: python render_cards.py [--cards data/cards.json] [--out data/card_images] [--workers N] [--force] [--prune]
+"""
+
+import argparse
+import sys
+
+from card_images import CARD_IMAGES_DIR, build_images
+from card_store import read_cards
+
+CARDS_MAIN = "data/cards.json"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Картинки фактов каталога для отправки ботом")
+    parser.add_argument("--cards", default=CARDS_MAIN, help="каталог cards.json")
+    parser.add_argument("--out", default=str(CARD_IMAGES_DIR), help="кеш картинок")
+    parser.add_argument("--workers", type=int, default=None, help="процессов рисования (по умолчанию — число CPU)")
+    parser.add_argument("--force", action="store_true", help="перерисовать и уже нарисованные")
+    parser.add_argument("--prune", action="store_true", help="удалить картинки карточек, которых нет в каталоге")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        stats = build_images(read_cards(args.cards), args.out, args.workers, args.force, args.prune)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(stats.summary())
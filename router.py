@@ -0,0 +1,55 @@
+"""
+router.py
+
+Таблица маршрутизации текстовых кнопок: нормализованный текст -> (обработчик, аргумент).
+
+Вместо цепочки lambda-фильтров, которые aiogram проверяет по очереди для
+каждого апдейта (и часть которых строит списки на каждое сообщение),
+диспетчер регистрирует один текстовый обработчик, а он делает один поиск в словаре.
+"""
+
+from localization import translations, LANG_OPTIONS, CITY_MAP
+from keyboards import START_BUTTON, GO_BUTTON, RETURN_BUTTON, NEAR_BUTTON
+
+
+def normalize(text: str) -> str:
+    return text.strip().lower()
+
+
+class TextRouter:
+    def __init__(self):
+        self.routes = {}
+
+    def add(self, text: str, handler, arg=None):
+        self.routes[normalize(text)] = (handler, arg)
+
+    def resolve(self, text: str):
+        """
+        (обработчик, аргумент) для текста сообщения или None.
+        """
+        if not text:
+            return None
+        return self.routes.get(normalize(text))
+
+
+def build_text_router(on_start, on_language, on_city, on_go, on_return,
+                      on_change_language, on_change_city, on_near=None) -> TextRouter:
+    """
+    Собирает таблицу из кнопок, LANG_OPTIONS, CITY_MAP и translations.
+    Аргумент для on_language — код языка, для on_city — ключ города.
+    """
+    router = TextRouter()
+    router.add(START_BUTTON, on_start)
+    router.add(GO_BUTTON, on_go)
+    router.add(RETURN_BUTTON, on_return)
+    for lang in LANG_OPTIONS:
+        router.add(lang, on_language, lang)
+    for city_name, city_key in CITY_MAP.items():
+        router.add(city_name, on_city, city_key)
+    for lang in LANG_OPTIONS:
+        router.add(translations[lang]["change_language"], on_change_language)
+        router.add(translations[lang]["change_city"], on_change_city)
+    if on_near is not None:
+        # Текст кнопки геопозиции приходит от клиентов, которые не умеют её отправлять
+        router.add(NEAR_BUTTON, on_near)
+    return router
@@ -0,0 +1,116 @@
+"""
+selection.py
+
+Взвешенный выбор карточки для вращения колеса.
+
+- Доли фактов и квизов, веса по reality (легенда/факт), по тегам, для новых
+  карточек и собственный boost карточки задаются в selection_config.json.
+- Вес карточки = reality * произведение весов её тегов * boost (* fresh_weight
+  для fresh_newest последних добавленных в корзину карточек, см. реестр номеров
+  в card_store). Нулевой вес исключает карточку.
+- По весам корзины строится таблица Уокера (alias method, вариант Воуза):
+  O(n) на построение один раз на индекс, O(1) на каждый выбор.
+- Корзина с одинаковыми весами таблицы не получает: для неё работает колода
+  без повторов (card_deck.py).
+"""
+
+import logging
+import json
+import random
+from array import array
+from pathlib import Path
+
+SELECTION_CONFIG_PATH = Path(__file__).parent / "selection_config.json"
+
+
+class AliasTable:
+    """
+    Выбор номера i из range(n) с вероятностью weights[i] / sum(weights) за O(1).
+    """
+
+    __slots__ = ("prob", "alias")
+
+    def __init__(self, weights):
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("нужен хотя бы один положительный вес")
+        scaled = [w * n / total for w in weights]
+        self.prob = array("d", [1.0]) * n
+        self.alias = array("I", range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Оставшиеся (в том числе из-за погрешности округления) выбираются всегда
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, rng=random) -> int:
+        i = int(rng.random() * len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+
+class SelectionConfig:
+    """
+    Настройки выбора из selection_config.json (отсутствующие поля — по умолчанию).
+    """
+
+    def __init__(self, data: dict = None):
+        data = data or {}
+        kinds = data.get("kinds", {})
+        fact, quiz = float(kinds.get("fact", 80)), float(kinds.get("quiz", 20))
+        if fact < 0 or quiz < 0 or fact + quiz <= 0:
+            raise ValueError("kinds: доли fact и quiz должны быть неотрицательны и не обе нулевые")
+        self.quiz_share = quiz / (fact + quiz)
+        self.reality = {k.lower(): float(v) for k, v in data.get("reality", {}).items()}
+        self.tags = {k.lower(): float(v) for k, v in data.get("tags", {}).items()}
+        freshness = data.get("freshness", {})
+        self.fresh_newest = int(freshness.get("newest", 0))
+        self.fresh_weight = float(freshness.get("weight", 1.0))
+        weights = list(self.reality.values()) + list(self.tags.values()) + [self.fresh_weight]
+        if any(w < 0 for w in weights):
+            raise ValueError("веса не могут быть отрицательными")
+
+    def weight(self, card: dict) -> float:
+        """
+        Вес карточки без поправки на новизну (нужны только reality, tags и boost).
+        """
+        w = self.reality.get(str(card.get("reality", "")).lower(), 1.0)
+        for tag in card.get("tags") or ():
+            w *= self.tags.get(str(tag).lower(), 1.0)
+        boost = card.get("boost", 1.0)
+        if type(boost) in (int, float) and boost >= 0:
+            w *= boost
+        return w
+
+
+def load_selection_config(path: Path = SELECTION_CONFIG_PATH) -> SelectionConfig:
+    """
+    Конфигурация из файла; если файла нет или он некорректен — значения по умолчанию.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return SelectionConfig(json.load(f))
+    except FileNotFoundError:
+        return SelectionConfig()
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        logging.error(f"Ошибка чтения {Path(path).name}, используем веса по умолчанию: {e}")
+        return SelectionConfig()
+
+
+def build_alias(weights: list):
+    """
+    AliasTable по весам карточек корзины или None, если веса одинаковы
+    (или все нулевые): тогда выбор равномерный.
+    """
+    if not weights or max(weights) <= 0 or min(weights) == max(weights):
+        return None
+    return AliasTable(weights)
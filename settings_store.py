@@ -0,0 +1,256 @@
+"""
+settings_store.py
+
+Хранилище пользовательских настроек (язык, город, счётчики сообщений).
+
+- Подключаемый бэкенд: SQLite в режиме WAL, Redis (общий для нескольких машин)
+  или память (для тестов и отладки).
+- Перед бэкендом — LRU-кеш компактных записей UserState (user_state.py);
+  записи, к которым не обращались дольше ttl секунд, вытесняются.
+- Запись отложенная (write-behind): изменённые записи копятся и пачкой
+  сбрасываются в фоне раз в flush_interval секунд. Весь дисковый ввод-вывод
+  выполняется в отдельном потоке и не блокирует цикл событий.
+"""
+
+import logging
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from user_state import UserState
+
+SETTINGS_DB_PATH = Path(__file__).parent / "data" / "settings.db"
+
+def default_record() -> UserState:
+    return UserState()
+
+
+class SettingsBackend:
+    """
+    Интерфейс бэкенда. Методы синхронные: SettingsStore вызывает их в своём потоке.
+    """
+
+    def load(self, user_id: int):
+        """
+        Сериализованная запись пользователя (str) или None.
+        """
+        raise NotImplementedError
+
+    def save_many(self, items: dict):
+        """
+        Сохраняет пачку {user_id: сериализованная запись}.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemorySettingsBackend(SettingsBackend):
+    """
+    Бэкенд в памяти процесса: ничего не переживает перезапуск.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def load(self, user_id: int):
+        return self.data.get(user_id)
+
+    def save_many(self, items: dict):
+        self.data.update(items)
+
+
+class SQLiteSettingsBackend(SettingsBackend):
+    """
+    SQLite в режиме WAL: одна таблица users(user_id, data JSON).
+    Файл можно разделять между несколькими процессами бота на одной машине.
+    Соединение открывается при первом обращении — уже в процессе-воркере.
+    """
+
+    def __init__(self, path: Path = SETTINGS_DB_PATH):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL)"
+            )
+            self.conn.commit()
+        return self.conn
+
+    def load(self, user_id: int):
+        with self.lock:
+            row = self._connect().execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def save_many(self, items: dict):
+        with self.lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO users (user_id, data) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                    list(items.items()),
+                )
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+class RedisSettingsBackend(SettingsBackend):
+    """
+    Redis (или совместимое хранилище): ключ ww:user:<id> -> JSON записи.
+    Требует пакет redis (pip install redis).
+    """
+
+    KEY_PREFIX = "ww:user:"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("Для SETTINGS_BACKEND=redis установите пакет redis (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+
+    def load(self, user_id: int):
+        raw = self.client.get(f"{self.KEY_PREFIX}{user_id}")
+        return raw.decode("utf-8") if raw is not None else None
+
+    def save_many(self, items: dict):
+        pipe = self.client.pipeline(transaction=False)
+        for user_id, data in items.items():
+            pipe.set(f"{self.KEY_PREFIX}{user_id}", data)
+        pipe.execute()
+
+    def close(self):
+        self.client.close()
+
+
+def create_backend(kind: str, path: Path = SETTINGS_DB_PATH, url: str = "") -> SettingsBackend:
+    if kind == "memory":
+        return MemorySettingsBackend()
+    if kind == "sqlite":
+        return SQLiteSettingsBackend(path)
+    if kind == "redis":
+        return RedisSettingsBackend(url or "redis://localhost:6379/0")
+    raise ValueError(f"Неизвестный бэкенд настроек: {kind}")
+
+
+class SettingsStore:
+    """
+    LRU-кеш записей + отложенная пачечная запись в бэкенд.
+
+    Запись — UserState. Обработчик меняет её на месте и вызывает mark_dirty(user_id, запись).
+    ttl — через сколько секунд без обращений запись покидает кеш (0 — только по размеру).
+    """
+
+    def __init__(self, backend: SettingsBackend, cache_size: int = 10000, ttl: float = 0):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.cache = OrderedDict()
+        self.pending = {}  # user_id -> запись, ждущая сброса в бэкенд
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="settings")
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def get(self, user_id: int, create: bool = True):
+        """
+        Запись пользователя. Для неизвестного пользователя — запись по умолчанию
+        (или None при create=False).
+        """
+        now = time.monotonic()
+        record = self.cache.get(user_id)
+        if record is not None:
+            self.cache.move_to_end(user_id)
+            record.last_seen = now
+            return record
+        record = self.pending.get(user_id)
+        if record is None:
+            raw = await self._run(self.backend.load, user_id)
+            # Пока ждали поток, запись мог загрузить параллельный обработчик
+            record = self.cache.get(user_id)
+            if record is not None:
+                return record
+            if raw is not None:
+                record = UserState.from_json(raw)
+            elif create:
+                record = default_record()
+                self.pending[user_id] = record
+            else:
+                return None
+        record.last_seen = now
+        self.cache[user_id] = record
+        if len(self.cache) > self.cache_size:
+            # Вытесненная запись, если она изменена, остаётся в pending до сброса
+            self.cache.popitem(last=False)
+        return record
+
+    def mark_dirty(self, user_id: int, record: UserState):
+        """
+        Запись изменена и ждёт сброса. Берётся переданная запись, а не кеш:
+        пока обработчик ждал (await), её могли вытеснить из кеша.
+        """
+        self.pending[user_id] = record
+
+    def evict_idle(self, now: float = None) -> int:
+        """
+        Убирает из кеша записи старше ttl. Кеш упорядочен по последнему обращению,
+        поэтому просматривается только его начало. Возвращает число вытесненных.
+        """
+        if self.ttl <= 0:
+            return 0
+        deadline = (time.monotonic() if now is None else now) - self.ttl
+        evicted = 0
+        while self.cache:
+            user_id, record = next(iter(self.cache.items()))
+            if record.last_seen > deadline:
+                break
+            # Изменённая запись остаётся в pending до ближайшего сброса
+            del self.cache[user_id]
+            evicted += 1
+        return evicted
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        payload = {uid: rec.to_json() for uid, rec in batch.items()}
+        try:
+            await self._run(self.backend.save_many, payload)
+        except Exception as e:
+            logging.error(f"Ошибка сохранения настроек ({len(payload)} записей): {e}")
+            # Вернём несохранённое, не затирая более свежие изменения
+            for uid, rec in batch.items():
+                self.pending.setdefault(uid, rec)
+
+    async def flush_loop(self, interval: float):
+        """
+        Фоновая задача: раз в interval секунд сбрасывает изменённые записи
+        и вытесняет простаивающие.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+            self.evict_idle()
+
+    async def close(self):
+        await self.flush()
+        await self._run(self.backend.close)
+        self.executor.shutdown(wait=True)
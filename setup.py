@@ -3,7 +3,7 @@ from setuptools import setup, find_packages
 setup(
     name='wanderwheel-bot',
     version='1.0.0',
-    py_modules=['main'],
+    py_modules=['main', 'card_store', 'card_deck', 'card_shards', 'card_search', 'card_inline', 'card_images', 'selection', 'geo_index', 'object_index', 'card_render', 'keyboards', 'router', 'outbox', 'metrics', 'settings_store', 'quiz_stats', 'user_state', 'webhook_server', 'sharding', 'localization', 'markdown_text'],
     install_requires=[
         'aiogram==2.25.1'
     ],
@@ -0,0 +1,136 @@
+"""
+sharding.py
+
+Несколько процессов-воркеров на один токен бота.
+
+- Процесс-фронт забирает апдейты long polling'ом (getUpdates допускает
+  только одного потребителя на токен) и раскладывает их по воркерам
+  по user_id % BOT_WORKERS.
+- Все апдейты пользователя попадают в один и тот же воркер, поэтому его
+  LRU-кеш настроек остаётся согласованным, а общий бэкенд (SQLite-файл
+  или Redis) видят все воркеры.
+- Воркеры порождаются fork'ом до запуска цикла событий во фронте и
+  наследуют уже построенные индекс карточек, клавиатуры и диспетчер.
+"""
+
+import logging
+import asyncio
+import multiprocessing
+import signal
+
+from aiogram import Bot, Dispatcher, types
+
+# Номер текущего воркера (0 во фронте и в однопроцессном режиме)
+SHARD_INDEX = 0
+
+# Максимум апдейтов в очереди к одному воркеру
+QUEUE_SIZE = 10000
+
+# Маркер остановки воркера
+_STOP = None
+
+
+def update_user_id(update: types.Update) -> int:
+    """
+    id пользователя, к которому относится апдейт (0, если не определить).
+    """
+    for event in (update.message, update.edited_message, update.callback_query,
+                  update.inline_query, update.chosen_inline_result):
+        if event is not None and event.from_user is not None:
+            return event.from_user.id
+    return 0
+
+
+def shard_for(update: types.Update, workers: int) -> int:
+    return update_user_id(update) % workers
+
+
+async def _consume(dispatcher: Dispatcher, queue, on_startup, on_shutdown):
+    loop = asyncio.get_event_loop()
+    Bot.set_current(dispatcher.bot)
+    Dispatcher.set_current(dispatcher)
+    if on_startup is not None:
+        await on_startup(dispatcher)
+    pending = set()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, queue.get)
+            if data is _STOP:
+                break
+            task = asyncio.ensure_future(dispatcher.updates_handler.notify(types.Update(**data)))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+    finally:
+        if on_shutdown is not None:
+            await on_shutdown(dispatcher)
+        session = await dispatcher.bot.get_session()
+        await session.close()
+
+
+def _worker_process(dispatcher: Dispatcher, index: int, queue, on_startup, on_shutdown):
+    global SHARD_INDEX
+    SHARD_INDEX = index
+    # Ctrl+C обрабатывает фронт: он пошлёт воркерам маркер остановки
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    logging.info(f"Worker {index} started")
+    loop.run_until_complete(_consume(dispatcher, queue, on_startup, on_shutdown))
+    loop.close()
+
+
+async def _poll(bot: Bot, queues: list, timeout: int = 20):
+    await bot.delete_webhook(drop_pending_updates=True)
+    loop = asyncio.get_event_loop()
+    offset = None
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=timeout)
+            except Exception as e:
+                logging.error(f"Ошибка getUpdates: {e!r}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                queue = queues[shard_for(update, len(queues))]
+                # put блокируется, если воркер не успевает: фронт притормаживает опрос
+                await loop.run_in_executor(None, queue.put, update.to_python())
+    finally:
+        session = await bot.get_session()
+        await session.close()
+
+
+def run_sharded(dispatcher: Dispatcher, workers: int, on_startup=None, on_shutdown=None):
+    """
+    Запускает workers процессов-обработчиков и фронт с long polling (блокирующий вызов).
+    """
+    ctx = multiprocessing.get_context("fork")
+    queues = [ctx.Queue(maxsize=QUEUE_SIZE) for _ in range(workers)]
+    processes = [
+        ctx.Process(target=_worker_process, args=(dispatcher, i, queues[i], on_startup, on_shutdown),
+                    name=f"wanderwheel-worker-{i}")
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def _terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _terminate)
+    logging.info(f"Sharded mode: {workers} workers, polling in front process")
+    try:
+        asyncio.run(_poll(dispatcher.bot, queues))
+    except KeyboardInterrupt:
+        logging.info("Остановка фронта, ждём воркеры")
+    finally:
+        for queue in queues:
+            queue.put(_STOP)
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,127 @@
+"""
+user_state.py
+
+Компактная запись пользователя в памяти.
+
+- Язык и город хранятся малыми целыми кодами (индекс в LANG_CODES / CITY_CODES).
+- Счётчики стандартных сообщений упакованы в одно целое по COUNTER_BITS бит
+  на сообщение. Для правила "1 раз из 5" важен только остаток от деления
+  на COUNTER_PERIOD, поэтому хранится именно он.
+- Малые целые Python не создаёт заново, так что запись — это один объект
+  со __slots__ и время последнего обращения (для вытеснения по TTL).
+- Колоды без повторов (card_deck.py) — словарь {корзина: [ключ, формат, шаг, размер]},
+  создаётся только у тех, кто крутил колесо.
+- В бэкенд запись уходит JSON'ом прежнего вида
+  {"language", "city", "counters": {msg_key: n}} с необязательным "decks".
+"""
+
+import json
+
+from localization import LANG_OPTIONS, CITY_MAP
+
+# Коды языков и городов: позиция в кортеже
+LANG_CODES = tuple(LANG_OPTIONS)
+CITY_CODES = ("all",) + tuple(sorted(set(CITY_MAP.values()) - {"all"}))
+_LANG_INDEX = {lang: i for i, lang in enumerate(LANG_CODES)}
+_CITY_INDEX = {city: i for i, city in enumerate(CITY_CODES)}
+
+COUNTER_PERIOD = 5
+COUNTER_BITS = 3
+_COUNTER_MASK = (1 << COUNTER_BITS) - 1
+
+# Сообщения, для которых считаются показы (порядок задаёт позицию в упакованном счётчике)
+MESSAGE_KEYS = ("wheel_spinning", "go_or_return")
+_MESSAGE_SHIFT = {key: i * COUNTER_BITS for i, key in enumerate(MESSAGE_KEYS)}
+
+DEFAULT_LANG = _LANG_INDEX["ru"]
+DEFAULT_CITY = _CITY_INDEX["all"]
+
+
+class UserState:
+    """
+    Настройки и счётчики одного пользователя.
+    """
+
+    __slots__ = ("lang_code", "city_code", "counters", "last_seen", "decks")
+
+    def __init__(self, lang_code: int = DEFAULT_LANG, city_code: int = DEFAULT_CITY, counters: int = 0):
+        self.lang_code = lang_code
+        self.city_code = city_code
+        self.counters = counters
+        self.last_seen = 0.0
+        self.decks = None
+
+    @property
+    def language(self) -> str:
+        return LANG_CODES[self.lang_code]
+
+    @language.setter
+    def language(self, lang: str):
+        self.lang_code = _LANG_INDEX[lang]
+
+    @property
+    def city(self) -> str:
+        return CITY_CODES[self.city_code]
+
+    @city.setter
+    def city(self, city: str):
+        self.city_code = _CITY_INDEX[city]
+
+    def reset(self):
+        """
+        Язык и город по умолчанию (счётчики сохраняются).
+        """
+        self.lang_code = DEFAULT_LANG
+        self.city_code = DEFAULT_CITY
+
+    def counter(self, msg_key: str) -> int:
+        return (self.counters >> _MESSAGE_SHIFT[msg_key]) & _COUNTER_MASK
+
+    def bump(self, msg_key: str) -> int:
+        """
+        Увеличивает счётчик msg_key (по модулю COUNTER_PERIOD) и возвращает новое значение.
+        """
+        shift = _MESSAGE_SHIFT[msg_key]
+        value = (((self.counters >> shift) & _COUNTER_MASK) + 1) % COUNTER_PERIOD
+        self.counters = (self.counters & ~(_COUNTER_MASK << shift)) | (value << shift)
+        return value
+
+    def deck(self, bucket: str):
+        return self.decks.get(bucket) if self.decks else None
+
+    def set_deck(self, bucket: str, deck: list):
+        if self.decks is None:
+            self.decks = {}
+        self.decks[bucket] = deck
+
+    def to_json(self) -> str:
+        data = {
+            "language": self.language,
+            "city": self.city,
+            "counters": {key: self.counter(key) for key in MESSAGE_KEYS if self.counter(key)},
+        }
+        if self.decks:
+            data["decks"] = self.decks
+        return json.dumps(data, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "UserState":
+        """
+        Запись из JSON бэкенда. Неизвестные язык/город заменяются значениями
+        по умолчанию, неизвестные счётчики отбрасываются.
+        """
+        data = json.loads(raw)
+        state = cls(
+            _LANG_INDEX.get(data.get("language"), DEFAULT_LANG),
+            _CITY_INDEX.get(data.get("city"), DEFAULT_CITY),
+        )
+        for key, count in (data.get("counters") or {}).items():
+            if key in _MESSAGE_SHIFT:
+                shift = _MESSAGE_SHIFT[key]
+                state.counters |= (int(count) % COUNTER_PERIOD) << shift
+        for bucket, deck in (data.get("decks") or {}).items():
+            # Повреждённая колода отбрасывается: начнётся новый круг
+            if (isinstance(deck, list) and len(deck) == 4 and all(isinstance(v, int) for v in deck)
+                    and 0 <= deck[2] <= deck[3]):
+                state.set_deck(bucket, deck)
+        return state
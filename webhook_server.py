@@ -0,0 +1,96 @@
+"""
+webhook_server.py
+
+Режим webhook (aiohttp) как альтернатива long polling.
+
+- Telegram получает ответ "ok" сразу после разбора апдейта,
+  обработка выполняется в фоне задачей цикла событий.
+- Необязательный секрет (WEBHOOK_SECRET) проверяется по заголовку
+  X-Telegram-Bot-Api-Secret-Token.
+- При остановке апдейты, уже подтверждённые Telegram (200 OK), дообрабатываются
+  (не дольше SHUTDOWN_TIMEOUT секунд) до остальных обработчиков остановки.
+- Webhook не снимается при остановке: за балансировщиком работает
+  несколько экземпляров, и остановка одного не должна отключать остальные.
+"""
+
+import logging
+import asyncio
+
+from aiohttp import web
+from aiogram import Dispatcher
+from aiogram.dispatcher.webhook import WebhookRequestHandler
+from aiogram.utils.executor import Executor
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+WEBHOOK_SECRET_KEY = "WEBHOOK_SECRET"
+
+# Сколько секунд при остановке ждать обработки принятых апдейтов
+SHUTDOWN_TIMEOUT = 30
+
+# Ссылки на фоновые задачи обработки, чтобы их не собрал сборщик мусора
+_PENDING_UPDATES = set()
+
+
+def _update_done(task: asyncio.Task):
+    _PENDING_UPDATES.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"Ошибка обработки апдейта из webhook: {task.exception()!r}")
+
+
+async def drain_updates(dispatcher: Dispatcher, timeout: float = SHUTDOWN_TIMEOUT):
+    """
+    Дожидается фоновой обработки апдейтов: Telegram их уже не пришлёт повторно.
+    """
+    pending = list(_PENDING_UPDATES)
+    if not pending:
+        return
+    _, not_done = await asyncio.wait(pending, timeout=timeout)
+    if not_done:
+        logging.warning(f"Остановка: {len(not_done)} апдейтов из webhook не дообработаны за {timeout} с")
+        for task in not_done:
+            task.cancel()
+
+
+class FastWebhookRequestHandler(WebhookRequestHandler):
+    """
+    Обработчик webhook, который не ждёт завершения хендлеров:
+    апдейт ставится в цикл событий, а Telegram сразу получает 200 OK.
+    """
+
+    async def post(self):
+        secret = self.request.app.get(WEBHOOK_SECRET_KEY)
+        if secret and self.request.headers.get(SECRET_HEADER) != secret:
+            raise web.HTTPForbidden()
+        return await super().post()
+
+    async def process_update(self, update):
+        dispatcher = self.get_dispatcher()
+        task = asyncio.ensure_future(dispatcher.updates_handler.notify(update))
+        _PENDING_UPDATES.add(task)
+        task.add_done_callback(_update_done)
+        return None
+
+
+def start_webhook(dispatcher: Dispatcher, webhook_url: str, webhook_path: str, host: str, port: int,
+                  on_startup=None, on_shutdown=None, secret: str = None):
+    """
+    Регистрирует webhook в Telegram и запускает aiohttp-сервер (блокирующий вызов).
+    """
+    executor = Executor(dispatcher, skip_updates=False)
+
+    async def set_webhook(dp: Dispatcher):
+        await dp.bot.set_webhook(webhook_url, drop_pending_updates=True, secret_token=secret or None)
+        logging.info(f"Webhook установлен: {webhook_url}")
+
+    executor.on_startup(set_webhook, polling=False)
+    if on_startup is not None:
+        executor.on_startup(on_startup, polling=False)
+    # Сначала дообработка апдейтов: их ответы попадут в очередь, которую дождётся on_shutdown
+    executor.on_shutdown(drain_updates, polling=False)
+    if on_shutdown is not None:
+        executor.on_shutdown(on_shutdown, polling=False)
+
+    app = web.Application()
+    app[WEBHOOK_SECRET_KEY] = secret
+    executor.set_webhook(webhook_path, request_handler=FastWebhookRequestHandler, web_app=app)
+    executor.run_app(host=host, port=port)